@@ -0,0 +1,496 @@
+"""
+Vectorised backtest engine for decision scripts.
+
+InverterSimulator runs the whole user script once per row of
+meter_data_df.  Almost everything a script derives (hour, sunrise_hour,
+time_period, discounted forecasts, floors, forecast rankings) does not
+depend on the battery, so BatchFeatures computes it for every interval at
+once as NumPy columns.  The per-interval loop in run_backtest() only
+carries the battery SOC recurrence and asks the strategy for an action
+using scalar lookups into those columns.
+
+    features = BatchFeatures(meter_data_df, battery_capacity=101200)
+    bill, ret_df = run_backtest(features, V826Strategy())
+
+Strategies implement prepare(features) and decide(i, soc).  V826Strategy
+mirrors the priority cascade of ``script v8.26``; AlwaysAuto is the
+baseline used in the notebook.
+"""
+import numpy as np
+import pandas as pd
+
+from discounting import discount_matrix, factor_table
+from powston_helpers import build_load_table
+
+# Action codes used inside the loop
+AUTO = 'auto'
+IMPORT = 'import'
+EXPORT = 'export'
+CHARGE = 'charge'
+DISCHARGE = 'discharge'
+FULLSTOP = 'fullstop'
+CURTAIL = 'auto_api_curtail'
+
+# Time period codes (script v8.26 time_period)
+NIGHT = 0
+DAY = 1
+PEAK = 2
+
+# CONFIG of script v8.26 (only the keys the batch port reads)
+V826_CONFIG = {
+    "BATTERY_CAPACITY_KWH": 101.2,
+    "MAX_CHARGE_RATE_KW": 20.0,
+    "MAX_DISCHARGE_RATE_KW": 20.0,
+    "PERIOD_DURATION_HOURS": 0.0833,
+    "BATTERY_FULL_SOC": 98.0,
+    "EMERGENCY_FLOOR_SOC": 5.0,
+    "PEAK_START": 16,
+    "PEAK_END": 20,
+    "CHARGE_COMPLETE_HOUR": 15,
+    "MAX_AM_BUY_PRICE": 12.0,
+    "PRE_PEAK_MAX_BUY_PRICE": 12.0,
+    "ALWAYS_SELL_PRICE": 35.0,
+    "DRAIN_TO_ZERO_PRICE": 100.0,
+    "ULTRA_CHEAP_BUY_PRICE": 2.0,
+    "DESIRED_MARGIN": 5.0,
+    "FUTURE_FORECAST_HOURS": 8,
+    "BUY_UNCERTAINTY_DISCOUNT": 0.03,
+    "SELL_UNCERTAINTY_DISCOUNT": 0.07,
+    "SOLCAST_RAINY_THRESHOLD": 50.0,
+    "SOLCAST_SUNNY_THRESHOLD": 110.0,
+    "PURE_BASE_LOAD_KWH_PER_HOUR": 4.5,
+    "EXPORT_BUDGET_UTILIZATION": 0.8,
+    "ENABLE_PEAK_ARBITRAGE": True,
+    "ARBITRAGE_MIN_SELL_PRICE": 27.0,
+    "ARBITRAGE_MIN_SPREAD": 15.0,
+    "ARBITRAGE_MAX_BUYBACK": 14.4,
+    "ARBITRAGE_MIN_SURVIVAL_HOURS": 5.0,
+    "AC_BEDROOM_ZONES_KW": 3.0,
+    "AC_HOUSE_ZONES_KW": 2.0,
+    "AC_SETPOINTS": {
+        "day": {"bedrooms": 25, "house": 25},
+        "night": {"bedrooms": 21, "house": 27},
+    },
+}
+
+
+def forecast_matrix(values, periods):
+    """
+    Pack a column of forecast lists into an (n, periods) float matrix.
+
+    Missing entries are NaN; the second return value holds the number of
+    usable periods per row, i.e. len(forecast[:periods]).
+    """
+    n = len(values)
+    matrix = np.full((n, periods), np.nan)
+    lengths = np.zeros(n, dtype=int)
+    for i, row in enumerate(values):
+        if isinstance(row, (list, tuple, np.ndarray)) and len(row):
+            row = np.asarray(row[:periods], dtype=float)
+            matrix[i, :len(row)] = row
+            lengths[i] = len(row)
+    return matrix, lengths
+
+
+def column_or(df, names, default):
+    """Return the first of ``names`` present in ``df`` as floats, else ``default``."""
+    for name in names:
+        if name in df.columns:
+            return df[name].astype(float).fillna(default).to_numpy()
+    return np.full(len(df), float(default))
+
+
+def hours_of_day(index):
+    """Fractional local hour for every timestamp in ``index``."""
+    return index.hour.to_numpy() + index.minute.to_numpy() / 60.0
+
+
+class BatchFeatures:
+    """
+    Battery-independent script inputs for every interval of meter_data_df.
+
+    Required columns: buy_price, sell_price (c/kWh).  Optional columns:
+    buy_forecast and sell_forecast (30-minute lists), house_power and
+    solar_power (W), sunrise (datetime) or sunrise_hour (see
+    sun_times.add_sun_times), solar_surplus_deficit,
+    solar_estimate_remaining, pv_forecast_today, pv_forecast_tomorrow (kWh),
+    temperature_2m and global_tilted_irradiance_instant (hourly lists).
+    ``sunrise_hour`` may be passed instead of a sunrise column.
+    """
+
+    def __init__(self, meter_data_df, battery_capacity, charge_rate=10000,
+                 config=None, sunrise_hour=6.0, periods=None):
+        df = meter_data_df
+        self.df = df
+        self.n = len(df)
+        self.config = dict(V826_CONFIG)
+        if config:
+            self.config.update(config)
+        cfg = self.config
+        self.battery_capacity = float(battery_capacity)
+        self.charge_rate = float(charge_rate)
+        if periods is None:
+            periods = int(cfg["FUTURE_FORECAST_HOURS"]) * 2
+        self.periods = periods
+        if self.n > 1:
+            # Not asi8: its unit (ns, us, ...) depends on the index resolution
+            step = np.median(np.diff((df.index - df.index[0]).total_seconds())) / 3600.0
+            self.interval_hours = float(step) if step > 0 else 5 / 60.0
+        else:
+            self.interval_hours = 5 / 60.0
+
+        self.buy_price = df['buy_price'].astype(float).to_numpy()
+        self.sell_price = df['sell_price'].astype(float).to_numpy()
+        self.house_power = column_or(df, ('house_power', 'house_consumption'), 0.0)
+        self.solar_power = column_or(df, ('solar_power', 'ppv'), 0.0)
+
+        self.hour = hours_of_day(df.index)
+        if 'sunrise_hour' in df.columns:
+            self.sunrise_hour = df['sunrise_hour'].astype(float).to_numpy()
+        elif 'sunrise' in df.columns:
+            sunrise = pd.DatetimeIndex(df['sunrise'])
+            self.sunrise_hour = (sunrise.hour.to_numpy() + sunrise.minute.to_numpy() / 60.0
+                                 + sunrise.second.to_numpy() / 3600.0)
+        else:
+            self.sunrise_hour = np.full(self.n, float(sunrise_hour))
+
+        self.build_time_period()
+        self.build_forecasts()
+        self.build_solar()
+        self.build_floors()
+        self.build_rankings()
+
+    def build_time_period(self):
+        cfg = self.config
+        hour = self.hour
+        peak_start = float(cfg["PEAK_START"])
+        self.peak_end_actual = float(cfg["PEAK_END"]) + 1.0
+        self.is_night = (hour < self.sunrise_hour) | (hour >= 21)
+        self.time_period = np.where(self.is_night, NIGHT,
+                                    np.where(hour < peak_start, DAY, PEAK))
+        self.is_peak_hours = (hour >= 16) & (hour < 21)
+        self.in_peak_window = (hour >= peak_start) & (hour < self.peak_end_actual)
+
+    def build_forecasts(self):
+        cfg = self.config
+        df = self.df
+        empty = [[]] * self.n
+        buy = df['buy_forecast'] if 'buy_forecast' in df.columns else empty
+        sell = df['sell_forecast'] if 'sell_forecast' in df.columns else empty
+        self.buy_raw, self.buy_len = forecast_matrix(list(buy), self.periods)
+        self.sell_raw, self.sell_len = forecast_matrix(list(sell), self.periods)
+        # Per-period factors for 30-minute forecasts, compounded per hour
+        factors = factor_table(cfg, self.periods, step=0.5)
+        self.buy_disc = discount_matrix(self.buy_raw, factors['buy'])
+        self.sell_disc = discount_matrix(self.sell_raw, factors['sell'])
+        # Running min of buy_disc[:k + 1] and max of sell_disc[:k + 1] for
+        # every row (powston_helpers.prefix_extrema): any window starting at
+        # period 0 is then one column lookup.  NaN padding is skipped.
+        self.buy_prefix_min = np.fmin.accumulate(self.buy_disc, axis=1)
+        self.sell_prefix_max = np.fmax.accumulate(self.sell_disc, axis=1)
+        rows = np.arange(self.n)
+        self.sell_max = np.where(self.sell_len > 0, self.sell_prefix_max[rows, np.maximum(self.sell_len - 1, 0)],
+                                 -np.inf)
+
+    def build_solar(self):
+        df = self.df
+        hour = self.hour
+        self.pv_remaining = column_or(df, ('solar_estimate_remaining',), 0.0)
+        self.surplus = column_or(df, ('solar_surplus_deficit',), 0.0)
+        self.daytime_deficit = np.maximum(0.0, -self.surplus)
+
+        pv_today = column_or(df, ('pv_forecast_today',), 0.0)
+        pv_next = column_or(df, ('pv_forecast_tomorrow',), 0.0)
+        pv_solcast = np.where(hour < 14, pv_today, pv_next)
+        pv_solcast = np.where(pv_solcast > 0, pv_solcast, 0.0)
+
+        pv_tomorrow = np.zeros(self.n)
+        if 'global_tilted_irradiance_instant' in df.columns:
+            gti, gti_len = forecast_matrix(list(df['global_tilted_irradiance_instant']), 72)
+            prefix = np.concatenate([np.zeros((self.n, 1)), np.nancumsum(gti, axis=1)], axis=1)
+            start = 24 - hour.astype(int)
+            stop = np.minimum(start + 24, gti_len)
+            rows = np.arange(self.n)
+            has = start < gti_len
+            gti_sum = np.where(has, prefix[rows, np.minimum(stop, 72)] - prefix[rows, np.minimum(start, 72)], 0.0)
+            pv_tomorrow = np.where(has & (gti_sum != 0), gti_sum * 0.02, 0.0)
+        pv_tomorrow = np.where(pv_tomorrow == 0, 80.0, pv_tomorrow)
+        self.pv_tomorrow = np.where(pv_solcast > 0, pv_solcast, pv_tomorrow)
+
+        self.solar_start_hour = self.sunrise_hour + np.where(
+            self.pv_tomorrow > 100, 1.0, np.where(self.pv_tomorrow > 60, 2.0, 3.0))
+
+    def build_floors(self):
+        cfg = self.config
+        df = self.df
+        hour = self.hour
+        base = cfg["PURE_BASE_LOAD_KWH_PER_HOUR"]
+        battery_kwh = float(cfg["BATTERY_CAPACITY_KWH"])
+        full = cfg["BATTERY_FULL_SOC"]
+
+        hours = self.solar_start_hour - 21
+        hours = np.where(hours < 0, hours + 24, hours)
+        if 'temperature_2m' in df.columns:
+            temps, temp_len = forecast_matrix(list(df['temperature_2m']), 48)
+            steps = hours.astype(int) + 1
+            table = build_load_table(cfg)
+            kwh = np.asarray(table["kwh"])
+            overnight = np.zeros(self.n)
+            for k in range(int(steps.max()) if self.n else 0):
+                hour_of_day = (21 + k) % 24
+                # The forecast starts at midnight today, so 9 PM is column 21
+                column = min(21 + k, temps.shape[1] - 1)
+                temp = np.where(21 + k < temp_len, np.nan_to_num(temps[:, column]), 25.0)
+                bucket = np.clip(np.ceil(temp), table["low"], table["high"]).astype(int) - table["low"]
+                overnight += np.where(k < steps, kwh[hour_of_day, bucket], 0.0)
+            no_temp = temp_len == 0
+            overnight = np.where(no_temp, hours * (base + 2.0), overnight)
+        else:
+            overnight = hours * (base + 2.0)
+        self.overnight_kwh = overnight
+
+        safety_kwh = battery_kwh * 0.05
+        floor_at_9pm_kwh = overnight + safety_kwh
+        self.floor_at_9pm_soc = np.minimum(floor_at_9pm_kwh / battery_kwh * 100, full)
+
+        peak_floor = (floor_at_9pm_kwh + (21.0 - hour) * base * 1.5) / battery_kwh * 100
+        self.active_floor = np.where(self.in_peak_window & (21.0 - hour > 0),
+                                     np.minimum(peak_floor, full), self.floor_at_9pm_soc)
+
+        hours_to_solar = np.where(hour < self.solar_start_hour,
+                                  self.solar_start_hour - hour,
+                                  (24 - hour) + self.solar_start_hour)
+        minimal = cfg["EMERGENCY_FLOOR_SOC"] + hours_to_solar * base / battery_kwh * 100
+        self.overnight_minimal_target = np.where(self.is_night, minimal, self.active_floor)
+
+    def build_rankings(self):
+        cfg = self.config
+        buy = self.buy_price[:, None]
+        sell = self.sell_price[:, None]
+        # Forecast periods strictly cheaper / dearer than the current price
+        self.buy_cheaper = np.sum(self.buy_disc < buy, axis=1)
+        self.sell_dearer = np.sum(self.sell_disc > sell, axis=1)
+        self.sell_dearer_than_first = np.sum(self.sell_disc > self.sell_disc[:, :1], axis=1)
+        self.buy_first_is_min = (self.buy_len > 0) & ~np.any(self.buy_disc < self.buy_disc[:, :1], axis=1)
+        self.pre_peak_sell = self.sell_prefix_max[:, min(4, self.periods) - 1]
+
+        kwh_per_period = cfg["MAX_CHARGE_RATE_KW"] * cfg["PERIOD_DURATION_HOURS"]
+        needed = np.minimum((self.daytime_deficit / kwh_per_period + 1).astype(int), self.buy_len)
+        self.is_optimal_buy = ((self.buy_len > 0) & (self.daytime_deficit > 2)
+                               & (needed > 0) & (self.buy_cheaper < needed))
+
+
+class AlwaysAuto:
+    """Baseline strategy: leave the inverter on auto."""
+
+    def prepare(self, features):
+        pass
+
+    def decide(self, i, soc):
+        return AUTO
+
+
+class V826Strategy:
+    """
+    Batch port of the ``script v8.26`` priority cascade.
+
+    Priorities are checked from highest to lowest and the first one that
+    fires wins, which is what decisions.reason() resolves to.
+    """
+
+    def prepare(self, features):
+        f = features
+        cfg = f.config
+        self.f = f
+        self.cfg = cfg
+        self.battery_kwh = float(cfg["BATTERY_CAPACITY_KWH"])
+        self.full = float(cfg["BATTERY_FULL_SOC"])
+        self.emergency = float(cfg["EMERGENCY_FLOOR_SOC"])
+        self.discharge_per_period = cfg["MAX_DISCHARGE_RATE_KW"] * cfg["PERIOD_DURATION_HOURS"]
+        # Scalar access into Python lists is much faster than into ndarrays
+        for name in ('hour', 'buy_price', 'sell_price', 'time_period', 'is_night',
+                     'is_peak_hours', 'active_floor', 'floor_at_9pm_soc',
+                     'overnight_minimal_target', 'buy_len', 'sell_len',
+                     'buy_cheaper', 'sell_dearer', 'sell_dearer_than_first',
+                     'buy_first_is_min', 'sell_max', 'pre_peak_sell',
+                     'daytime_deficit', 'is_optimal_buy'):
+            setattr(self, name, getattr(f, name).tolist())
+        self.buy_prefix_min = f.buy_prefix_min.tolist()
+
+    def overnight_buy_ok(self, i, soc, buy, target):
+        """is_optimal_overnight_buy_with_urgency() of script v8.26."""
+        length = self.buy_len[i]
+        if not length:
+            return True
+        soc_deficit = target - soc
+        survival_hours = max(0, (soc - 5.0) / 100 * 101.2) / 5.0
+        reachable = min(max(1, int(survival_hours * 2)), length)
+        min_reachable = self.buy_prefix_min[i][reachable - 1]
+        if soc_deficit >= 15:
+            return buy <= min_reachable + (10.0 if survival_hours < 3 else 5.0)
+        if soc_deficit >= 10:
+            return buy <= min_reachable + (7.0 if survival_hours < 3 else 3.0)
+        if soc_deficit >= 5:
+            return buy <= min_reachable + 2.0
+        return self.buy_cheaper[i] < length // 3
+
+    def decide(self, i, soc):
+        cfg = self.cfg
+        buy = self.buy_price[i]
+        sell = self.sell_price[i]
+        hour = self.hour[i]
+        night = self.is_night[i]
+        floor = self.active_floor[i]
+        battery_kwh = self.battery_kwh
+
+        if sell >= 35:
+            return EXPORT
+        if buy < 0 and soc >= self.full:
+            return FULLSTOP
+        if soc >= self.full and self.time_period[i] != NIGHT:
+            return CURTAIL
+        if sell >= cfg["DRAIN_TO_ZERO_PRICE"] and soc > 10:
+            return EXPORT
+        if 5 <= hour < 12 and buy >= 85 and soc >= 58:
+            return EXPORT
+        if soc <= self.emergency:
+            return IMPORT
+        if night and soc < floor:
+            if self.overnight_buy_ok(i, soc, buy, self.overnight_minimal_target[i]):
+                return IMPORT
+        if night and sell > 5 and soc > floor and self.sell_len[i]:
+            available = (soc - floor) / 100 * battery_kwh
+            needed = min(int(available / self.discharge_per_period + 1), self.sell_len[i])
+            if needed > 0 and self.sell_dearer[i] < needed:
+                return EXPORT
+        if 16 <= hour < 21 and sell > 0:
+            action = self.peak(i, soc, sell, floor)
+            if action is not None:
+                return action
+        peak_hours = self.is_peak_hours[i]
+        if buy <= cfg["ULTRA_CHEAP_BUY_PRICE"] and soc < 95 and not peak_hours:
+            return IMPORT
+        if hour < 21 and self.buy_len[i] and not peak_hours and self.buy_first_is_min[i]:
+            consumption = (21 - hour) * (cfg["PURE_BASE_LOAD_KWH_PER_HOUR"] + 1.0)
+            deficit = (self.floor_at_9pm_soc[i] - soc) / 100 * battery_kwh + consumption
+            if deficit > 5:
+                return IMPORT
+        if 0 <= hour < cfg["CHARGE_COMPLETE_HOUR"] and self.daytime_deficit[i] > 2:
+            if buy <= cfg["MAX_AM_BUY_PRICE"]:
+                if self.is_optimal_buy[i]:
+                    return IMPORT
+                if 16 - hour <= 6 and soc < 80:
+                    return IMPORT
+        if cfg["CHARGE_COMPLETE_HOUR"] <= hour < cfg["PEAK_START"] and soc < 95:
+            if buy <= cfg["PRE_PEAK_MAX_BUY_PRICE"] and self.sell_len[i]:
+                if self.pre_peak_sell[i] - buy >= cfg["DESIRED_MARGIN"]:
+                    return IMPORT
+        return AUTO
+
+    def peak(self, i, soc, sell, floor):
+        """Priorities 64-61 of script v8.26."""
+        cfg = self.cfg
+        if soc > floor:
+            budget = max(0, (soc - floor) / 100 * self.battery_kwh) * cfg["EXPORT_BUDGET_UTILIZATION"]
+            should_export = False
+            best_price = 0
+            length = self.sell_len[i]
+            if budget >= 1 and length:
+                needed = min(int(budget / (cfg["MAX_DISCHARGE_RATE_KW"] * 0.5) + 1), length)
+                if needed > 0:
+                    should_export = self.sell_dearer_than_first[i] < needed
+                    best_price = self.sell_max[i]
+            forecast_best = sell if should_export else best_price
+            beats_forecast = sell >= forecast_best and sell > 15
+            if (should_export or beats_forecast) and sell > 10:
+                return EXPORT
+            if sell > 10 and not should_export:
+                return AUTO
+            return None
+        if not (cfg["ENABLE_PEAK_ARBITRAGE"] and sell >= cfg["ARBITRAGE_MIN_SELL_PRICE"]):
+            return AUTO
+        available = (soc - self.emergency) / 100 * self.battery_kwh
+        survival = available / (cfg["PURE_BASE_LOAD_KWH_PER_HOUR"] + 2.0)
+        if survival < cfg["ARBITRAGE_MIN_SURVIVAL_HOURS"]:
+            return AUTO
+        reachable = min(int(survival * 2), self.buy_len[i])
+        if reachable <= 0:
+            return AUTO
+        min_buyback = self.buy_prefix_min[i][reachable - 1]
+        if sell - min_buyback >= cfg["ARBITRAGE_MIN_SPREAD"] and min_buyback <= cfg["ARBITRAGE_MAX_BUYBACK"]:
+            return EXPORT
+        return AUTO
+
+
+def battery_step(action, charge_wh, house_w, solar_w, capacity_wh, rate_w, hours):
+    """
+    Apply one interval of ``action`` to the battery.
+
+    Returns (battery_w, grid_w) where battery_w > 0 charges the battery and
+    grid_w > 0 imports from the grid.  Solar is curtailed on fullstop.
+    """
+    room_w = (capacity_wh - charge_wh) / hours
+    stored_w = charge_wh / hours
+    net_w = solar_w - house_w
+    if action == IMPORT:
+        battery_w = min(rate_w, room_w)
+    elif action == EXPORT:
+        battery_w = -min(rate_w, stored_w)
+    elif action == CHARGE:
+        battery_w = min(rate_w, room_w, max(net_w, 0.0))
+    elif action == DISCHARGE:
+        battery_w = -min(rate_w, stored_w, max(-net_w, 0.0))
+    elif action == FULLSTOP:
+        return 0.0, house_w
+    elif net_w >= 0:
+        battery_w = min(rate_w, room_w, net_w)
+    else:
+        battery_w = -min(rate_w, stored_w, -net_w)
+    return battery_w, battery_w - net_w
+
+
+def run_backtest(features, strategy, initial_soc=50.0):
+    """
+    Run ``strategy`` over every interval of ``features``.
+
+    Returns (bill_cents, ret_df) where ret_df carries the action, battery
+    charge and SOC, grid power and cost of every interval.
+    """
+    f = features
+    strategy.prepare(f)
+    n = f.n
+    hours = f.interval_hours
+    capacity = f.battery_capacity
+    rate = f.charge_rate
+    house = f.house_power.tolist()
+    solar = f.solar_power.tolist()
+    buy = f.buy_price.tolist()
+    sell = f.sell_price.tolist()
+
+    actions = [AUTO] * n
+    soc_out = np.empty(n)
+    charge_out = np.empty(n)
+    grid_out = np.empty(n)
+    cost_out = np.empty(n)
+    charge = capacity * initial_soc / 100.0
+    decide = strategy.decide
+    for i in range(n):
+        soc = charge / capacity * 100.0
+        action = decide(i, soc)
+        battery_w, grid_w = battery_step(action, charge, house[i], solar[i], capacity, rate, hours)
+        charge = min(capacity, max(0.0, charge + battery_w * hours))
+        grid_kwh = grid_w * hours / 1000.0
+        actions[i] = action
+        soc_out[i] = soc
+        charge_out[i] = charge
+        grid_out[i] = grid_w
+        cost_out[i] = grid_kwh * (buy[i] if grid_kwh > 0 else sell[i])
+
+    ret_df = pd.DataFrame({
+        'action': actions,
+        'battery_soc': soc_out,
+        'battery_charge': charge_out,
+        'grid_power': grid_out,
+        'sim_cost': cost_out,
+    }, index=f.df.index)
+    return float(cost_out.sum()), ret_df
@@ -0,0 +1,436 @@
+"""
+Benchmark every script generation on the same meter data.
+
+Each script is replayed through the backtest battery model (run_backtest)
+over one meter_data_df, so bills are comparable between scripts and
+against the AlwaysAuto baseline.  For every script the suite records:
+
+- per-invocation latency percentiles (only the script call is timed),
+- total simulated bill, the difference to always-auto and the regret
+  against the perfect-foresight oracle (oracle.py), in total and per day,
+- action churn (how often the chosen action changes),
+- how many intervals raised instead of deciding.  A script that raised
+  fell back to auto for those intervals, so its row is marked failed and
+  carries no bill.
+
+Results are appended to a JSON-lines history file, one record per
+script and run, keyed by script digest and a fingerprint of the data, so
+a speed or dollar regression shows up against the previous run on the
+same data:
+
+    results = run_benchmark(meter_data_df, battery_capacity=10000, charge_rate=5000)
+    python benchmark.py --data meter_data.feather --days 21 --fail-on-regression
+
+Scripts read far more than the meter data carries, so every call starts
+from a recorded payload (tests/action_params2.json) and the replay
+overrides the time, prices, forecasts, power readings and battery state
+of each interval.  Missing forecast columns are filled with the actual
+half-hourly prices that follow (perfect foresight).  With a site location
+(``location=`` or ``--latitude``/``--longitude``) sunrise and sunset come
+from sun_times for each day; otherwise the data's own columns are used,
+or the base payload's sunrise clock time is repeated every day.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from backtest import AlwaysAuto, BatchFeatures, run_backtest
+from normalise import normalise_payload
+from oracle import OracleStrategy, daily_regret
+from script_runner import IntervalState, ScriptRunner, action_churn, latency_percentiles, params_from_payload
+from sun_times import add_sun_times
+from sweep import apply_overrides
+
+SCRIPTS = (
+    'script.py', 'script_v2', 'script_v3', 'script_v6.5.py', 'script7.7.py',
+    'script v7.14.1', 'script v8.4', 'script v8.26',
+    'nsw_script.py', 'vic_script.py', 'sa_script.py',
+)
+# Script configurations benchmarked next to the plain scripts:
+# {name: (filename, CONFIG overrides)}
+VARIANTS = {
+    'script v8.26 +planner': ('script v8.26', {'PLANNER_ENABLED': True}),
+}
+HISTORY = 'benchmark_history.jsonl'
+# Results a failed row (one where the script raised) does not report
+FAILED_COLUMNS = ('bill', 'vs_auto', 'oracle_bill', 'regret', 'regret_per_day', 'worst_day_regret')
+BASE_PAYLOAD = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'action_params2.json')
+
+# Inputs some scripts read that a recorded payload may lack
+REPLAY_DEFAULTS = {'site_statistics': {}}
+
+# History records are compared only when these agree
+MATCH_KEYS = ('script', 'data', 'battery_capacity', 'charge_rate')
+
+# Differences smaller than these are noise, not regressions
+LATENCY_FLOOR_MS = 0.05
+BILL_FLOOR_CENTS = 1.0
+
+
+def load_base_payload(path=BASE_PAYLOAD):
+    """The recorded payload every replayed call starts from."""
+    with open(path, 'r', encoding='UTF-8') as file:
+        payload = json.load(file)
+    params = dict(REPLAY_DEFAULTS)
+    params.update(params_from_payload(payload))
+    return params
+
+
+def perfect_forecasts(meter_data_df, periods=24):
+    """
+    Add buy_forecast / sell_forecast columns from the actual prices.
+
+    Each forecast is the mean price of the next ``periods`` half hours,
+    starting with the half hour the interval falls in.  Existing forecast
+    columns are kept.
+    """
+    df = meter_data_df
+    missing = [name for name in ('buy', 'sell') if name + '_forecast' not in df.columns]
+    if not missing:
+        return df
+    df = df.copy()
+    for name in missing:
+        half_hourly = df[name + '_price'].astype(float).resample('30min').mean().ffill()
+        values = half_hourly.to_numpy()
+        slots = half_hourly.index.get_indexer(df.index.floor('30min'))
+        padded = np.concatenate([values, np.full(periods, values[-1] if len(values) else 0.0)])
+        df[name + '_forecast'] = [np.round(padded[slot:slot + periods], 2).tolist() for slot in slots]
+    return df
+
+
+class ScriptStrategy:
+    """
+    Backtest strategy that runs a decision script for every interval.
+
+    ``overrides`` rewrites CONFIG keys or constants first (see
+    sweep.apply_overrides).  The base payload is validated once
+    (normalise.py) and ``repairs`` lists the fields that were fixed.
+    ``latencies`` holds the seconds each script call took; intervals
+    where the script raised fall back to auto and are counted in
+    ``errors``.  ``location`` (an astral LocationInfo) gives each day
+    its own sunrise and sunset (sun_times.add_sun_times).
+    """
+
+    def __init__(self, filename, base_payload=None, script_globals=None, overrides=None, location=None):
+        self.filename = filename
+        with open(filename, 'r', encoding='UTF-8') as file:
+            source = file.read()
+        if overrides:
+            source = apply_overrides(source, overrides)
+        if location is None:
+            self.runner = ScriptRunner(source, filename, script_globals)
+        else:
+            self.runner = ScriptRunner(source, filename, script_globals, location=location)
+        self.base, self.repairs = normalise_payload(load_base_payload() if base_payload is None else base_payload)
+        self.base = dict(self.base)
+        self.base.pop('interval_time', None)
+        self.latencies = []
+        self.errors = 0
+        self.last_error = None
+
+    def prepare(self, features):
+        f = features
+        df = f.df
+        self.features = f
+        sun = self.runner.sun_table
+        if sun is not None:
+            df = add_sun_times(df, sun.latitude, sun.longitude, sun.timezone)
+        times = [stamp.to_pydatetime() for stamp in df.index]
+        columns = {name: df[name].tolist() for name in (
+            'buy_price', 'sell_price', 'buy_forecast', 'sell_forecast', 'rrp', 'sunrise', 'sunset',
+            'temperature_2m', 'global_tilted_irradiance_instant', 'solar_estimate_remaining',
+            'solar_surplus_deficit', 'pv_forecast_today', 'pv_forecast_tomorrow') if name in df.columns}
+        for name in ('sunrise', 'sunset'):
+            if name not in columns and isinstance(self.base.get(name), datetime):
+                clock = self.base[name].timetz()
+                columns[name] = [datetime.combine(stamp.date(), clock) for stamp in times]
+        columns['interval_time'] = times
+        columns['house_power'] = f.house_power.tolist()
+        columns['solar_power'] = f.solar_power.tolist()
+
+        fixed = dict(self.runner.defaults)
+        fixed.update(self.base)
+        fixed['battery_capacity'] = f.battery_capacity
+        fixed['optimal_charging'] = f.charge_rate
+        fixed['optimal_discharging'] = f.charge_rate
+        fixed['inverters'] = dict(self.base.get('inverters', {}))
+        mqtt_data = self.base.get('mqtt_data', {})
+        fixed['mqtt_data'] = dict(mqtt_data, solar_estimate=dict(mqtt_data.get('solar_estimate', {})))
+        weather_data = self.base.get('weather_data', {})
+        fixed['weather_data'] = dict(weather_data, hourly=dict(weather_data.get('hourly', {})))
+        # Daily GTI sums the platform derives from the hourly forecast
+        if 'global_tilted_irradiance_instant' in columns:
+            gti = [values or [] for values in columns['global_tilted_irradiance_instant']]
+        else:
+            gti = [fixed['weather_data']['hourly'].get('global_tilted_irradiance_instant') or []]
+        # once per weather update, not per interval
+        daily = {}
+        for values in gti:
+            key = tuple(values)
+            if key not in daily:
+                daily[key] = {'gti_today': float(sum(values[:24])), 'gti_sum_tomorrow': float(sum(values[24:48]))}
+        for name in ('gti_today', 'gti_sum_tomorrow'):
+            if name not in fixed:
+                sums = [daily[tuple(values)][name] for values in gti]
+                if len(sums) == 1:
+                    fixed[name] = sums[0]
+                else:
+                    columns[name] = sums
+
+        paths = {'battery_soc': [('battery_soc',)] + [
+            ('inverters', key, 'battery_soc') for key, value in fixed['inverters'].items()
+            if isinstance(value, dict)]}
+        for name in ('temperature_2m', 'global_tilted_irradiance_instant'):
+            paths[name] = [('weather_data', 'hourly', name)]
+        for name in ('solar_estimate_remaining', 'solar_surplus_deficit', 'pv_forecast_today',
+                     'pv_forecast_tomorrow'):
+            paths[name] = [('mqtt_data', 'solar_estimate', name)]
+        self.state = IntervalState(fixed, columns, paths)
+        self.latencies = []
+        self.errors = 0
+
+    def params(self, i, soc):
+        """
+        Script variables for interval ``i`` at battery ``soc``.
+
+        The mapping is reused by the next call; copy it to keep it.
+        """
+        return self.state.load(i, battery_soc=soc, battery_charge=self.features.battery_capacity * soc / 100.0)
+
+    def decide(self, i, soc):
+        start = time.perf_counter()
+        try:
+            action = self.runner.decide_state(self.state, i, battery_soc=soc,
+                                              battery_charge=self.features.battery_capacity * soc / 100.0)[0]
+        except Exception as error:  # pylint: disable=broad-except
+            self.latencies.append(time.perf_counter() - start)
+            self.errors += 1
+            self.last_error = '%s: %s' % (type(error).__name__, error)
+            return 'auto'
+        self.latencies.append(time.perf_counter() - start)
+        return action
+
+
+def data_fingerprint(meter_data_df):
+    """Short hash of the interval times and prices, to match history rows."""
+    digest = hashlib.sha256()
+    index = meter_data_df.index
+    digest.update(str(index[0] if len(index) else '').encode('utf-8'))
+    digest.update(np.asarray((index - index[0]).total_seconds() if len(index) else []).tobytes())
+    for name in ('buy_price', 'sell_price'):
+        digest.update(meter_data_df[name].astype(float).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def git_commit():
+    """Short commit hash of the working tree, or None outside git."""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def benchmark_script(filename, features, auto_bill, base_payload=None, initial_soc=50.0, oracle_df=None,
+                     overrides=None, name=None, location=None):
+    """
+    Replay ``filename`` over ``features``; returns one result row.
+
+    With ``oracle_df`` (run_backtest of OracleStrategy on the same
+    features) the row also carries the regret against the oracle.  The
+    row is named ``name`` (default: the filename).  When the script
+    raised on any interval the bill would be partly AlwaysAuto's, so the
+    row is marked ``failed`` and its bill and regret are None.
+    """
+    strategy = ScriptStrategy(filename, base_payload, overrides=overrides, location=location)
+    bill, ret_df = run_backtest(features, strategy, initial_soc)
+    days = max(features.n * features.interval_hours / 24.0, 1e-9)
+    changes = action_churn(ret_df['action'])
+    row = {'script': name or filename, 'script_digest': strategy.runner.digest[:16]}
+    row.update(latency_percentiles(strategy.latencies))
+    row.update({
+        'bill': bill,
+        'auto_bill': auto_bill,
+        'vs_auto': bill - auto_bill,
+        'action_changes': changes,
+        'churn_per_day': changes / days,
+        'errors': strategy.errors,
+        'last_error': strategy.last_error,
+        'actions': {str(key): int(value) for key, value in ret_df['action'].value_counts().items()},
+    })
+    if oracle_df is not None:
+        regret = daily_regret(ret_df, oracle_df)['regret']
+        row['oracle_bill'] = float(oracle_df['sim_cost'].sum())
+        row['regret'] = bill - row['oracle_bill']
+        row['regret_per_day'] = float(regret.mean())
+        row['worst_day_regret'] = float(regret.max())
+    row['failed'] = strategy.errors > 0
+    if row['failed']:
+        for key in FAILED_COLUMNS:
+            if key in row:
+                row[key] = None
+    return row
+
+
+def load_history(path=HISTORY):
+    """Every record of the history file (oldest first)."""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='UTF-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def append_history(rows, path=HISTORY):
+    with open(path, 'a', encoding='UTF-8') as file:
+        for row in rows:
+            file.write(json.dumps(row, sort_keys=True) + '\n')
+
+
+def regressions(history, rows, latency_tolerance=0.25, bill_tolerance=0.0):
+    """
+    Compare ``rows`` with the latest earlier record of the same script on
+    the same data and battery.
+
+    Flags p95 latency growing by more than ``latency_tolerance`` (a share)
+    and bills growing by more than ``bill_tolerance`` cents.  Returns a list
+    of messages; empty when nothing regressed.  Failed rows are reported
+    as such and failed records are never the baseline.
+    """
+    messages = []
+    for row in rows:
+        if row.get('failed'):
+            messages.append('%s: failed (%s)' % (row['script'], row.get('last_error')))
+            continue
+        previous = [record for record in history if not record.get('failed')
+                    and all(record.get(key) == row.get(key) for key in MATCH_KEYS)]
+        if not previous:
+            continue
+        last = previous[-1]
+        slower = row['p95_ms'] - last['p95_ms']
+        if slower > LATENCY_FLOOR_MS and row['p95_ms'] > last['p95_ms'] * (1 + latency_tolerance):
+            messages.append('%s: p95 %.3f ms -> %.3f ms' % (row['script'], last['p95_ms'], row['p95_ms']))
+        dearer = row['bill'] - last['bill']
+        if dearer > max(bill_tolerance, BILL_FLOOR_CENTS):
+            messages.append('%s: bill $%.2f -> $%.2f' % (row['script'], last['bill'] / 100.0, row['bill'] / 100.0))
+    return messages
+
+
+def run_benchmark(meter_data_df, scripts=SCRIPTS, battery_capacity=10000, charge_rate=5000, base_payload=None,
+                  initial_soc=50.0, history=HISTORY, label=None, variants=None, location=None):
+    """
+    Benchmark ``scripts`` on ``meter_data_df`` and append to ``history``
+    (skipped when history is None).
+
+    ``variants`` ({name: (filename, overrides)}, default VARIANTS) are
+    run as well when their script is among ``scripts``.  ``location``
+    (an astral LocationInfo) supplies each day's sunrise and sunset.
+
+    Returns a DataFrame, one row per script, cheapest bill first and
+    failed scripts last.
+    """
+    df = perfect_forecasts(meter_data_df)
+    features = BatchFeatures(df, battery_capacity=battery_capacity, charge_rate=charge_rate)
+    auto_bill = run_backtest(features, AlwaysAuto(), initial_soc)[0]
+    oracle_df = run_backtest(features, OracleStrategy(), initial_soc)[1]
+    base = load_base_payload() if base_payload is None else base_payload
+    record = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'label': label,
+        'data': data_fingerprint(df),
+        'rows': len(df),
+        'battery_capacity': battery_capacity,
+        'charge_rate': charge_rate,
+        'start': df.index[0].isoformat() if len(df) else None,
+        'end': df.index[-1].isoformat() if len(df) else None,
+    }
+    rows = []
+    for filename in scripts:
+        row = dict(record)
+        row.update(benchmark_script(filename, features, auto_bill, base, initial_soc, oracle_df,
+                                    location=location))
+        rows.append(row)
+    for name, variant in (VARIANTS if variants is None else variants).items():
+        if variant[0] in scripts:
+            row = dict(record)
+            row.update(benchmark_script(variant[0], features, auto_bill, base, initial_soc, oracle_df,
+                                        variant[1], name, location))
+            rows.append(row)
+    if history:
+        append_history(rows, history)
+    results = pd.DataFrame(rows)
+    return results.sort_values('bill', kind='stable').reset_index(drop=True)
+
+
+def load_meter_data(path):
+    """Read a saved meter_data_df (feather, parquet, pickle, CSV or JSON)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.feather':
+        df = pd.read_feather(path)
+    elif extension == '.parquet':
+        df = pd.read_parquet(path)
+    elif extension in ('.pkl', '.pickle'):
+        df = pd.read_pickle(path)
+    elif extension == '.csv':
+        df = pd.read_csv(path)
+    else:
+        df = pd.read_json(path)
+    if 'interval_time' in df.columns:
+        df['interval_time'] = pd.to_datetime(df['interval_time'])
+        df = df.set_index('interval_time')
+    return df.sort_index()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark decision scripts on the same meter data')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--data', help='saved meter_data_df (.feather, .parquet, .pkl, .csv, .json)')
+    source.add_argument('--site', type=int, help='load cached /api/meter_data through MeterStore')
+    parser.add_argument('--start', help='first day (YYYY-MM-DD) with --site')
+    parser.add_argument('--end', help='last day (YYYY-MM-DD) with --site')
+    parser.add_argument('--days', type=int, help='keep only the last N days')
+    parser.add_argument('--scripts', nargs='+', default=list(SCRIPTS))
+    parser.add_argument('--battery-capacity', type=float, default=10000, help='Wh')
+    parser.add_argument('--charge-rate', type=float, default=5000, help='W')
+    parser.add_argument('--latitude', type=float, help='site latitude, for daily sunrise and sunset')
+    parser.add_argument('--longitude', type=float)
+    parser.add_argument('--timezone', default='Australia/Brisbane')
+    parser.add_argument('--history', default=HISTORY)
+    parser.add_argument('--label', help='free text stored with the history records')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.data:
+        df = load_meter_data(args.data)
+    else:
+        from meter_store import MeterStore
+        df = MeterStore().load(args.site, args.start, args.end)
+    if args.days:
+        df = df[df.index >= df.index[-1] - pd.Timedelta(days=args.days)]
+    location = None
+    if args.latitude is not None and args.longitude is not None:
+        from astral import LocationInfo
+        location = LocationInfo('site', '', args.timezone, args.latitude, args.longitude)
+    history = load_history(args.history)
+    results = run_benchmark(df, args.scripts, args.battery_capacity, args.charge_rate, history=args.history,
+                            label=args.label, location=location)
+    columns = ['script', 'p50_ms', 'p95_ms', 'p99_ms', 'bill', 'vs_auto', 'regret_per_day', 'action_changes',
+               'errors']
+    print(results[columns].to_string(index=False, float_format='%.2f'))
+    problems = regressions(history, results.to_dict('records'))
+    for problem in problems:
+        print('REGRESSION ' + problem)
+    return 1 if problems and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
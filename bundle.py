@@ -0,0 +1,261 @@
+"""
+Build a single upload file from a script that imports powston_helpers.
+
+The platform rejects imports, so until now every script carried pasted
+copies of its helpers, and the copies drifted.  A script can instead be
+written against the helper library:
+
+    from powston_helpers import combined_soc, in_window
+
+    soc = combined_soc(battery_soc, inverters, CONFIG["INVERTER_IDS"], mqtt_data, 2.5)["soc"]
+
+and bundled for upload:
+
+    python bundle.py my_script.py --output "my_script upload"
+
+The import is replaced by the helpers the script uses (and nothing else
+from the library), and the result is checked against the ai_prompt.txt
+rules.  ``--check`` reports the helpers, inlined or pasted by hand,
+that differ from the library copy of the same name, and for upload
+files bundled earlier ``--refresh`` replaces them with the library
+version.  Exits non-zero on any problem.
+"""
+import ast
+import io
+import os
+import sys
+import tokenize
+
+from mock_powston import check_source
+
+LIBRARY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'powston_helpers.py')
+
+MAX_LINE_LENGTH = 79
+
+MARKER = '# Inlined from %s.py by bundle.py'
+
+
+def library_functions(library=LIBRARY):
+    """{name: source} of the library's top-level functions, in file order."""
+    with open(library, 'r', encoding='UTF-8') as file:
+        source = file.read()
+    return {node.name: ast.get_source_segment(source, node)
+            for node in ast.parse(source, library).body if isinstance(node, ast.FunctionDef)}
+
+
+def _module_name(library):
+    return os.path.splitext(os.path.basename(library))[0]
+
+
+def _replace_lines(source, edits):
+    """Replace 1-based inclusive line ranges, given as (first, last, text)."""
+    lines = source.splitlines(keepends=True)
+    for first, last, text in sorted(edits, reverse=True):
+        lines[first - 1:last] = [text]
+    return ''.join(lines)
+
+
+def used_helpers(tree, helpers, requested):
+    """
+    The library helpers ``tree`` needs, in library order: the requested
+    names it references, plus whatever those helpers reference in turn.
+    """
+    names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    needed = set()
+    pending = [name for name in requested if name in names]
+    while pending:
+        name = pending.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        for node in ast.walk(ast.parse(helpers[name])):
+            if isinstance(node, ast.Name) and node.id in helpers and node.id not in needed:
+                pending.append(node.id)
+    return [name for name in helpers if name in needed]
+
+
+def bundle(source, library=LIBRARY):
+    """
+    Return ``source`` with its ``from powston_helpers import ...``
+    statements replaced by the helpers it uses.
+
+    ``import *`` brings in every helper the script references.  Raises
+    ValueError for a name the library does not define, for a helper the
+    script also defines itself, and for ``import powston_helpers``.
+    """
+    helpers = library_functions(library)
+    module = _module_name(library)
+    tree = ast.parse(source)
+    imports = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import) and any(alias.name == module for alias in node.names):
+            raise ValueError('Line %d: use "from %s import ..." so the helpers can be inlined'
+                             % (node.lineno, module))
+        if isinstance(node, ast.ImportFrom) and node.module == module:
+            if node not in tree.body:
+                raise ValueError('Line %d: import %s at the top level' % (node.lineno, module))
+            imports.append(node)
+    if not imports:
+        return source
+    requested = []
+    for node in imports:
+        for alias in node.names:
+            if alias.name == '*':
+                requested.extend(helpers)
+            elif alias.name not in helpers:
+                raise ValueError('Line %d: %s has no helper %s' % (node.lineno, module, alias.name))
+            elif alias.asname not in (None, alias.name):
+                raise ValueError('Line %d: helpers cannot be renamed (%s as %s)'
+                                 % (node.lineno, alias.name, alias.asname))
+            else:
+                requested.append(alias.name)
+    defined = {node.name for node in tree.body if isinstance(node, ast.FunctionDef)}
+    clash = sorted(defined & set(requested))
+    if clash:
+        raise ValueError('%s defined in the script and imported from %s' % (', '.join(clash), module))
+    inlined = '\n\n'.join(helpers[name] + '\n' for name in used_helpers(tree, helpers, requested))
+    edits = [(node.lineno, node.end_lineno, '') for node in imports[1:]]
+    if inlined:
+        inlined = '%s\n%s\n\n' % (MARKER % module, inlined)
+    edits.append((imports[0].lineno, imports[0].end_lineno, inlined))
+    return _replace_lines(source, edits)
+
+
+def drift(source, library=LIBRARY):
+    """
+    Names of the top-level functions of ``source`` that share a name with
+    a library helper but differ from it, whether bundle.py inlined them or
+    they were pasted by hand.
+    """
+    helpers = library_functions(library)
+    canonical = {name: ast.dump(ast.parse(text).body[0]) for name, text in helpers.items()}
+    return [node.name for node in ast.parse(source).body
+            if isinstance(node, ast.FunctionDef) and node.name in canonical
+            and ast.dump(node) != canonical[node.name]]
+
+
+def refresh(source, library=LIBRARY):
+    """
+    Replace the inlined helpers of ``source`` that drifted with the
+    library copy.  Returns the new source and the names replaced.
+
+    Only bundled files are refreshed: a hand-pasted copy may take other
+    arguments or return a plain value, so its callers would need changing.
+    """
+    if MARKER % _module_name(library) not in source:
+        return source, []
+    helpers = library_functions(library)
+    stale = set(drift(source, library))
+    edits = []
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.FunctionDef) and node.name in stale:
+            first = node.decorator_list[0].lineno if node.decorator_list else node.lineno
+            edits.append((first, node.end_lineno, helpers[node.name] + '\n'))
+    return _replace_lines(source, edits), sorted(stale)
+
+
+def _is_reason_call(node):
+    return (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'reason'
+            and isinstance(node.func.value, ast.Name) and node.func.value.id == 'decisions')
+
+
+def _unpacks(target):
+    return isinstance(target, (ast.Tuple, ast.List, ast.Starred))
+
+
+def problems(source, max_line_length=MAX_LINE_LENGTH):
+    """
+    Reasons ``source`` breaks the sandbox (mock_powston.check_source) or
+    the ai_prompt.txt rules, one 'Line N: ...' string each.
+
+    ``max_line_length`` of 0 or None skips the line length check.
+    """
+    problems_found = check_source(source)
+    if problems_found and 'SyntaxError' in problems_found[0]:
+        return problems_found
+    tree = ast.parse(source)
+    functions = {node.name for node in tree.body if isinstance(node, ast.FunctionDef)}
+    reason_calls = []
+    for node in ast.walk(tree):
+        line = getattr(node, 'lineno', 0)
+        if isinstance(node, ast.JoinedStr):
+            problems_found.append('Line %d: f-strings are not allowed.' % line)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'format':
+            problems_found.append('Line %d: .format() is not allowed.' % line)
+        elif isinstance(node, ast.Assign):
+            if len(node.targets) > 1:
+                problems_found.append('Line %d: one assignment per line.' % line)
+            if any(_unpacks(target) for target in node.targets):
+                problems_found.append('Line %d: tuple unpacking is not allowed.' % line)
+        elif isinstance(node, (ast.For, ast.comprehension)) and _unpacks(node.target):
+            problems_found.append('Line %d: tuple unpacking is not allowed.' % getattr(node.target, 'lineno', line))
+        elif isinstance(node, ast.FunctionDef):
+            for child in ast.walk(node):
+                if _is_reason_call(child):
+                    problems_found.append('Line %d: decisions.reason() is only allowed in main code.'
+                                          % child.lineno)
+                elif (isinstance(child, ast.Call) and isinstance(child.func, ast.Name)
+                      and child.func.id in functions):
+                    problems_found.append('Line %d: helper %s calls helper %s.'
+                                          % (child.lineno, node.name, child.func.id))
+        if _is_reason_call(node):
+            reason_calls.append(node)
+    if reason_calls and not any(keyword.arg == 'priority' and isinstance(keyword.value, ast.Constant)
+                                and keyword.value.value == 1
+                                for call in reason_calls for keyword in call.keywords):
+        problems_found.append('Line %d: no decisions.reason() with priority=1.' % max(call.lineno for call in reason_calls))
+    for token in tokenize.generate_tokens(io.StringIO(source).readline):
+        if token.type == tokenize.OP and token.string == ';':
+            problems_found.append('Line %d: one statement per line.' % token.start[0])
+    if max_line_length:
+        for number, text in enumerate(source.splitlines(), 1):
+            if len(text) > max_line_length:
+                problems_found.append('Line %d: line too long (%d > %d characters).'
+                                      % (number, len(text), max_line_length))
+    problems_found = list(dict.fromkeys(problems_found))
+    problems_found.sort(key=lambda text: int(text.split(':')[0].split()[1]))
+    return problems_found
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inline powston_helpers into a script and check it for upload')
+    parser.add_argument('script')
+    parser.add_argument('--output', help='write the upload file here (default: stdout)')
+    parser.add_argument('--library', default=LIBRARY)
+    parser.add_argument('--max-line-length', type=int, default=MAX_LINE_LENGTH, help='0 to skip the check')
+    parser.add_argument('--refresh', action='store_true', help='replace drifted pasted helpers')
+    parser.add_argument('--check', action='store_true', help='only report drift and rule problems')
+    args = parser.parse_args(argv)
+    with open(args.script, 'r', encoding='UTF-8') as file:
+        source = file.read()
+    try:
+        output = bundle(source, args.library)
+    except ValueError as exc:
+        print('%s: %s' % (args.script, exc), file=sys.stderr)
+        return 1
+    status = 0
+    if args.refresh:
+        output, replaced = refresh(output, args.library)
+        for name in replaced:
+            print('%s: refreshed %s' % (args.script, name), file=sys.stderr)
+    else:
+        for name in drift(output, args.library):
+            print('%s: %s differs from %s' % (args.script, name, os.path.basename(args.library)), file=sys.stderr)
+            status = 1 if args.check else status
+    for problem in problems(output, args.max_line_length):
+        print('%s: %s' % (args.script, problem), file=sys.stderr)
+        status = 1
+    if args.check:
+        return status
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as file:
+            file.write(output)
+    else:
+        sys.stdout.write(output)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Precomputed uncertainty-discount factors for price forecasts.
+
+Every script generation discounts its forecasts so that buy prices rise
+and sell prices fall the further ahead they are.  The factor for a period
+depends only on the rate and the period index, so the vectors are built
+once per (rate, periods, step) and reused:
+
+    factors = factor_table(CONFIG, periods=16, step=0.5)
+    buy_disc = apply_factors(buy_forecast, factors['buy'])
+    buy_matrix = discount_matrix(buy_forecast_matrix, factors['buy'])
+
+Factors come from powston_helpers.apply_discount, the loop the scripts
+paste, so host-side results match a script bit for bit.
+"""
+from functools import lru_cache
+
+from powston_helpers import apply_discount
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for discount_matrix
+    np = None
+
+
+@lru_cache(maxsize=None)
+def discount_factors(rate, periods, step=1.0):
+    """
+    Factors ``(1 + rate) ** (i * step)`` for i in range(periods), as a tuple.
+
+    ``step`` is the exponent per period: 1.0 compounds the rate per
+    period, 0.5 per hour for 30-minute periods.  A negative rate
+    discounts (sell prices).  These are apply_discount's multipliers,
+    read off a forecast of ones.
+    """
+    periods = int(periods)
+    return tuple(apply_discount([1.0] * periods, rate, step, periods)['values'])
+
+
+def factor_table(config, periods, step=1.0):
+    """
+    Buy and sell factor vectors for a script CONFIG.
+
+    Buy prices rise by BUY_UNCERTAINTY_DISCOUNT and sell prices fall by
+    SELL_UNCERTAINTY_DISCOUNT per ``step``.
+    """
+    return {
+        'buy': discount_factors(float(config['BUY_UNCERTAINTY_DISCOUNT']), periods, step),
+        'sell': discount_factors(-float(config['SELL_UNCERTAINTY_DISCOUNT']), periods, step),
+    }
+
+
+def apply_factors(forecast, factors):
+    """Discount ``forecast`` in one pass; truncated to the shorter length."""
+    return [price * factor for price, factor in zip(forecast, factors)]
+
+
+def discount_matrix(matrix, factors):
+    """
+    Discount a (rows, periods) forecast matrix at once.
+
+    Columns beyond ``len(factors)`` are dropped; NaN padding stays NaN.
+    """
+    factors = np.asarray(factors, dtype=float)
+    matrix = np.asarray(matrix, dtype=float)
+    width = min(matrix.shape[1], len(factors))
+    return matrix[:, :width] * factors[:width]
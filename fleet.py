@@ -0,0 +1,223 @@
+"""
+Backtest a portfolio of sites against shared market data.
+
+Sites in the same market (region and tariff) see the same prices and
+forecasts, so those columns are loaded once per market rather than once
+per site.  Each site contributes only its own meter data (house_power,
+solar_power, ...), script, battery and CONFIG overrides.  Sites are
+simulated in parallel worker processes with the backtest battery model;
+the market frames reach the workers as meter_data_df does in
+sweep.run_sweep.
+
+A fleet file is JSON; relative paths are relative to the file:
+
+    {
+        "markets": {"QLD1": "qld_market.feather"},
+        "sites": [
+            {"name": "civita", "market": "QLD1", "script": "script v8.26",
+             "meter_data": "civita.feather", "battery_capacity": 101200,
+             "charge_rate": 20000, "overrides": {"PLANNER_ENABLED": true}},
+            {"name": "shed", "site_id": 7, "market": "QLD1", "script": "nsw_script.py"}
+        ],
+        "start": "2024-11-01", "end": "2024-11-30"
+    }
+
+A site without "meter_data" is loaded from the MeterStore cache by
+site_id for start..end.  Market columns (MARKET_COLUMNS, prices and
+forecasts) replace the site's own copies; weather stays per site.  A site with "latitude" and "longitude" (and
+optionally "timezone") gets its sunrise and sunset from sun_times.
+
+    python fleet.py fleet.json --workers 8
+
+prints one row per site plus the fleet bill and the coincident (summed
+across sites) peak export and import.
+"""
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from backtest import BatchFeatures, run_backtest
+from benchmark import ScriptStrategy, load_base_payload, load_meter_data, perfect_forecasts
+from sun_times import add_sun_times
+
+# Columns shared by every site of a market; weather depends on the site
+MARKET_COLUMNS = ('rrp', 'buy_price', 'sell_price', 'buy_forecast', 'sell_forecast')
+
+SITE_DEFAULTS = {'battery_capacity': 10000, 'charge_rate': 5000, 'initial_soc': 50.0}
+
+# Set in each worker (or in the parent before forking)
+_WORKER_MARKETS = None
+
+
+def load_fleet(path):
+    """Read a fleet file and resolve its paths against its directory."""
+    with open(path, 'r', encoding='UTF-8') as file:
+        fleet = json.load(file)
+    root = os.path.dirname(os.path.abspath(path))
+
+    def resolve(value):
+        return value if os.path.isabs(value) else os.path.join(root, value)
+
+    fleet['markets'] = {name: resolve(market) if isinstance(market, str) else market
+                        for name, market in fleet.get('markets', {}).items()}
+    for site in fleet['sites']:
+        for key in ('meter_data', 'payload'):
+            if isinstance(site.get(key), str):
+                site[key] = resolve(site[key])
+        if 'script' in site and not os.path.isabs(site['script']) and os.path.exists(resolve(site['script'])):
+            site['script'] = resolve(site['script'])
+    return fleet
+
+
+def load_market(market):
+    """A market frame from a path, or the frame itself."""
+    if isinstance(market, pd.DataFrame):
+        df = market
+    else:
+        df = load_meter_data(market)
+    return df[[column for column in MARKET_COLUMNS if column in df.columns]]
+
+
+def site_frame(site, market_df, start=None, end=None):
+    """The site's meter data with the shared market columns joined in."""
+    data = site.get('meter_data')
+    if isinstance(data, pd.DataFrame):
+        df = data
+    elif data:
+        df = load_meter_data(data)
+    else:
+        from meter_store import MeterStore
+        df = MeterStore().load(site['site_id'], site.get('start', start), site.get('end', end))
+    if market_df is not None:
+        df = df.drop(columns=[column for column in market_df.columns if column in df.columns])
+        df = df.join(market_df, how='inner')
+    if site.get('latitude') is not None and site.get('longitude') is not None:
+        df = add_sun_times(df, site['latitude'], site['longitude'], site.get('timezone'))
+    return perfect_forecasts(df)
+
+
+def simulate_site(site, market_df, start=None, end=None):
+    """
+    Backtest one site; returns (summary row, grid power Series in W).
+
+    Grid power is positive when importing.
+    """
+    options = dict(SITE_DEFAULTS)
+    options.update(site)
+    df = site_frame(site, market_df, start, end)
+    features = BatchFeatures(df, battery_capacity=options['battery_capacity'], charge_rate=options['charge_rate'])
+    base = load_base_payload(site['payload']) if site.get('payload') else None
+    strategy = ScriptStrategy(options['script'], base, overrides=site.get('overrides'))
+    bill, ret_df = run_backtest(features, strategy, options['initial_soc'])
+    grid = ret_df['grid_power']
+    hours = features.interval_hours
+    row = {
+        'site': site.get('name', site.get('site_id')),
+        'market': site.get('market'),
+        'script': os.path.basename(options['script']),
+        'rows': features.n,
+        'bill': bill,
+        'imported_kwh': float(grid.clip(lower=0).sum() * hours / 1000.0),
+        'exported_kwh': float(-grid.clip(upper=0).sum() * hours / 1000.0),
+        'peak_import_kw': float(max(grid.max(), 0.0) / 1000.0) if len(grid) else 0.0,
+        'peak_export_kw': float(max(-grid.min(), 0.0) / 1000.0) if len(grid) else 0.0,
+        'errors': strategy.errors,
+    }
+    return row, grid
+
+
+def _init_worker(markets):
+    global _WORKER_MARKETS  # pylint: disable=global-statement
+    if markets is not None:
+        _WORKER_MARKETS = markets
+
+
+def evaluate(task):
+    """Simulate one site; runs inside a worker process."""
+    site, start, end = task
+    market_df = _WORKER_MARKETS.get(site.get('market')) if _WORKER_MARKETS else None
+    return simulate_site(site, market_df, start, end)
+
+
+def fleet_totals(rows, grids):
+    """Fleet bill and the coincident peak export / import of the summed grid power."""
+    totals = {
+        'sites': len(rows),
+        'bill': float(sum(row['bill'] for row in rows)),
+        'errors': int(sum(row['errors'] for row in rows)),
+    }
+    if not grids:
+        totals.update({'peak_export_kw': 0.0, 'peak_export_time': None, 'peak_import_kw': 0.0,
+                       'peak_import_time': None})
+        return totals, pd.Series(dtype=float)
+    fleet_grid = pd.concat(grids, axis=1).fillna(0.0).sum(axis=1)
+    totals['peak_export_kw'] = float(max(-fleet_grid.min(), 0.0) / 1000.0)
+    totals['peak_export_time'] = fleet_grid.idxmin().isoformat()
+    totals['peak_import_kw'] = float(max(fleet_grid.max(), 0.0) / 1000.0)
+    totals['peak_import_time'] = fleet_grid.idxmax().isoformat()
+    return totals, fleet_grid
+
+
+def run_fleet(fleet, max_workers=None):
+    """
+    Backtest every site of ``fleet`` (a dict as in a fleet file, or a path)
+    across all cores.
+
+    Returns (sites, totals, fleet_grid): a DataFrame with one row per site,
+    the fleet totals dict and the summed grid power (W) of the fleet.
+    """
+    global _WORKER_MARKETS  # pylint: disable=global-statement
+    if isinstance(fleet, str):
+        fleet = load_fleet(fleet)
+    # Each market is read once, in the parent
+    markets = {name: load_market(market) for name, market in fleet.get('markets', {}).items()}
+    for site in fleet['sites']:
+        if site.get('market') is not None and site['market'] not in markets:
+            raise KeyError('Site %s uses unknown market %s' % (site.get('name'), site['market']))
+    tasks = [(site, fleet.get('start'), fleet.get('end')) for site in fleet['sites']]
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # Workers inherit the market frames copy-on-write; nothing is pickled
+        context = multiprocessing.get_context('fork')
+        _WORKER_MARKETS = markets
+        initargs = (None,)
+    else:
+        context = multiprocessing.get_context()
+        initargs = (markets,)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=context,
+                                 initializer=_init_worker, initargs=initargs) as pool:
+            results = list(pool.map(evaluate, tasks))
+    finally:
+        _WORKER_MARKETS = None
+
+    rows = [result[0] for result in results]
+    grids = [result[1].rename(row['site']) for row, result in zip(rows, results)]
+    totals, fleet_grid = fleet_totals(rows, grids)
+    return pd.DataFrame(rows), totals, fleet_grid
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Backtest every site of a fleet file')
+    parser.add_argument('fleet', help='fleet JSON file')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', help='write the per-site table as CSV')
+    args = parser.parse_args(argv)
+    sites, totals, _ = run_fleet(args.fleet, args.workers)
+    print(sites.to_string(index=False, float_format='%.2f'))
+    print('')
+    print('Fleet: %d sites, bill $%.2f, peak export %.1f kW (%s), peak import %.1f kW (%s), %d errors' % (
+        totals['sites'], totals['bill'] / 100.0, totals['peak_export_kw'], totals['peak_export_time'],
+        totals['peak_import_kw'], totals['peak_import_time'], totals['errors']))
+    if args.output:
+        sites.to_csv(args.output, index=False)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,195 @@
+"""
+On-disk cache for /api/meter_data downloads.
+
+The cleaned frame (timezone converted, sorted, de-duplicated) is stored
+one file per site and local day under ``root/site_<id>/YYYY-MM-DD.feather``.
+load() only requests the days that are not on disk yet, then reads the
+day files memory-mapped and concatenates them with Arrow, so a repeated
+backtest starts without touching the network or re-parsing JSON.
+
+    store = MeterStore('meter_cache', server=powston_test_server, headers=header)
+    meter_data_df = store.load(90, '2024-12-15', '2024-12-19')
+
+Days that have not finished yet (today and later in the site timezone)
+are always fetched and never written, so a partial day is not cached.
+"""
+import io
+import os
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather, parquet
+except ImportError:  # pyarrow is only needed for the cache itself
+    pa = None
+
+FORMATS = ('feather', 'parquet')
+
+
+def clean_meter_data(response, timezone='Australia/Brisbane'):
+    """
+    Turn a meter_data response (a JSON string of records) into the frame
+    the simulator expects: tz-aware interval_time index, sorted, with the
+    last of any duplicated intervals kept.
+    """
+    if isinstance(response, str):
+        response = io.StringIO(response)
+    meter_data_df = pd.read_json(response, orient='records', convert_dates=['interval_time'])
+    if meter_data_df.empty:
+        return empty_frame(timezone)
+    meter_data_df['interval_time'] = pd.to_datetime(meter_data_df['interval_time'], utc=True).dt.tz_convert(
+        ZoneInfo(timezone))
+    meter_data_df.set_index('interval_time', inplace=True)
+    meter_data_df.sort_index(inplace=True)
+    return meter_data_df[~meter_data_df.index.duplicated(keep='last')]
+
+
+def empty_frame(timezone='Australia/Brisbane'):
+    """A meter_data frame with no rows."""
+    index = pd.DatetimeIndex([], tz=ZoneInfo(timezone), name='interval_time')
+    return pd.DataFrame(index=index)
+
+
+def as_date(value):
+    """Accept a date, datetime or 'YYYY-MM-DD' string (quoted or not)."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value).strip('"\''))
+
+
+def day_range(first, last):
+    """Every date from ``first`` to ``last`` inclusive."""
+    return [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+
+
+def contiguous_ranges(days):
+    """Group sorted dates into (first, last) runs of consecutive days."""
+    ranges = []
+    for day in days:
+        if ranges and day == ranges[-1][1] + timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+class MeterStore:
+    """
+    Site/day partitioned cache of cleaned meter data.
+
+    ``session`` is anything with a requests-style get() (the ``requests``
+    module by default, or mock_powston.MockSession offline).
+    """
+
+    def __init__(self, root='meter_cache', session=None, server=None, headers=None,
+                 timezone='Australia/Brisbane', file_format='feather'):
+        if pa is None:
+            raise ImportError('MeterStore needs pyarrow (pip install pyarrow)')
+        if file_format not in FORMATS:
+            raise ValueError('file_format must be one of %s' % (FORMATS,))
+        if session is None:
+            import requests  # pylint: disable=import-outside-toplevel
+            session = requests
+        self.root = root
+        self.session = session
+        self.server = server or os.getenv('POWSTON_TEST_SERVER', 'https://dev.inverterintelligence.com')
+        self.headers = headers or {}
+        self.timezone = timezone
+        self.file_format = file_format
+        self.requests_made = 0
+
+    def path(self, site_id, day):
+        """The cache file for one site and local day."""
+        return os.path.join(self.root, 'site_%s' % site_id, '%s.%s' % (day.isoformat(), self.file_format))
+
+    def cached_days(self, site_id):
+        """Days of ``site_id`` already on disk."""
+        directory = os.path.join(self.root, 'site_%s' % site_id)
+        if not os.path.isdir(directory):
+            return []
+        suffix = '.' + self.file_format
+        return sorted(date.fromisoformat(name[:-len(suffix)])
+                      for name in os.listdir(directory) if name.endswith(suffix))
+
+    def today(self):
+        """Today in the site timezone; this day and later are never cached."""
+        return datetime.now(ZoneInfo(self.timezone)).date()
+
+    def fetch(self, site_id, first, last):
+        """Download and clean ``first``..``last`` (inclusive) in one request."""
+        # to_date is one past the range so either API convention covers it
+        params = {'from_date': first.isoformat(), 'to_date': (last + timedelta(days=1)).isoformat()}
+        response = self.session.get('%s/api/meter_data/%s' % (self.server, site_id),
+                                    params=params, headers=self.headers)
+        self.requests_made += 1
+        response.raise_for_status()
+        return clean_meter_data(response.json(), self.timezone)
+
+    def write_day(self, site_id, day, day_df):
+        """Persist one day atomically (write then rename)."""
+        path = self.path(site_id, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(day_df.reset_index(), preserve_index=False)
+        partial = path + '.partial'
+        if self.file_format == 'feather':
+            # Uncompressed so reads can be zero-copy memory maps
+            feather.write_feather(table, partial, compression='uncompressed')
+        else:
+            parquet.write_table(table, partial)
+        os.replace(partial, path)
+
+    def read_day(self, site_id, day):
+        """Read one cached day as an Arrow table, memory-mapped."""
+        path = self.path(site_id, day)
+        if self.file_format == 'feather':
+            return feather.read_table(path, memory_map=True)
+        return parquet.read_table(path, memory_map=True)
+
+    def update(self, site_id, from_date, to_date, refresh=False):
+        """
+        Make sure every finished day in the range is on disk.
+
+        Only the missing days are downloaded, one request per run of
+        consecutive missing days.  Returns the frame for the unfinished
+        days (today onwards), which is fetched but not cached.
+        """
+        days = day_range(as_date(from_date), as_date(to_date))
+        today = self.today()
+        cached = set() if refresh else set(self.cached_days(site_id))
+        missing = [day for day in days if day < today and day not in cached]
+        for first, last in contiguous_ranges(missing):
+            fetched = self.fetch(site_id, first, last)
+            local_days = fetched.index.date
+            for day in day_range(first, last):
+                # Empty days are written too, so they are not asked for again
+                self.write_day(site_id, day, fetched[local_days == day])
+        live = [day for day in days if day >= today]
+        if not live:
+            return empty_frame(self.timezone)
+        fetched = self.fetch(site_id, live[0], live[-1])
+        return fetched[(fetched.index.date >= live[0]) & (fetched.index.date <= live[-1])]
+
+    def load(self, site_id, from_date, to_date, refresh=False):
+        """
+        Return the cleaned meter data for ``from_date``..``to_date``
+        (inclusive local days), downloading only what is not cached.
+        """
+        live_df = self.update(site_id, from_date, to_date, refresh)
+        days = [day for day in day_range(as_date(from_date), as_date(to_date)) if day < self.today()]
+        tables = [self.read_day(site_id, day) for day in days]
+        tables = [table for table in tables if table.num_rows]
+        if not tables:
+            return live_df
+        table = pa.concat_tables(tables, promote_options='default')
+        meter_data_df = table.to_pandas()
+        meter_data_df['interval_time'] = pd.to_datetime(meter_data_df['interval_time'], utc=True).dt.tz_convert(
+            ZoneInfo(self.timezone))
+        meter_data_df.set_index('interval_time', inplace=True)
+        if not live_df.empty:
+            meter_data_df = pd.concat([meter_data_df, live_df])
+        return meter_data_df
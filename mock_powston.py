@@ -0,0 +1,294 @@
+"""
+Local stand-in for the Powston test API.
+
+Serves /api/check_code, /api/sim_code, /api/meter_data/{site_id} and
+/api/site/{site_id} from the synthetic fixtures in tests/, so the test
+suite runs offline and deterministically.  The same dispatch() backs an
+in-process session (no sockets at all) and a small HTTP server:
+
+    session, server, header = client()      # fake unless POWSTON_API_KEY
+    session.post(server + '/api/check_code', json=body, headers=header)
+
+    python mock_powston.py --port 8765      # then point
+                                            # POWSTON_TEST_SERVER at it
+"""
+import ast
+import json
+import os
+import re
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from script_runner import ScriptRunner
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests')
+DEFAULT_SERVER = 'https://dev.inverterintelligence.com'
+LOCAL_SERVER = 'http://powston.local'
+
+# Builtins RestrictedPython refuses to hand to a script
+FORBIDDEN_NAMES = ('open', 'exec', 'eval', 'compile', 'globals', 'locals', 'vars', 'getattr', 'setattr',
+                   'delattr', 'input', 'breakpoint', '__import__')
+
+_METER_DATA_PATH = re.compile(r'^/api/meter_data/(\w+)/?$')
+_SITE_PATH = re.compile(r'^/api/site/(\w+)/?$')
+
+
+class MockResponse:
+    """The subset of requests.Response the tests use."""
+
+    def __init__(self, status_code, payload, url=''):
+        self.status_code = status_code
+        self.url = url
+        self.text = json.dumps(payload)
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if not self.ok:
+            # Imported lazily so the fake works without requests installed
+            from requests import HTTPError
+            raise HTTPError('%s Error for url: %s' % (self.status_code, self.url), response=self)
+
+
+class MockPowston:
+    """
+    Answers Powston API requests from fixture files.
+
+    meter_data and site responses are read from ``<fixtures>/meter_data_<id>.json``
+    and ``<fixtures>/site_<id>.json``; check_code and sim_code run the posted
+    script locally with ScriptRunner.
+    """
+
+    def __init__(self, fixtures=FIXTURES):
+        self.fixtures = fixtures
+        self._cache = {}
+
+    def load(self, name):
+        """Read (and cache) a JSON fixture; None if it does not exist."""
+        if name not in self._cache:
+            path = os.path.join(self.fixtures, name)
+            if not os.path.exists(path):
+                return None
+            with open(path, 'r', encoding='UTF-8') as file:
+                self._cache[name] = json.load(file)
+        return self._cache[name]
+
+    def dispatch(self, method, path, query=None, body=None, headers=None):
+        """Route one request; returns (status_code, payload)."""
+        query = query or {}
+        headers = headers or {}
+        if not headers.get('Authorization', '').startswith('Bearer '):
+            return 401, {'detail': 'Not authenticated'}
+        if method == 'POST' and path.rstrip('/') == '/api/check_code':
+            return self.check_code(body or {})
+        if method == 'POST' and path.rstrip('/') == '/api/sim_code':
+            return self.sim_code(body or {})
+        match = _METER_DATA_PATH.match(path)
+        if method == 'GET' and match:
+            return self.meter_data(match.group(1), query.get('from_date'), query.get('to_date'))
+        match = _SITE_PATH.match(path)
+        if method == 'GET' and match:
+            return self.site(match.group(1))
+        return 404, {'detail': 'Not Found'}
+
+    def check_code(self, body):
+        problems = check_source(body.get('code', ''))
+        if problems:
+            return 200, {'status': False, 'problems': problems}
+        return 200, {'status': True, 'problems': ['Success']}
+
+    def sim_code(self, body):
+        code = body.get('code', '')
+        problems = check_source(code)
+        if problems:
+            return 400, {'detail': problems}
+        runner = ScriptRunner(code, 'script.py', inverters=body.get('inverters', {}))
+        try:
+            action, reason = runner.decide_payload(body.get('action_params', {}))
+        except Exception as error:  # pylint: disable=broad-except
+            return 400, {'detail': '%s: %s' % (type(error).__name__, error)}
+        return 200, {'action': action, 'reason': reason}
+
+    def meter_data(self, site_id, from_date=None, to_date=None):
+        records = self.load('meter_data_%s.json' % site_id)
+        if records is None:
+            return 404, {'detail': 'Site %s not found' % site_id}
+        first = parse_date(from_date)
+        last = parse_date(to_date)
+        selected = []
+        for record in records:
+            day = date.fromisoformat(record['interval_time'][:10])
+            if (first is None or day >= first) and (last is None or day <= last):
+                selected.append(record)
+        # The API returns the records as a JSON string for pd.read_json()
+        return 200, json.dumps(selected)
+
+    def site(self, site_id):
+        site = self.load('site_%s.json' % site_id)
+        if site is None:
+            return 404, {'detail': 'Site %s not found' % site_id}
+        return 200, site
+
+
+def parse_date(value):
+    """Parse a from_date/to_date query value; the API accepts them quoted."""
+    if not value:
+        return None
+    return date.fromisoformat(value.strip('"\''))
+
+
+def check_source(source):
+    """
+    Return the reasons the sandbox would reject ``source`` (empty if none).
+
+    Mirrors what the platform enforces at upload: the script must compile,
+    must not import, and must not reach for private names or the builtins
+    RestrictedPython withholds.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as error:
+        return ['Line %s: SyntaxError: %s' % (error.lineno, error.msg)]
+    problems = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            problems.append('Line %s: Imports are not allowed.' % node.lineno)
+        elif isinstance(node, ast.Name) and node.id.startswith('_') and node.id != '_':
+            problems.append('Line %s: "%s" is an invalid variable name because it starts with "_"'
+                            % (node.lineno, node.id))
+        elif isinstance(node, ast.Attribute) and node.attr.startswith('_'):
+            problems.append('Line %s: "%s" is an invalid attribute name because it starts with "_".'
+                            % (node.lineno, node.attr))
+        elif isinstance(node, ast.Name) and node.id in FORBIDDEN_NAMES:
+            problems.append('Line %s: "%s" is not allowed.' % (node.lineno, node.id))
+    return problems
+
+
+def round_trip(value):
+    """Serialise and parse ``value`` as the HTTP layer would."""
+    return json.loads(json.dumps(value))
+
+
+class MockSession:
+    """
+    In-process replacement for the ``requests`` module/session.
+
+    Bodies are round-tripped through JSON exactly as they would be on the
+    wire, so anything the real API could not receive fails here too.
+    """
+
+    def __init__(self, api=None):
+        self.api = api or MockPowston()
+
+    def request(self, method, url, params=None, json=None, headers=None, **_kwargs):  # pylint: disable=redefined-outer-name
+        parts = urlsplit(url)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        query.update(params or {})
+        body = round_trip(json) if json is not None else None
+        status, payload = self.api.dispatch(method.upper(), parts.path, query, body, headers)
+        return MockResponse(status, payload, url)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+def client(api_key=None, server=None):
+    """
+    Return ``(session, server_url, headers)`` for the tests.
+
+    With an API key (argument or POWSTON_API_KEY) this is ``requests``
+    against POWSTON_TEST_SERVER; without one it is a MockSession, so the
+    suite runs offline.
+    """
+    api_key = api_key or os.getenv('POWSTON_API_KEY')
+    if api_key:
+        import requests  # pylint: disable=import-outside-toplevel
+        server = server or os.getenv('POWSTON_TEST_SERVER', DEFAULT_SERVER)
+        session = requests
+    else:
+        api_key = 'local'
+        server = server or LOCAL_SERVER
+        session = MockSession()
+    headers = {
+        'Authorization': 'Bearer %s' % api_key,
+        'Content-Type': 'application/json',
+    }
+    return session, server, headers
+
+
+class _Handler(BaseHTTPRequestHandler):
+    api = None
+
+    def _respond(self, method):
+        parts = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        body = None
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except ValueError:
+                self._send(422, {'detail': 'Body is not valid JSON'})
+                return
+        status, payload = self.api.dispatch(method, parts.path, query, body, dict(self.headers))
+        self._send(status, payload)
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self._respond('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self._respond('POST')
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def make_server(host='127.0.0.1', port=0, api=None):
+    """Build (but do not start) an HTTP server for the mock API."""
+    handler = type('Handler', (_Handler,), {'api': api or MockPowston()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(host='127.0.0.1', port=0, api=None):
+    """
+    Start the mock API on a daemon thread; returns (server, base_url).
+
+    Call server.shutdown() to stop it.  port=0 picks a free port.
+    """
+    server = make_server(host, port, api)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://%s:%s' % server.server_address[:2]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve the Powston test API from tests/ fixtures')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    httpd = make_server(args.host, args.port)
+    print('Mock Powston API on http://%s:%s' % httpd.server_address[:2])
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        httpd.shutdown()
@@ -0,0 +1,157 @@
+"""
+Validate and coerce script inputs once, before any script sees them.
+
+Every script generation defends itself against malformed inputs:
+script.py scans forecasts and raises ValueError, script_v3 and
+script_v6.5 rebuild them with clean_number_list / as_float_safe, and
+v7.14 / v8.4 call scalar_sanitise per value.  On the host (replay,
+backtests) a payload is checked once instead:
+
+    payload, repairs = normalise_payload(payload)
+    if repairs:
+        print('repaired', ', '.join(repairs))
+
+Forecasts and hourly weather arrays become lists of floats of the same
+length (a bad entry takes the previous good value, so periods stay
+aligned).  Scalars given as numeric strings or {"value": ...} become
+floats; one that cannot be read, or is NaN or infinite, becomes None
+(not set) rather than a made-up 0.0, so a script treats it as a missing
+reading.  An input that is already clean is returned as the same object
+without copying.
+"""
+import math
+
+# Per-period forecasts and the value used before the first good entry
+LIST_FIELDS = {
+    'buy_forecast': 9999.0,
+    'sell_forecast': 0.0,
+    'forecast': 0.0,
+}
+
+HOURLY_FIELDS = ('temperature_2m', 'global_tilted_irradiance_instant')
+
+SCALAR_FIELDS = ('buy_price', 'sell_price', 'rrp', 'battery_soc', 'battery_capacity', 'house_power',
+                 'solar_power', 'grid_power', 'optimal_charging', 'optimal_discharging', 'gti_today',
+                 'gti_sum_tomorrow')
+
+SOLAR_ESTIMATE_FIELDS = ('solar_estimate_remaining', 'solar_surplus_deficit', 'pv_forecast_today',
+                         'pv_forecast_tomorrow')
+
+
+def as_float(value):
+    """
+    ``value`` as a finite float, or None.
+
+    Accepts numbers, numeric strings and {"value": ...} dicts, as
+    scalar_sanitise does.
+    """
+    if isinstance(value, dict):
+        value = value.get('value')
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def is_number(value):
+    """True for a finite int or float (not a bool)."""
+    if type(value) is float:  # pylint: disable=unidiomatic-typecheck
+        return math.isfinite(value)
+    return type(value) is int  # pylint: disable=unidiomatic-typecheck
+
+
+def is_clean_list(values):
+    """True when ``values`` is a list of finite floats."""
+    if type(values) is not list:  # pylint: disable=unidiomatic-typecheck
+        return False
+    for value in values:
+        if type(value) is not float or not math.isfinite(value):  # pylint: disable=unidiomatic-typecheck
+            return False
+    return True
+
+
+def float_list(values, default=0.0):
+    """
+    Return ``(floats, repaired)``.
+
+    Clean input is returned as is and ints are converted silently.  Any
+    other entry is repaired: a numeric string or {"value": ...} is
+    converted, anything else takes the previous good value (``default``
+    before the first one).  A value that is not a list becomes [].
+    """
+    if is_clean_list(values):
+        return values, False
+    if not isinstance(values, (list, tuple)):
+        return [], values is not None
+    out = []
+    previous = float(default)
+    repaired = False
+    for value in values:
+        if is_number(value):
+            number = float(value)
+        else:
+            repaired = True
+            number = as_float(value)
+            if number is None:
+                number = previous
+        out.append(number)
+        previous = number
+    return out, repaired
+
+
+def normalise_payload(payload):
+    """
+    Return ``(payload, repairs)``: the payload with clean forecasts,
+    hourly weather arrays and scalars, and the dotted names of the fields
+    that had to be repaired.
+
+    Absent fields stay absent, and scalars that are numbers or None (not
+    set) are left as they are; unreadable ones become None.  Nothing is
+    copied unless a field changes, so a clean payload comes back as the
+    same object.
+    """
+    changes = {}
+    repairs = []
+    for name, default in LIST_FIELDS.items():
+        if name in payload:
+            values, repaired = float_list(payload[name], default)
+            if values is not payload[name]:
+                changes[name] = values
+            if repaired:
+                repairs.append(name)
+    for name in SCALAR_FIELDS:
+        if payload.get(name) is not None and not is_number(payload[name]):
+            changes[name] = as_float(payload[name])
+            repairs.append(name)
+
+    weather_data = payload.get('weather_data')
+    hourly = weather_data.get('hourly') if isinstance(weather_data, dict) else None
+    if isinstance(hourly, dict):
+        hourly_changes = {}
+        for name in HOURLY_FIELDS:
+            if name in hourly:
+                values, repaired = float_list(hourly[name])
+                if values is not hourly[name]:
+                    hourly_changes[name] = values
+                if repaired:
+                    repairs.append('weather_data.hourly.' + name)
+        if hourly_changes:
+            changes['weather_data'] = dict(weather_data, hourly=dict(hourly, **hourly_changes))
+
+    mqtt_data = payload.get('mqtt_data')
+    estimate = mqtt_data.get('solar_estimate') if isinstance(mqtt_data, dict) else None
+    if isinstance(estimate, dict):
+        estimate_changes = {}
+        for name in SOLAR_ESTIMATE_FIELDS:
+            if estimate.get(name) is not None and not is_number(estimate[name]):
+                estimate_changes[name] = as_float(estimate[name])
+                repairs.append('mqtt_data.solar_estimate.' + name)
+        if estimate_changes:
+            changes['mqtt_data'] = dict(mqtt_data, solar_estimate=dict(estimate, **estimate_changes))
+
+    if not changes:
+        return payload, repairs
+    return dict(payload, **changes), repairs
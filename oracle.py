@@ -0,0 +1,132 @@
+"""
+Perfect-foresight dispatch oracle for backtests.
+
+The scripts decide greedily (Best-N ranking, cheapest-N import schedules,
+urgency ladders).  OracleStrategy instead knows every future price, load
+and solar reading and picks, for every interval, the action that
+minimises the bill over the rest of the run.  It uses the same battery
+model (backtest.battery_step), capacity, charge rate and prices as
+run_backtest.  Its bill approximates the best any strategy can do
+under that model: it is exact only for charges on its SOC grid, and
+decide() interpolates between grid points, so a script can
+occasionally beat it by a little (negative regret).  It is not a bound
+for a real battery, whose losses and limits backtest.py simplifies:
+
+    features = BatchFeatures(meter_data_df, battery_capacity=10000, charge_rate=5000)
+    oracle_bill, oracle_df = run_backtest(features, OracleStrategy())
+    bill, ret_df = run_backtest(features, V826Strategy())
+    print(daily_regret(ret_df, oracle_df))
+
+prepare() runs a backward dynamic programme over the SOC grid
+(``soc_step`` percent apart), vectorised over SOC and actions, so a
+month of five-minute intervals takes well under a second.  decide() then
+evaluates every action from the exact battery charge against the
+interpolated cost-to-go of the next interval.
+"""
+import numpy as np
+import pandas as pd
+
+from backtest import AUTO, CHARGE, DISCHARGE, EXPORT, FULLSTOP, IMPORT
+
+# Actions the oracle chooses between; ties go to the earliest
+ACTIONS = (AUTO, IMPORT, EXPORT, CHARGE, DISCHARGE, FULLSTOP)
+
+
+def step_costs(charge_wh, house_w, solar_w, buy, sell, capacity_wh, rate_w, hours):
+    """
+    battery_step() for every action at once.
+
+    ``charge_wh`` is an array of battery charges.  Returns (next_charge,
+    cost), both shaped (len(ACTIONS), len(charge_wh)), with the cost of
+    the interval in cents.
+    """
+    charge_wh = np.asarray(charge_wh, dtype=float)
+    room_w = (capacity_wh - charge_wh) / hours
+    stored_w = charge_wh / hours
+    net_w = solar_w - house_w
+    surplus = max(net_w, 0.0)
+    deficit = max(-net_w, 0.0)
+    if net_w >= 0:
+        auto_w = np.minimum(np.minimum(room_w, net_w), rate_w)
+    else:
+        auto_w = -np.minimum(np.minimum(stored_w, -net_w), rate_w)
+    battery_w = np.stack([
+        auto_w,
+        np.minimum(room_w, rate_w),
+        -np.minimum(stored_w, rate_w),
+        np.minimum(np.minimum(room_w, surplus), rate_w),
+        -np.minimum(np.minimum(stored_w, deficit), rate_w),
+        np.zeros_like(charge_wh),
+    ])
+    grid_w = battery_w - net_w
+    grid_w[-1] = house_w  # fullstop curtails solar
+    next_charge = np.clip(charge_wh + battery_w * hours, 0.0, capacity_wh)
+    grid_kwh = grid_w * hours / 1000.0
+    cost = grid_kwh * np.where(grid_kwh > 0, buy, sell)
+    return next_charge, cost
+
+
+class OracleStrategy:
+    """
+    Bill-minimising strategy with perfect foresight.
+
+    ``soc_step`` is the SOC grid spacing in percent.  ``terminal_value``
+    credits energy left in the battery at the end of the run (c/kWh); the
+    default of 0 values leftover charge at nothing, as run_backtest's
+    bill does.
+    """
+
+    def __init__(self, soc_step=1.0, terminal_value=0.0):
+        self.soc_step = float(soc_step)
+        self.terminal_value = float(terminal_value)
+
+    def prepare(self, features):
+        f = features
+        self.capacity = f.battery_capacity
+        self.rate = f.charge_rate
+        self.hours = f.interval_hours
+        self.house = f.house_power.tolist()
+        self.solar = f.solar_power.tolist()
+        self.buy = f.buy_price.tolist()
+        self.sell = f.sell_price.tolist()
+        levels = int(round(100.0 / self.soc_step)) + 1
+        self.grid = np.linspace(0.0, self.capacity, levels)
+        # cost_to_go[i] is the cheapest bill from interval i on, per grid charge
+        cost_to_go = np.empty((f.n + 1, levels))
+        cost_to_go[f.n] = -self.grid / 1000.0 * self.terminal_value
+        for i in range(f.n - 1, -1, -1):
+            next_charge, cost = step_costs(self.grid, self.house[i], self.solar[i], self.buy[i], self.sell[i],
+                                           self.capacity, self.rate, self.hours)
+            total = cost + np.interp(next_charge, self.grid, cost_to_go[i + 1])
+            cost_to_go[i] = total.min(axis=0)
+        self.cost_to_go = cost_to_go
+
+    def expected_bill(self, soc):
+        """Optimal bill (cents) for the whole run from ``soc`` percent."""
+        return float(np.interp(self.capacity * soc / 100.0, self.grid, self.cost_to_go[0]))
+
+    def decide(self, i, soc):
+        charge = np.array([self.capacity * soc / 100.0])
+        next_charge, cost = step_costs(charge, self.house[i], self.solar[i], self.buy[i], self.sell[i],
+                                       self.capacity, self.rate, self.hours)
+        total = cost[:, 0] + np.interp(next_charge[:, 0], self.grid, self.cost_to_go[i + 1])
+        return ACTIONS[int(np.argmin(total))]
+
+
+def daily_bills(ret_df):
+    """Bill (cents) per local day of a run_backtest result."""
+    return ret_df['sim_cost'].groupby(ret_df.index.date).sum()
+
+
+def daily_regret(ret_df, oracle_df):
+    """
+    Per-day bill, oracle bill and regret (bill - oracle bill) in cents.
+
+    Both frames come from run_backtest over the same features.  Regret on
+    a single day can be negative (the oracle may spend today to save
+    tomorrow); the total is not, up to the SOC grid resolution.
+    """
+    report = pd.DataFrame({'bill': daily_bills(ret_df), 'oracle_bill': daily_bills(oracle_df)})
+    report['regret'] = report['bill'] - report['oracle_bill']
+    report.index.name = 'date'
+    return report
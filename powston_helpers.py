@@ -0,0 +1,368 @@
+"""
+Canonical helpers for Powston decision scripts.
+
+Scripts run in the RestrictedPython sandbox (see ai_prompt.txt): they
+cannot import, and helper functions cannot call other helper functions.
+So this module is not imported by scripts.  It is the reference copy that
+scripts paste, either as a whole function called from main code or as an
+inlined loop inside another helper.  Everything here follows the sandbox
+rules: no imports, no f-strings or .format(), no tuple unpacking, no
+lambdas, each helper returns a dict, and lines are at most 79 characters.
+"""
+
+
+def rank_query(prices, value, n, highest):
+    """
+    Rank value among prices in one counting pass (no sort, no tuples).
+
+    highest=True ranks sell prices (dearest first), False ranks buy
+    prices (cheapest first).  in_best_n is True when value would be
+    among the best n of prices, i.e. value is at least as good as the
+    n-th best price.  best_price / best_index are the best price and
+    its first index.
+    """
+    better = 0
+    best_price = None
+    best_index = -1
+    for i in range(len(prices)):
+        price = prices[i]
+        if highest:
+            if price > value:
+                better = better + 1
+            if best_index < 0 or price > best_price:
+                best_price = price
+                best_index = i
+        else:
+            if price < value:
+                better = better + 1
+            if best_index < 0 or price < best_price:
+                best_price = price
+                best_index = i
+    limit = min(n, len(prices))
+    return {
+        "rank": better + 1,
+        "in_best_n": better < limit,
+        "better": better,
+        "best_price": best_price,
+        "best_index": best_index,
+    }
+
+
+def best_spread(buy_prices, sell_prices):
+    """
+    Best buy-now/sell-later spread in one backward suffix-maximum scan.
+
+    For each buy period i the dearest sell period j > i is kept while
+    walking back from the end, so the whole search is O(n).  exists is
+    True when some buy price is below a later sell price.  Ties prefer
+    the earliest buy and the earliest sell period.
+    """
+    best_buy = -1
+    best_sell = -1
+    spread = None
+    sell_max = None
+    sell_max_index = -1
+    i = max(len(buy_prices), len(sell_prices)) - 1
+    while i >= 0:
+        if i < len(buy_prices) and sell_max_index >= 0:
+            gain = sell_max - buy_prices[i]
+            if spread is None or gain >= spread:
+                spread = gain
+                best_buy = i
+                best_sell = sell_max_index
+        if i < len(sell_prices):
+            if sell_max_index < 0 or sell_prices[i] >= sell_max:
+                sell_max = sell_prices[i]
+                sell_max_index = i
+        i = i - 1
+    return {
+        "exists": spread is not None and spread > 0,
+        "spread": spread,
+        "buy_index": best_buy,
+        "sell_index": best_sell,
+    }
+
+
+def build_load_table(config):
+    """
+    Household kWh per (hour of day, whole-degree temperature bucket).
+
+    Built from PURE_BASE_LOAD_KWH_PER_HOUR, AC_SETPOINTS,
+    AC_BEDROOM_ZONES_KW and AC_HOUSE_ZONES_KW so overnight demand is a
+    lookup sum.  Host-side only (the backtest builds it once per run
+    of the data): a script would rebuild all 24 rows on every
+    invocation, so v8.26 works out just the hours it needs.
+
+    Night setpoints apply 9 PM - 9 AM.  A temperature t falls in bucket
+    ceil(t), clamped to low..high; with whole-degree setpoints the AC
+    steps (30/70/100% bedrooms, 20/50/80% house above
+    0/2/4 degrees over setpoint) are reproduced exactly.
+    """
+    base = config["PURE_BASE_LOAD_KWH_PER_HOUR"]
+    bedroom_kw = config["AC_BEDROOM_ZONES_KW"]
+    house_kw = config["AC_HOUSE_ZONES_KW"]
+    day = config["AC_SETPOINTS"]["day"]
+    night = config["AC_SETPOINTS"]["night"]
+    low = int(min(day["bedrooms"], day["house"],
+                  night["bedrooms"], night["house"]))
+    high = int(max(day["bedrooms"], day["house"],
+                   night["bedrooms"], night["house"])) + 5
+    rows = []
+    for hour in range(24):
+        if 21 <= hour or hour < 9:
+            setpoint = night
+        else:
+            setpoint = day
+        row = []
+        for temp in range(low, high + 1):
+            bedroom_delta = temp - setpoint["bedrooms"]
+            house_delta = temp - setpoint["house"]
+            if bedroom_delta <= 0:
+                bedroom_ac_kw = 0.0
+            elif bedroom_delta <= 2:
+                bedroom_ac_kw = bedroom_kw * 0.3
+            elif bedroom_delta <= 4:
+                bedroom_ac_kw = bedroom_kw * 0.7
+            else:
+                bedroom_ac_kw = bedroom_kw * 1.0
+            if house_delta <= 0:
+                house_ac_kw = 0.0
+            elif house_delta <= 2:
+                house_ac_kw = house_kw * 0.2
+            elif house_delta <= 4:
+                house_ac_kw = house_kw * 0.5
+            else:
+                house_ac_kw = house_kw * 0.8
+            row.append(base + bedroom_ac_kw + house_ac_kw)
+        rows.append(row)
+    return {"kwh": rows, "low": low, "high": high}
+
+
+def plan_dispatch(buy_prices, sell_prices, net_load_kwh, soc, floor_soc,
+                  config):
+    """
+    Cheapest hold/import/export plan over the forecast, by backward DP.
+
+    One step per 30-minute forecast period over a grid of SOC levels
+    PLANNER_SOC_STEP percent apart (interpolated in between).  Each
+    period the battery can hold (auto: it covers net_load_kwh, negative
+    for a solar surplus), import at MAX_CHARGE_RATE_KW or export at
+    MAX_DISCHARGE_RATE_KW.  Energy below floor_soc costs
+    PLANNER_FLOOR_PENALTY c/kWh per period; energy left at the end is
+    worth the lowest sell price (never below zero), a conservative value:
+    the mean buy price, inflated by spikes and the uncertainty markup,
+    made the plan fill the battery at any price.  The current SOC is an
+    extra state of the first period, so action (period 0) is exact.
+    plan follows the nearest level after that.
+    """
+    names = ["auto", "import", "export"]
+    capacity = config["BATTERY_CAPACITY_KWH"]
+    charge_kwh = config["MAX_CHARGE_RATE_KW"] * 0.5
+    discharge_kwh = config["MAX_DISCHARGE_RATE_KW"] * 0.5
+    penalty = config["PLANNER_FLOOR_PENALTY"]
+    levels = int(100.0 / config["PLANNER_SOC_STEP"] + 0.5) + 1
+    level_kwh = capacity / (levels - 1)
+    floor_kwh = capacity * floor_soc / 100.0
+    start_kwh = min(max(capacity * soc / 100.0, 0.0), capacity)
+    periods = min(len(buy_prices), len(sell_prices), len(net_load_kwh))
+    if periods == 0:
+        return {"action": "auto", "plan": [], "cost": 0.0}
+    terminal = max(min(sell_prices[:periods]), 0.0)
+    future = []
+    for k in range(levels):
+        future.append(-k * level_kwh * terminal)
+    policy = []
+    following = []
+    first = []
+    p = periods - 1
+    while p >= 0:
+        net = net_load_kwh[p]
+        count = levels
+        if p == 0:
+            count = levels + 1
+        row = []
+        row_action = []
+        row_next = []
+        for k in range(count):
+            stored = start_kwh
+            if k < levels:
+                stored = k * level_kwh
+            room = capacity - stored
+            best = None
+            best_action = 0
+            best_next = stored
+            for a in range(3):
+                if a == 1:
+                    flow = min(charge_kwh, room)
+                elif a == 2:
+                    flow = -min(discharge_kwh, stored)
+                else:
+                    flow = min(max(-net, -discharge_kwh), charge_kwh)
+                    flow = min(max(flow, -stored), room)
+                grid = flow + net
+                if grid > 0:
+                    cost = grid * buy_prices[p]
+                else:
+                    cost = grid * sell_prices[p]
+                after = stored + flow
+                if after < floor_kwh:
+                    cost = cost + (floor_kwh - after) * penalty
+                position = after / level_kwh
+                low = int(position)
+                if low >= levels - 1:
+                    cost = cost + future[levels - 1]
+                else:
+                    frac = position - low
+                    cost = (cost + future[low] * (1.0 - frac)
+                            + future[low + 1] * frac)
+                if best is None or cost < best:
+                    best = cost
+                    best_action = a
+                    best_next = after
+            row.append(best)
+            row_action.append(best_action)
+            row_next.append(best_next)
+        future = row
+        first = row_action
+        policy.insert(0, row_action)
+        following.insert(0, row_next)
+        p = p - 1
+    plan = [names[first[levels]]]
+    after = following[0][levels]
+    for p in range(1, periods):
+        k = min(int(after / level_kwh + 0.5), levels - 1)
+        plan.append(names[policy[p][k]])
+        after = following[p][k]
+    return {"action": plan[0], "plan": plan, "cost": future[levels]}
+
+
+def in_window(hour, start, end):
+    """
+    Whether hour is in [start, end), wrapping past midnight when
+    start > end (e.g. 21 to 5).
+    """
+    if start < end:
+        inside = start <= hour < end
+    else:
+        inside = hour >= start or hour < end
+    return {"inside": inside}
+
+
+def combined_soc(battery_soc, inverters, inverter_ids, mqtt_data, max_drift):
+    """
+    Mean battery_soc of the listed inverters (inverter_params_<id>),
+    falling back to battery_soc (0.0 if not a number).
+
+    When mqtt_data carries solar_estimate's combined SOC and it is more
+    than max_drift away, the platform's SOC is lagging and the MQTT value
+    is used instead.  source is "inverters", "payload" or "mqtt".
+    """
+    total = 0.0
+    count = 0
+    for inverter_id in inverter_ids:
+        params = inverters.get("inverter_params_" + str(inverter_id))
+        if params and "battery_soc" in params:
+            value = params["battery_soc"]
+            if isinstance(value, int) or isinstance(value, float):
+                total = total + float(value)
+                count = count + 1
+    if count > 0:
+        soc = total / count
+        source = "inverters"
+    elif isinstance(battery_soc, int) or isinstance(battery_soc, float):
+        soc = float(battery_soc)
+        source = "payload"
+    else:
+        soc = 0.0
+        source = "payload"
+    if mqtt_data:
+        try:
+            estimate = mqtt_data.get("solar_estimate", {})
+            key = "combined_pv_battery_state_of_charge"
+            mqtt_soc = float(estimate.get(key, 0.0))
+            if mqtt_soc > 0 and abs(mqtt_soc - soc) > max_drift:
+                soc = mqtt_soc
+                source = "mqtt"
+        except Exception:
+            pass
+    return {"soc": soc, "source": source, "count": count}
+
+
+def apply_discount(forecast, rate, step, limit):
+    """
+    The first limit prices of forecast, period i scaled by
+    (1 + rate) ** (i * step): step 1 discounts per period, 1 / periods
+    per hour per hour ahead.  One multiply per period, no power.
+    """
+    base = (1 + rate) ** step
+    factor = 1.0
+    values = []
+    for i in range(min(limit, len(forecast))):
+        values.append(forecast[i] * factor)
+        factor = factor * base
+    return {"values": values}
+
+
+def classify_solar(gti, cfg):
+    """
+    "sunny", "normal" or "rainy" from the GTI forecast and the
+    GTI_SUNNY_THRESHOLD / GTI_NORMAL_THRESHOLD of cfg.
+    """
+    if gti >= cfg["GTI_SUNNY_THRESHOLD"]:
+        label = "sunny"
+    elif gti >= cfg["GTI_NORMAL_THRESHOLD"]:
+        label = "normal"
+    else:
+        label = "rainy"
+    return {"class": label}
+
+
+def evening_premium(buy_fc, sell_fc, hour, peak_start, peak_end):
+    """
+    Best peak sell price less the cheapest buy price outside the peak,
+    over 30-minute periods from hour.  The peak runs from peak_start to
+    the end of hour peak_end and may wrap past midnight.  premium is 0.0
+    unless both sides have a period.
+    """
+    peak_stop = peak_end + 1.0
+    peak_sell = None
+    min_buy = None
+    for i in range(min(len(buy_fc), len(sell_fc))):
+        period_hour = (hour + i * 0.5) % 24
+        if peak_start < peak_stop:
+            is_peak = peak_start <= period_hour < peak_stop
+        else:
+            is_peak = period_hour >= peak_start or period_hour < peak_stop
+        if is_peak:
+            if peak_sell is None or sell_fc[i] > peak_sell:
+                peak_sell = sell_fc[i]
+        elif min_buy is None or buy_fc[i] < min_buy:
+            min_buy = buy_fc[i]
+    premium = 0.0
+    if peak_sell is not None and min_buy is not None:
+        premium = peak_sell - min_buy
+    return {"premium": premium, "peak_sell": peak_sell, "min_buy": min_buy}
+
+
+def prefix_extrema(values):
+    """
+    Running min and max of values, one pass: min[k] is min(values[:k + 1])
+    and max[k] is max(values[:k + 1]), so min(values[:k]) is min[k - 1]
+    for 0 < k <= len(values).  Worth building only where one forecast
+    answers many next-k-periods questions, as the backtest's rows do; a
+    script asking once or twice per run is faster slicing.
+    """
+    lows = []
+    highs = []
+    low = None
+    high = None
+    for i in range(len(values)):
+        value = values[i]
+        if low is None or value < low:
+            low = value
+        if high is None or value > high:
+            high = value
+        lows.append(low)
+        highs.append(high)
+    return {"min": lows, "max": highs}
+
@@ -0,0 +1,177 @@
+"""
+Replay recorded action_params payloads through a decision script.
+
+Payloads (see tests/action_params1.json) are streamed through a generator
+pipeline: read from a directory of JSON files, a JSONL log or a single
+file, paced by their interval_time at wall-clock speed, N times faster or
+as fast as possible, run through a ScriptRunner and recorded with the
+decision, reason, priority and latency.  Payloads reach the script as
+recorded; with ``--normalise`` they go through
+normalise.normalise_payload first and each record lists the fields that
+had to be repaired.  A script that raises is recorded and the replay
+carries on, so a new version can be soak-tested against
+days of production inputs without a live inverter.
+
+    python replay.py "script v8.26" logs/2024-12/ --speed 60 --output decisions.jsonl
+
+``--speed 1`` replays in real time, ``--speed 0`` (the default) as fast as
+possible.
+"""
+import glob
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from normalise import normalise_payload
+from script_runner import ScriptRunner, action_churn, latency_percentiles, params_from_payload
+
+
+def read_payloads(source):
+    """
+    Yield payload dicts from a directory of .json files (in name order),
+    a JSONL log, a JSON file or an iterable of dicts.
+    """
+    if not isinstance(source, str):
+        yield from source
+        return
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, '*.json')) + glob.glob(os.path.join(source, '*.jsonl')))
+        for path in paths:
+            yield from read_payloads(path)
+        return
+    with open(source, 'r', encoding='UTF-8') as file:
+        if not source.endswith('.jsonl'):
+            yield json.load(file)
+            return
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def paced(payloads, speed=0.0, sleep=time.sleep, clock=time.monotonic):
+    """
+    Yield ``payloads`` no faster than their interval_time allows.
+
+    ``speed`` is the replay rate relative to real time (1 = real time,
+    60 = an hour a minute); 0 or None replays as fast as possible.  Gaps
+    are measured from the first payload, so a slow script does not make
+    the replay drift.
+    """
+    if not speed:
+        yield from payloads
+        return
+    first_time = None
+    started = None
+    for payload in payloads:
+        interval_time = payload.get('interval_time')
+        if isinstance(interval_time, str):
+            interval_time = datetime.fromisoformat(interval_time)
+        if interval_time is not None:
+            if first_time is None:
+                first_time = interval_time
+                started = clock()
+            delay = (interval_time - first_time).total_seconds() / speed - (clock() - started)
+            if delay > 0:
+                sleep(delay)
+        yield payload
+
+
+def decide(runner, payloads, normalise=False):
+    """
+    Run each payload through ``runner`` and yield one record per payload;
+    with ``normalise`` the payload is validated first (see normalise.py).
+    """
+    for payload in payloads:
+        repairs = []
+        if normalise:
+            payload, repairs = normalise_payload(payload)
+        params = params_from_payload(payload)
+        interval_time = params.pop('interval_time', None)
+        record = {'interval_time': payload.get('interval_time'), 'action': None, 'reason': None,
+                  'priority': None, 'latency_ms': None, 'error': None, 'repairs': repairs}
+        start = time.perf_counter()
+        try:
+            action, reason = runner.decide(interval_time, **params)
+        except Exception as exc:  # pylint: disable=broad-except
+            record['error'] = '%s: %s' % (type(exc).__name__, exc)
+        else:
+            record['action'] = action
+            record['reason'] = reason
+            record['priority'] = runner.decisions.priority
+        record['latency_ms'] = (time.perf_counter() - start) * 1000.0
+        yield record
+
+
+def write_records(records, path):
+    """Append each record to a JSONL file as it passes through."""
+    with open(path, 'a', encoding='UTF-8') as file:
+        for record in records:
+            file.write(json.dumps(record, default=str) + '\n')
+            file.flush()
+            yield record
+
+
+def summarise(records):
+    """Action counts, churn, errors, repaired payloads and latency percentiles of a finished replay."""
+    actions = {}
+    for record in records:
+        if record['error'] is None:
+            actions[record['action']] = actions.get(record['action'], 0) + 1
+    summary = {
+        'payloads': len(records),
+        'errors': sum(1 for record in records if record['error'] is not None),
+        'repaired': sum(1 for record in records if record.get('repairs')),
+        'actions': actions,
+        'churn': action_churn([record['action'] for record in records if record['error'] is None]),
+    }
+    summary.update(latency_percentiles([record['latency_ms'] / 1000.0 for record in records]))
+    return summary
+
+
+def replay(script, source, speed=0.0, output=None, script_globals=None, sleep=time.sleep, normalise=False,
+           **defaults):
+    """
+    Stream ``source`` through ``script`` (a filename or ScriptRunner) and
+    yield one record per payload.
+
+    Keyword arguments are passed to the script on every call, as with
+    ScriptRunner (e.g. ``inverters={}`` for payloads recorded without it).
+    """
+    if isinstance(script, str):
+        script = ScriptRunner.from_file(script, script_globals, **defaults)
+    records = decide(script, paced(read_payloads(source), speed, sleep), normalise)
+    if output:
+        records = write_records(records, output)
+    return records
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Replay recorded action_params through a decision script')
+    parser.add_argument('script')
+    parser.add_argument('source', help='directory of JSON payloads, JSONL log or JSON file')
+    parser.add_argument('--speed', type=float, default=0.0, help='1 = real time, 0 = as fast as possible')
+    parser.add_argument('--output', help='append decisions to this JSONL file')
+    parser.add_argument('--quiet', action='store_true', help='only print the summary')
+    parser.add_argument('--normalise', action='store_true', help='validate payloads first (normalise.py)')
+    args = parser.parse_args(argv)
+    records = []
+    for record in replay(args.script, args.source, args.speed, args.output, normalise=args.normalise):
+        records.append(record)
+        if not args.quiet:
+            print('%s %-10s %7.2f ms  %s' % (record['interval_time'], record['action'] or 'ERROR',
+                                             record['latency_ms'], record['error'] or record['reason']))
+    summary = summarise(records)
+    print('%d payloads, %d errors, %d repaired, p50 %.2f ms, p95 %.2f ms, max %.2f ms, %d action changes, '
+          'actions %s' % (summary['payloads'], summary['errors'], summary['repaired'], summary['p50_ms'],
+                          summary['p95_ms'], summary['max_ms'], summary['churn'],
+                          json.dumps(summary['actions'], sort_keys=True)))
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,864 @@
+"""
+Compile a declarative rule table into a sandbox-safe decision tree.
+
+The state scripts and script.py decide with long if/elif chains that test
+the same predicates (``interval_time.hour < 12``, ``battery_soc > X``,
+``sell_price > Y``) again and again.  A rule table says the same thing as
+a CONFIG-like dict:
+
+    RULES = {
+        'always_sell': {
+            'priority': 90,
+            'when': ['sell_price >= always_sell_price', 'battery_soc > min_sell_soc'],
+            'action': 'export',
+            'reason': 'Sell price exceeds the always sell price',
+            'set': {'solar': 'export'},
+        },
+        'night_default': {'priority': 0, 'when': [], 'action': 'auto'},
+    }
+
+The highest priority whose conditions all hold wins; equal priorities go
+in table order, as with decisions.reason.  compile_rules() turns the table
+into nested if/elif blocks in which every predicate is tested at most
+once per decision: a result already known (or implied, e.g. ``hour < 12``
+once ``hour < 10`` held) is never tested again, and rules that can no
+longer match are dropped from the branch.  Conditions of one rule keep
+their order, so a guard such as ``sell_forecast`` still runs before
+``max(sell_forecast) > 100``.
+
+A tree copies the rules that follow a test into both of its branches.
+Where the rules left share no test, or where another test would take the
+output past ``max_tests`` tests, the branch ends in the plain if/elif
+ladder instead, which tests the same predicates without the copies.  A
+test two rungs of a ladder share is evaluated once, just before the first
+rung that needs it, into a local (``rule_test_3 = sell_price > 20``), so
+the ladder keeps the at-most-once promise; one that could raise (see
+Predicate.safe) is never moved ahead of its guard, and its branch is
+split further instead.  Long
+conditions and reasons are wrapped to 79 characters, and main() checks
+the output with bundle.problems.
+
+    python rule_compiler.py tests/script_rules.py --output compiled.py --samples 10000
+
+Implied results assume numbers compare normally (no NaN); run payloads
+through normalise.py first.
+"""
+import ast
+import json
+import random
+import sys
+import textwrap
+
+RULE_KEYS = ('priority', 'when', 'action', 'reason', 'set')
+
+MAX_LINE_LENGTH = 79
+
+# Tests emitted as a tree before the rest falls back to the if/elif ladder
+MAX_TESTS = 40
+
+# Canonical operator and polarity of a comparison against a number:
+# ``x > c`` is ``not x <= c``, ``x >= c`` is ``not x < c``
+NUMERIC_OPS = {
+    ast.Lt: ('<', True),
+    ast.LtE: ('<=', True),
+    ast.Gt: ('<=', False),
+    ast.GtE: ('<', False),
+    ast.Eq: ('==', True),
+    ast.NotEq: ('==', False),
+}
+
+# The same comparison with its operands swapped
+FLIPPED = {ast.Lt: ast.Gt, ast.LtE: ast.GtE, ast.Gt: ast.Lt, ast.GtE: ast.LtE, ast.Eq: ast.Eq,
+           ast.NotEq: ast.NotEq}
+
+NEGATED_TEXT = {'<': '>=', '<=': '>', '==': '!='}
+
+SAFE_NODES = (ast.Expression, ast.Name, ast.Attribute, ast.Constant, ast.Load, ast.Compare, ast.cmpop,
+              ast.UnaryOp, ast.unaryop, ast.BoolOp, ast.boolop)
+
+
+class Predicate:
+    """
+    One test a rule can make, in canonical form (``text`` is true when the
+    predicate holds).  ``subject`` and ``op`` are set for a comparison,
+    with ``value`` for a number on the right or ``other`` for another
+    expression, which lets one result imply another.
+    """
+    __slots__ = ('text', 'negated_text', 'subject', 'op', 'value', 'other', 'code', 'safe', 'spelling', 'local')
+
+    def __init__(self, text, negated_text, subject=None, op=None, value=None, other=None):
+        self.text = text
+        self.negated_text = negated_text
+        self.subject = subject
+        self.op = op
+        self.value = value
+        self.other = other
+        self.code = compile(text, '<rule>', 'eval')
+        # Names, attributes and literals cannot raise, so the test may run early
+        self.safe = all(isinstance(node, SAFE_NODES) for node in ast.walk(ast.parse(text, mode='eval')))
+        # How the table wrote the test, by expected result, for the emitted code
+        self.spelling = {}
+        # Name of the local a ladder stores the result in (set by parse_rules)
+        self.local = None
+
+    def __repr__(self):
+        return 'Predicate(%r)' % self.text
+
+
+class Rule:
+    """A row of the table with its conditions as (Predicate, expected) pairs."""
+    __slots__ = ('name', 'priority', 'conditions', 'action', 'reason', 'assign', 'order')
+
+    def __init__(self, name, priority, conditions, action, reason, assign, order):
+        self.name = name
+        self.priority = priority
+        self.conditions = conditions
+        self.action = action
+        self.reason = reason
+        self.assign = assign
+        self.order = order
+
+
+class Leaf:
+    """The rule a branch ends in."""
+    __slots__ = ('rule', 'key')
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.key = tuple(_assignments(rule))
+
+
+class Node:
+    """Test ``predicate``; ``polarity`` picks which form the emitted code tests."""
+    __slots__ = ('predicate', 'when_true', 'when_false', 'polarity', 'key')
+
+    def __init__(self, predicate, when_true, when_false, polarity=True):
+        self.predicate = predicate
+        self.when_true = when_true
+        self.when_false = when_false
+        self.polarity = polarity
+        self.key = (predicate.text, _key(when_true), _key(when_false))
+
+
+class Chain:
+    """
+    The rest of a branch as an if/elif ladder: ``steps`` holds each rule
+    still possible, in priority order, with the conditions left to test.
+    ``hoisted`` are the predicates more than one step tests; each is
+    evaluated once, before the first step that tests it, and the steps
+    read the result.
+    """
+    __slots__ = ('steps', 'hoisted', 'key')
+
+    def __init__(self, steps, hoisted=()):
+        self.steps = steps
+        self.hoisted = list(hoisted)
+        self.key = ('chain', tuple(predicate.text for predicate in self.hoisted)) + tuple(
+            (tuple((predicate.text, expected) for predicate, expected in conditions), tuple(_assignments(rule)))
+            for rule, conditions in steps)
+
+    def tests(self):
+        """Tests the ladder emits, and the most one decision makes."""
+        hoisted = {predicate.text for predicate in self.hoisted}
+        return len(hoisted) + sum(1 for _, conditions in self.steps for predicate, _ in conditions
+                                  if predicate.text not in hoisted)
+
+
+def _key(tree):
+    # Subtrees with equal keys emit the same code
+    return None if tree is None else tree.key
+
+
+def number(node):
+    """The value of a numeric literal (including a negative one), or None."""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = number(node.operand)
+        return None if value is None else -value
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):  # pylint: disable=unidiomatic-typecheck
+        return node.value
+    return None
+
+
+def check_sandbox(node, where):
+    """Raise ValueError if ``node`` uses something the Powston sandbox rejects."""
+    for child in ast.walk(node):
+        if isinstance(child, (ast.JoinedStr, ast.Lambda, ast.Tuple)):
+            raise ValueError('%s: f-strings, lambdas and tuples are not allowed in the sandbox' % where)
+
+
+def comparison(left, op, right):
+    """Predicate and expected result of ``left op right`` (a single comparison)."""
+    if isinstance(left, ast.Constant) or number(left) is not None:
+        if not isinstance(right, ast.Constant) and number(right) is None and type(op) in FLIPPED:
+            left, op, right = right, FLIPPED[type(op)](), left
+    value = number(right)
+    subject = ast.unparse(left)
+    if value is not None and type(op) in NUMERIC_OPS:
+        symbol, expected = NUMERIC_OPS[type(op)]
+        literal = ast.unparse(right)
+        predicate = Predicate('%s %s %s' % (subject, symbol, literal),
+                              '%s %s %s' % (subject, NEGATED_TEXT[symbol], literal), subject, symbol, value)
+        return predicate, expected
+    other = ast.unparse(right)
+    # Expression against expression: ``a > b`` is ``b < a``, ``a >= b`` is ``not a < b``
+    if isinstance(op, ast.Gt):
+        return comparison(right, ast.Lt(), left)
+    if isinstance(op, ast.GtE):
+        return comparison(left, ast.Lt(), right)[0], False
+    if isinstance(op, ast.LtE):
+        return comparison(right, ast.Lt(), left)[0], False
+    if isinstance(op, ast.NotEq):
+        return comparison(left, ast.Eq(), right)[0], False
+    if isinstance(op, ast.NotIn):
+        return comparison(left, ast.In(), right)[0], False
+    if isinstance(op, ast.IsNot):
+        return comparison(left, ast.Is(), right)[0], False
+    if isinstance(op, ast.Eq) and subject > other and not isinstance(right, ast.Constant):
+        # Order the operands of ``a == b`` so that ``b == a`` is the same test
+        subject, other = other, subject
+    symbol = {ast.Lt: '<', ast.Eq: '==', ast.In: 'in', ast.Is: 'is'}[type(op)]
+    negated = {'<': '>=', '==': '!=', 'in': 'not in', 'is': 'is not'}[symbol]
+    return Predicate('%s %s %s' % (subject, symbol, other), '%s %s %s' % (subject, negated, other),
+                     subject, symbol, other=other), True
+
+
+def equal_text(first, second):
+    """Canonical text of ``first == second`` for two expressions."""
+    if first > second:
+        first, second = second, first
+    return '%s == %s' % (first, second)
+
+
+def parse_condition(text, where='condition'):
+    """
+    Split a condition string into (Predicate, expected) pairs.
+
+    ``a and b`` and chained comparisons (``14 < hour < 16``) become one
+    pair per test, ``not`` flips the expected result, and anything else
+    (``or``, calls, bare names) is one predicate.
+    """
+    try:
+        tree = ast.parse(text.strip(), mode='eval').body
+    except SyntaxError as exc:
+        raise ValueError('%s: cannot parse %r (%s)' % (where, text, exc.msg)) from None
+    check_sandbox(tree, where)
+    return _split(tree)
+
+
+def _split(node):
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        pairs = []
+        for value in node.values:
+            pairs.extend(_split(value))
+        return pairs
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        pairs = _split(node.operand)
+        if len(pairs) == 1:
+            return [(pairs[0][0], not pairs[0][1])]
+    if isinstance(node, ast.Compare):
+        pairs = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            predicate, expected = comparison(left, op, right)
+            predicate.spelling.setdefault(expected, ast.unparse(ast.Compare(left, [op], [right])))
+            pairs.append((predicate, expected))
+            left = right
+        return pairs
+    text = ast.unparse(node)
+    return [(Predicate(text, 'not %s' % _wrap(node, text)), True)]
+
+
+def _wrap(node, text):
+    return text if isinstance(node, (ast.Name, ast.Attribute, ast.Call, ast.Subscript)) else '(%s)' % text
+
+
+def parse_rules(rules):
+    """
+    Validate a rule table and return its rules, highest priority first.
+
+    Conditions that mean the same test share one Predicate, so a result
+    learnt for one rule is reused by the others.  Raises ValueError for a
+    malformed row.
+    """
+    predicates = {}
+    parsed = []
+    for order, (name, row) in enumerate(rules.items()):
+        if not isinstance(row, dict):
+            raise ValueError('rule %s: expected a dict' % name)
+        unknown = sorted(set(row) - set(RULE_KEYS))
+        if unknown:
+            raise ValueError('rule %s: unknown keys %s' % (name, ', '.join(unknown)))
+        priority = row.get('priority')
+        if isinstance(priority, bool) or not isinstance(priority, int):
+            raise ValueError('rule %s: priority must be an int' % name)
+        if not isinstance(row.get('action'), str):
+            raise ValueError('rule %s: action must be a string' % name)
+        when = row.get('when', [])
+        if isinstance(when, str):
+            when = [when]
+        assign = dict(row.get('set') or {})
+        for key, value in assign.items():
+            if not key.isidentifier():
+                raise ValueError('rule %s: cannot set %r' % (name, key))
+            check_sandbox(ast.parse(repr(value), mode='eval'), 'rule %s' % name)
+        conditions = []
+        for text in when:
+            for predicate, expected in parse_condition(text, 'rule %s' % name):
+                shared = predicates.setdefault(predicate.text, predicate)
+                if shared.local is None:
+                    shared.local = 'rule_test_%d' % len(predicates)
+                for result, text in predicate.spelling.items():
+                    shared.spelling.setdefault(result, text)
+                conditions.append((shared, expected))
+        parsed.append(Rule(name, priority, conditions, row['action'], row.get('reason'), assign, order))
+    parsed.sort(key=lambda rule: (-rule.priority, rule.order))
+    return parsed
+
+
+class Facts:
+    """
+    Predicate results known on one branch, plus the range of values each
+    numeric subject can still take.
+    """
+    __slots__ = ('known', 'ranges')
+
+    def __init__(self, known=None, ranges=None):
+        self.known = known or {}
+        # subject -> [low, low_inclusive, high, high_inclusive]
+        self.ranges = ranges or {}
+
+    def learn(self, predicate, result):
+        """A copy of these facts with ``predicate`` known to be ``result``."""
+        known = dict(self.known)
+        known[predicate.text] = result
+        if predicate.other is not None and result and predicate.op in ('<', '=='):
+            # a < b rules out b < a and a == b; a == b rules out both orders
+            subject, other = predicate.subject, predicate.other
+            known['%s < %s' % (other, subject)] = False
+            if predicate.op == '<':
+                known[equal_text(subject, other)] = False
+            else:
+                known['%s < %s' % (subject, other)] = False
+        ranges = self.ranges
+        bounds = accepted(predicate, result)
+        if bounds is not None:
+            ranges = dict(ranges)
+            ranges[predicate.subject] = intersect(ranges.get(predicate.subject, FULL_RANGE), bounds)
+        return Facts(known, ranges)
+
+    def decide(self, predicate):
+        """True or False if the facts settle ``predicate``, otherwise None."""
+        result = self.known.get(predicate.text)
+        if result is not None or predicate.value is None:
+            return result
+        current = self.ranges.get(predicate.subject)
+        if current is None:
+            return None
+        bounds = accepted(predicate, True)
+        if intersect(current, bounds) == current:
+            return True
+        if empty(intersect(current, bounds)):
+            return False
+        return None
+
+
+FULL_RANGE = [float('-inf'), False, float('inf'), False]
+
+
+def accepted(predicate, result):
+    """The range of values for which ``predicate`` is ``result``, or None if not a range."""
+    value = predicate.value
+    if value is None:
+        return None
+    if predicate.op == '<':
+        return [float('-inf'), False, value, False] if result else [value, True, float('inf'), False]
+    if predicate.op == '<=':
+        return [float('-inf'), False, value, True] if result else [value, False, float('inf'), False]
+    if predicate.op == '==' and result:
+        return [value, True, value, True]
+    return None
+
+
+def intersect(first, second):
+    # At the same bound the exclusive one is tighter
+    low, low_open = max((first[0], not first[1]), (second[0], not second[1]))
+    high, high_inclusive = min((first[2], first[3]), (second[2], second[3]))
+    return [low, not low_open, high, high_inclusive]
+
+
+def empty(bounds):
+    return bounds[0] > bounds[2] or (bounds[0] == bounds[2] and not (bounds[1] and bounds[3]))
+
+
+def _possible(rules, facts):
+    """The rules whose conditions ``facts`` do not rule out."""
+    candidates = []
+    for rule in rules:
+        possible = True
+        for predicate, expected in rule.conditions:
+            if facts.decide(predicate) is (not expected):
+                possible = False
+                break
+        if possible:
+            candidates.append(rule)
+    return candidates
+
+
+def _chain(candidates, facts):
+    steps = []
+    for rule in candidates:
+        conditions = []
+        possible = True
+        for predicate, expected in rule.conditions:
+            result = facts.decide(predicate)
+            if result is None:
+                conditions.append((predicate, expected))
+            elif result is not expected:
+                possible = False
+                break
+        if not possible:
+            continue
+        steps.append((rule, conditions))
+        if not conditions:
+            break
+        if len(conditions) == 1:
+            # Later steps only run when this test failed
+            facts = facts.learn(conditions[0][0], not conditions[0][1])
+    counts = {}
+    hoisted = []
+    for _, conditions in steps:
+        for predicate, _ in conditions:
+            counts[predicate.text] = counts.get(predicate.text, 0) + 1
+            if counts[predicate.text] == 2:
+                hoisted.append(predicate)
+    return Chain(steps, hoisted)
+
+
+def _ladder_tests(candidates, facts):
+    """Tests the if/elif ladder of ``candidates`` emits."""
+    return _chain(candidates, facts).tests()
+
+
+def _shares_tests(candidates, facts):
+    """True if two of ``candidates`` still test the same predicate or subject."""
+    owners = {}
+    for rule in candidates:
+        for predicate, _ in rule.conditions:
+            if facts.decide(predicate) is None:
+                subject = predicate.text if predicate.subject is None else predicate.subject
+                owners.setdefault(subject, set()).add(rule.order)
+    return any(len(rules) > 1 for rules in owners.values())
+
+
+def build_tree(rules, facts=None, budget=None):
+    """
+    Decision tree for ``rules`` (from parse_rules), or None when no rule
+    can match.
+
+    The first rule still possible decides what to test next: of its
+    conditions the facts do not settle, the first one, or a safe one
+    (see Predicate.safe) that more of the remaining rules share.  Each
+    branch then drops the rules the new fact rules out.
+
+    Each test copies the rules after it into both branches, so a branch
+    whose rules share no test ends in a Chain, the plain ladder.  So does
+    every branch once the tree would emit more than ``budget`` tests in
+    all (None: no limit); the ladder alone is emitted when it is longer.
+    A ladder that would have to hoist a test that is not safe to run
+    early keeps splitting instead, whatever the budget.
+    """
+    facts = facts or Facts()
+    candidates = _possible(rules, facts)
+    if budget is not None and not isinstance(budget, list):
+        # What the tree may add to the ladder's tests, shared by every branch
+        budget = [budget - _ladder_tests(candidates, facts)]
+    if not candidates:
+        return None
+    first = candidates[0]
+    pending = [pair for pair in first.conditions if facts.decide(pair[0]) is None]
+    if not pending:
+        return Leaf(first)
+    if not _shares_tests(candidates, facts):
+        return _chain(candidates, facts)
+    shared = {}
+    for rule in candidates:
+        for predicate, expected in rule.conditions:
+            shared[predicate.text] = shared.get(predicate.text, 0) + 1
+    predicate, expected = pending[0]
+    for pair in pending[1:]:
+        if pair[0].safe and shared[pair[0].text] > shared[predicate.text]:
+            predicate, expected = pair
+    true_facts = facts.learn(predicate, True)
+    false_facts = facts.learn(predicate, False)
+    if budget is not None:
+        extra = (1 + _ladder_tests(_possible(candidates, true_facts), true_facts)
+                 + _ladder_tests(_possible(candidates, false_facts), false_facts)
+                 - _ladder_tests(candidates, facts))
+        chain = _chain(candidates, facts) if extra > budget[0] else None
+        if chain is not None and all(hoisted.safe for hoisted in chain.hoisted):
+            return chain
+        budget[0] -= extra
+    when_true = build_tree(candidates, true_facts, budget)
+    when_false = build_tree(candidates, false_facts, budget)
+    if _key(when_true) == _key(when_false):
+        # Both outcomes lead to the same assignments: no need to test
+        return when_true
+    return Node(predicate, when_true, when_false, expected)
+
+
+def tree_stats(tree):
+    """Number of tests and leaves and the longest path (in tests) of a tree."""
+    if tree is None:
+        return {'tests': 0, 'leaves': 0, 'depth': 0}
+    if isinstance(tree, Leaf):
+        return {'tests': 0, 'leaves': 1, 'depth': 0}
+    if isinstance(tree, Chain):
+        tests = tree.tests()
+        return {'tests': tests, 'leaves': len(tree.steps), 'depth': tests}
+    when_true = tree_stats(tree.when_true)
+    when_false = tree_stats(tree.when_false)
+    return {'tests': 1 + when_true['tests'] + when_false['tests'],
+            'leaves': when_true['leaves'] + when_false['leaves'],
+            'depth': 1 + max(when_true['depth'], when_false['depth'])}
+
+
+def _assignments(rule):
+    lines = ['action = %r' % rule.action]
+    if rule.reason is not None:
+        lines.append('reason = %r' % rule.reason)
+    for key, value in rule.assign.items():
+        lines.append('%s = %r' % (key, value))
+    return lines
+
+
+def _spell(predicate, expected):
+    if expected:
+        return predicate.spelling.get(True, predicate.text)
+    return predicate.spelling.get(False, predicate.negated_text)
+
+
+def _operand(text):
+    # ``a or b`` needs brackets to be one operand of ``and``
+    node = ast.parse(text, mode='eval').body
+    return '(%s)' % text if isinstance(node, (ast.BoolOp, ast.IfExp, ast.NamedExpr)) else text
+
+
+def _test_lines(pad, keyword, texts):
+    """``keyword texts[0] and texts[1] ...:``, one test per line when too long."""
+    if len(texts) == 1:
+        line = '%s%s %s:' % (pad, keyword, texts[0])
+    else:
+        texts = [_operand(text) for text in texts]
+        line = '%s%s %s:' % (pad, keyword, ' and '.join(texts))
+    if len(line) <= MAX_LINE_LENGTH or len(texts) == 1:
+        return [line]
+    lines = ['%s%s (%s' % (pad, keyword, texts[0])]
+    lines.extend('%s        and %s' % (pad, text) for text in texts[1:])
+    lines[-1] += '):'
+    return lines
+
+
+def _assignment_lines(pad, line):
+    """``name = 'text'``, split into implicitly joined strings when too long."""
+    if len(pad + line) <= MAX_LINE_LENGTH:
+        return [pad + line]
+    name, value = line.split(' = ', 1)
+    try:
+        text = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return [pad + line]
+    lead = '%s%s = (' % (pad, name)
+    width = MAX_LINE_LENGTH - len(lead) - 3
+    if not isinstance(text, str) or width < 20:
+        return [pad + line]
+    chunks = ['']
+    for word in text.split(' '):
+        if chunks[-1] and len(repr(chunks[-1] + word)) - 2 > width:
+            chunks.append('')
+        chunks[-1] += word + ' '
+    chunks[-1] = chunks[-1][:-1]
+    lines = [lead + repr(chunks[0])]
+    lines.extend(' ' * len(lead) + repr(chunk) for chunk in chunks[1:])
+    lines[-1] += ')'
+    return lines
+
+
+def _hoist_lines(pad, predicate):
+    """``rule_test_N = <predicate>``, bracketed over three lines when too long."""
+    text = _spell(predicate, True)
+    line = '%s%s = %s' % (pad, predicate.local, text)
+    if len(line) <= MAX_LINE_LENGTH:
+        return [line]
+    return ['%s%s = (' % (pad, predicate.local), '%s    %s' % (pad, text), pad + ')']
+
+
+def _emit_leaf(rule, pad, lines):
+    for line in _assignments(rule):
+        lines.extend(_assignment_lines(pad, line))
+
+
+def _emit(tree, indent, lines, keyword='if'):
+    pad = '    ' * indent
+    if isinstance(tree, Leaf):
+        _emit_leaf(tree.rule, pad, lines)
+        return
+    if isinstance(tree, Chain):
+        stored = set()
+        for rule, conditions in tree.steps:
+            hoist = [predicate for predicate, _ in conditions
+                     if predicate in tree.hoisted and predicate.text not in stored]
+            if hoist and keyword == 'elif':
+                # Store the shared results inside the else of the steps so far
+                lines.append(pad + 'else:')
+                pad += '    '
+                keyword = 'if'
+            for predicate in hoist:
+                lines.extend(_hoist_lines(pad, predicate))
+                stored.add(predicate.text)
+            if conditions:
+                texts = []
+                for predicate, expected in conditions:
+                    if predicate in tree.hoisted:
+                        texts.append(predicate.local if expected else 'not ' + predicate.local)
+                    else:
+                        texts.append(_spell(predicate, expected))
+                lines.extend(_test_lines(pad, keyword, texts))
+            else:
+                lines.append(pad + 'else:')
+            _emit_leaf(rule, pad + '    ', lines)
+            keyword = 'elif'
+        return
+    predicate = tree.predicate
+    if tree.polarity:
+        first, second = tree.when_true, tree.when_false
+    else:
+        first, second = tree.when_false, tree.when_true
+    lines.extend(_test_lines(pad, keyword, [_spell(predicate, tree.polarity)]))
+    if first is None:
+        lines.append(pad + '    pass')
+    else:
+        _emit(first, indent + 1, lines)
+    if isinstance(second, (Node, Chain)):
+        _emit(second, indent, lines, 'elif')
+    elif second is not None:
+        lines.append(pad + 'else:')
+        _emit(second, indent + 1, lines)
+
+
+def compile_rules(rules, indent=0, source='RULES', max_tests=MAX_TESTS):
+    """
+    Sandbox-safe Python for a rule table: nested if/elif blocks that set
+    ``action``, ``reason`` and the rule's ``set`` variables.  Nothing is
+    assigned when no rule matches, so a table without a catch-all rule
+    (empty ``when``) leaves the script's earlier values in place.
+
+    The output holds at most ``max_tests`` tests (None: no limit) unless
+    the ladder alone needs more; branches past the budget stay a ladder.
+    """
+    parsed = parse_rules(rules)
+    tree = build_tree(parsed, budget=max_tests)
+    stats = tree_stats(tree)
+    pad = '    ' * indent
+    lines = ['%s# Compiled from %s by rule_compiler.py:' % (pad, source),
+             '%s# %d rules, %d tests, at most %d per decision'
+             % (pad, len(parsed), stats['tests'], stats['depth'])]
+    if tree is None:
+        lines.append(pad + 'pass')
+    else:
+        _emit(tree, indent, lines)
+    return '\n'.join(lines) + '\n'
+
+
+def evaluate_chain(rules, env):
+    """
+    Decide like an if/elif chain: rules in priority order, each testing its
+    conditions until one fails.  Returns (rule, tests made).
+    """
+    tests = 0
+    for rule in rules:
+        matched = True
+        for predicate, expected in rule.conditions:
+            tests += 1
+            if bool(eval(predicate.code, env)) is not expected:  # pylint: disable=eval-used
+                matched = False
+                break
+        if matched:
+            return rule, tests
+    return None, tests
+
+
+def evaluate_tree(tree, env):
+    """Walk the decision tree for ``env``.  Returns (rule, tests made)."""
+    tests = 0
+    while isinstance(tree, Node):
+        tests += 1
+        if eval(tree.predicate.code, env):  # pylint: disable=eval-used
+            tree = tree.when_true
+        else:
+            tree = tree.when_false
+    if isinstance(tree, Chain):
+        results = {}
+        for rule, conditions in tree.steps:
+            for predicate, _ in conditions:
+                if predicate in tree.hoisted and predicate.text not in results:
+                    tests += 1
+                    results[predicate.text] = bool(eval(predicate.code, env))  # pylint: disable=eval-used
+            matched = True
+            for predicate, expected in conditions:
+                if predicate.text in results:
+                    result = results[predicate.text]
+                else:
+                    tests += 1
+                    result = bool(eval(predicate.code, env))  # pylint: disable=eval-used
+                if result is not expected:
+                    matched = False
+                    break
+            if matched:
+                return rule, tests
+        return None, tests
+    return (tree.rule if tree is not None else None), tests
+
+
+def count_comparisons(rules, envs, max_tests=MAX_TESTS):
+    """
+    Tests per decision of the chain and of the compiled tree over ``envs``
+    (dicts of script variables).  Raises AssertionError if the two ever
+    assign different values.
+    """
+    parsed = parse_rules(rules)
+    tree = build_tree(parsed, budget=max_tests)
+    chain_tests = []
+    tree_tests = []
+    for env in envs:
+        chain_rule, chain_count = evaluate_chain(parsed, env)
+        tree_rule, tree_count = evaluate_tree(tree, env)
+        if _key(chain_rule and Leaf(chain_rule)) != _key(tree_rule and Leaf(tree_rule)):
+            raise AssertionError('chain picked %s, tree picked %s for %r' % (
+                chain_rule and chain_rule.name, tree_rule and tree_rule.name, env))
+        chain_tests.append(chain_count)
+        tree_tests.append(tree_count)
+    decisions = len(chain_tests) or 1
+    return {
+        'decisions': len(chain_tests),
+        'chain_mean': sum(chain_tests) / decisions,
+        'chain_max': max(chain_tests, default=0),
+        'tree_mean': sum(tree_tests) / decisions,
+        'tree_max': max(tree_tests, default=0),
+    }
+
+
+def sample_envs(rules, count, seed=None):
+    """
+    Random variable values for the names a table tests, for benchmarking.
+
+    Names compared with something get numbers spread over the table's
+    numeric thresholds (or one of the strings they are compared with), and
+    names tested on their own get booleans.  Raises ValueError for
+    attributes, calls or subscripts, which need recorded inputs instead.
+    """
+    numbers = [0.0, 100.0]
+    strings = {}
+    compared = set()
+    alone = set()
+    for row in rules.values():
+        when = row.get('when', [])
+        for text in [when] if isinstance(when, str) else when:
+            tree = ast.parse(text.strip(), mode='eval').body
+            for node in ast.walk(tree):
+                if isinstance(node, (ast.Attribute, ast.Call, ast.Subscript)):
+                    raise ValueError('cannot sample %r; benchmark it on recorded payloads' % ast.unparse(node))
+                if isinstance(node, ast.Compare):
+                    operands = [node.left] + node.comparators
+                    names = [operand.id for operand in operands if isinstance(operand, ast.Name)]
+                    compared.update(names)
+                    for operand in operands:
+                        if number(operand) is not None:
+                            numbers.append(float(number(operand)))
+                        elif isinstance(operand, ast.Constant) and isinstance(operand.value, str):
+                            for name in names:
+                                strings.setdefault(name, set()).add(operand.value)
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Name) and node.id not in compared:
+                    alone.add(node.id)
+    low = min(numbers)
+    high = max(numbers)
+    spread = (high - low) * 0.25 or 1.0
+    rng = random.Random(seed)
+    envs = []
+    for _ in range(count):
+        env = {}
+        for name in sorted(compared):
+            if name in strings:
+                env[name] = rng.choice(sorted(strings[name]) + [''])
+            else:
+                env[name] = round(rng.uniform(low - spread, high + spread), 2)
+        for name in sorted(alone - compared):
+            env[name] = rng.random() < 0.5
+        envs.append(env)
+    return envs
+
+
+def load_rules(path):
+    """
+    Read a rule table from a JSON file or from the ``RULES = {...}``
+    assignment of a Python file (which is not executed).
+    """
+    with open(path, 'r', encoding='UTF-8') as file:
+        text = file.read()
+    if path.endswith('.json'):
+        return json.loads(text)
+    for stmt in ast.parse(text, path).body:
+        if (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and isinstance(stmt.targets[0], ast.Name)
+                and stmt.targets[0].id == 'RULES'):
+            return ast.literal_eval(stmt.value)
+    raise ValueError('%s has no RULES = {...} assignment' % path)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compile a rule table into a sandbox-safe decision tree')
+    parser.add_argument('rules', help='JSON file or Python file with a RULES dict')
+    parser.add_argument('--output', help='write the compiled code here instead of stdout')
+    parser.add_argument('--indent', type=int, default=0, help='indent level of the emitted block')
+    parser.add_argument('--max-tests', type=int, default=MAX_TESTS,
+                        help='tests emitted in all before falling back to the if/elif ladder; -1 for no limit')
+    parser.add_argument('--samples', type=int, default=0, help='compare tests per decision on N random inputs')
+    parser.add_argument('--payloads', help='compare tests per decision on recorded action_params payloads')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    rules = load_rules(args.rules)
+    max_tests = None if args.max_tests < 0 else args.max_tests
+    code = compile_rules(rules, args.indent, args.rules, max_tests)
+    from bundle import problems
+
+    found = problems(textwrap.dedent(code), MAX_LINE_LENGTH - 4 * args.indent)
+    for problem in found:
+        print('%s: %s' % (args.rules, problem), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as file:
+            file.write(code)
+    else:
+        sys.stdout.write(code)
+    envs = []
+    if args.payloads:
+        from replay import read_payloads
+        from script_runner import build_globals, params_from_payload
+
+        for payload in read_payloads(args.payloads):
+            env = build_globals()
+            env.update(params_from_payload(payload))
+            envs.append(env)
+    if args.samples:
+        envs.extend(sample_envs(rules, args.samples, args.seed))
+    if envs:
+        counts = count_comparisons(rules, envs, max_tests)
+        print('%d decisions: if/elif chain %.2f tests (max %d), compiled tree %.2f tests (max %d), %.0f%% fewer'
+              % (counts['decisions'], counts['chain_mean'], counts['chain_max'], counts['tree_mean'],
+                 counts['tree_max'], 100.0 * (1 - counts['tree_mean'] / (counts['chain_mean'] or 1))),
+              file=sys.stderr)
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
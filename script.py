@@ -70,15 +70,54 @@ def update_reason(facility_name, buy_price, sell_price, lowest_buy_price, highes
     Returns:
     - str: The updated reason message, trimmed to 256 characters if necessary.
     """
-    additional_info = ", ".join([f"{key}={value}" for key, value in kwargs.items()])
-    reason = (f"{facility_name}: {base_reason}. Buy: {buy_price:.1f}c, Sell: {sell_price:.1f}c, Low Buy: {lowest_buy_price:.1f}c ({hours_until_lowest_buy}h), "  # noqa
-              f"High Sell: {highest_sell_price:.1f}c ({hours_until_highest_sell}h), Load: {house_load:,.0f}W, Req Min SOC: {required_min_soc:.1f}, "
-              f"Code: {code} Hr to SRise: {hours_until_sunrise_plus_active:.1f}h, Hr to SSet: {hours_until_sunset_minus_active:.1f}h. {local_time} "
-              f"{additional_info}")
+    # Built part by part; parts past the 256-character cut are never formatted
+    reason = (f"{facility_name}: {base_reason}. Buy: {buy_price:.1f}c, Sell: {sell_price:.1f}c, Low Buy: {lowest_buy_price:.1f}c ({hours_until_lowest_buy}h), ")  # noqa
+    if len(reason) < 256:
+        reason += f"High Sell: {highest_sell_price:.1f}c ({hours_until_highest_sell}h), Load: {house_load:,.0f}W, Req Min SOC: {required_min_soc:.1f}, "
+    if len(reason) < 256:
+        reason += f"Code: {code} Hr to SRise: {hours_until_sunrise_plus_active:.1f}h, Hr to SSet: {hours_until_sunset_minus_active:.1f}h. {local_time} "
+    if len(reason) < 256 and kwargs:
+        reason += ", ".join([f"{key}={value}" for key, value in kwargs.items()])
 
     # Trim the reason to ensure it does not exceed 256 characters
     return reason[:256]
 
+
+def best_spread(buy_prices, sell_prices):
+    """
+    Best buy-now/sell-later spread in one backward suffix-maximum scan.
+
+    For each buy period i the dearest sell period j > i is kept while
+    walking back from the end, so the whole search is O(n).  exists is
+    True when some buy price is below a later sell price.  Ties prefer
+    the earliest buy and the earliest sell period.
+    """
+    best_buy = -1
+    best_sell = -1
+    spread = None
+    sell_max = None
+    sell_max_index = -1
+    i = max(len(buy_prices), len(sell_prices)) - 1
+    while i >= 0:
+        if i < len(buy_prices) and sell_max_index >= 0:
+            gain = sell_max - buy_prices[i]
+            if spread is None or gain >= spread:
+                spread = gain
+                best_buy = i
+                best_sell = sell_max_index
+        if i < len(sell_prices):
+            if sell_max_index < 0 or sell_prices[i] >= sell_max:
+                sell_max = sell_prices[i]
+                sell_max_index = i
+        i = i - 1
+    return {
+        "exists": spread is not None and spread > 0,
+        "spread": spread,
+        "buy_index": best_buy,
+        "sell_index": best_sell,
+    }
+
+
 # Initialize the code tracking variable
 code = ''
 
@@ -158,15 +197,17 @@ try:
     if not sell_forecast or not isinstance(sell_forecast, list) or any(v <= 0 for v in sell_forecast):
         raise ValueError("Invalid sell_forecast")
 
-    # Apply the discount to forecasted buy prices up to future_forecast_hours
+    # Apply the discount to forecasted buy and sell prices up to future_forecast_hours,
+    # compounding one factor per hour rather than raising it to a power per element
+    buy_factor = 1.0
+    sell_factor = 1.0
     for i in range(int(future_forecast_hours)):
         if i < len(buy_forecast):
-            discounted_buy_forecast.append(buy_forecast[i] * ((1 + uncertainty_discount) ** i))
-
-    # Apply the discount to forecasted sell prices up to future_forecast_hours
-    for i in range(int(future_forecast_hours)):
+            discounted_buy_forecast.append(buy_forecast[i] * buy_factor)
         if i < len(sell_forecast):
-            discounted_sell_forecast.append(sell_forecast[i] * ((1 - uncertainty_discount) ** i))
+            discounted_sell_forecast.append(sell_forecast[i] * sell_factor)
+        buy_factor *= 1 + uncertainty_discount
+        sell_factor *= 1 - uncertainty_discount
 except ValueError as e:  # noqa
     # If an error occurs, assign default values
     discounted_buy_forecast = [100000] * int(future_forecast_hours)
@@ -182,27 +223,20 @@ cutoff_index = min(len(discounted_buy_forecast), int(solar_active_hours)) # noqa
 # Set default behavior for day & night if no other conditions applies (Code = C)
 #
 
+# Each branch only records its base reason; the full reason is formatted
+# once, after the last branch that applies
+reason_time = local_time
 if daytime:
     action = 'auto'
     solar = 'export'
     code += 'Day, '
-    reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-        effective_house_power, sunrise_plus_active, sunset_minus_active, 'Daytime Default: No other rule applies',
-        required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, local_time
-    )
+    reason_base = 'Daytime Default: No other rule applies'
 
 else:
     action = 'auto'
     solar = 'export'
     code += 'Night, '
-    reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-        effective_house_power, sunrise_plus_active, sunset_minus_active, 'Night Default: No other rule applies',
-        required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, local_time,
-    )
+    reason_base = 'Night Default: No other rule applies'
 
 # Ensure the battery is fully charged for the evening peak event (Code = D)
 if battery_soc < full_battery and (
@@ -211,64 +245,35 @@ if battery_soc < full_battery and (
     action = 'import'
     solar = 'export'
     code += 'Chg for Peak or Opportunistic Buy, '
-    reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-        effective_house_power, sunrise_plus_active, sunset_minus_active,
-        'IMPORT to reach full battery by 4 PM or Opportunistic Buy',
-        required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, interval_time
-    )
+    reason_base = 'IMPORT to reach full battery by 4 PM or Opportunistic Buy'
+    reason_time = interval_time
 # Always sell if sell price is greater than always sell price.
 elif sell_price >= always_sell_price and battery_soc > min_sell_soc:
     action = 'export'
     solar = 'export'
     code += 'Always Sell, '
-    reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-        effective_house_power, sunrise_plus_active, sunset_minus_active,
-        'Sell price exceeds the always sell price',
-        required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, local_time
-    )
+    reason_base = 'Sell price exceeds the always sell price'
 
 # Evaluate for negative feed-in tariff scenarios and end script if any test positive.
 elif buy_price <= 0.0 and battery_soc < full_battery:
     action = 'import'
     solar = 'curtail'
     code += 'Neg FiT Import, '
-    reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-        effective_house_power, sunrise_plus_active, sunset_minus_active,
-        'Negative FiT: If buy price is <= 0, IMPORT electricity and CURTAIL solar', required_min_soc, code, hours_until_sunrise_plus_active,
-        hours_until_sunset_minus_active, local_time
-    )
+    reason_base = 'Negative FiT: If buy price is <= 0, IMPORT electricity and CURTAIL solar'
 
 # If EXPORT is more expensive than buy, action CHARGE and CURTAIL solar.
 elif sell_price < 0.0 and buy_price < abs(sell_price) and battery_soc > full_battery:
     action = 'auto'
     solar = 'curtail'
     code += 'Neg FiT Auto, '
-    reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-        effective_house_power, sunrise_plus_active, sunset_minus_active,
-        'Negative FiT: If EXPORT is more expensive than buy, action CHARGE and CURTAIL solar', required_min_soc, code,
-        hours_until_sunrise_plus_active, hours_until_sunset_minus_active, local_time
-    )
+    reason_base = 'Negative FiT: If EXPORT is more expensive than buy, action CHARGE and CURTAIL solar'
 
 # If sell price < 0, action CHARGE and CURTAIL solar.
 elif sell_price < 0.0 and battery_soc > full_battery:
     action = 'auto'
     solar = 'curtail'
     code += 'Neg FiT Neg Sell, '
-    reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-        effective_house_power, sunrise_plus_active, sunset_minus_active,
-        'Negative FiT: If sell price < 0, action CHARGE and CURTAIL solar', required_min_soc, code, hours_until_sunrise_plus_active,
-        hours_until_sunset_minus_active, local_time
-    )
+    reason_base = 'Negative FiT: If sell price < 0, action CHARGE and CURTAIL solar'
 
 # Use solar power to meet house demand and charge batteries when available
 elif daytime:
@@ -276,24 +281,12 @@ elif daytime:
         action = 'export'
         solar = 'export'
         code += 'Daytime and hi SoC, '
-        reason = update_reason(
-            facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-            discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-            effective_house_power, sunrise_plus_active, sunset_minus_active,
-            'PV > 0 and high SoC: EXPORT excess',
-            required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, local_time
-        )
+        reason_base = 'PV > 0 and high SoC: EXPORT excess'
     else:
         action = 'auto'
         solar = 'export'
         code += 'PV > 0 and lo SoC, '
-        reason = update_reason(
-            facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-            discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-            effective_house_power, sunrise_plus_active, sunset_minus_active,
-            'PV > 0 and low SoC or low Sell Price',
-            required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, local_time
-        )
+        reason_base = 'PV > 0 and low SoC or low Sell Price'
 
 # Evaluate forecast-based buy/sell decisions based on Powston 8-hour buy/sell forecasts (Code = E)
 else:
@@ -307,24 +300,12 @@ else:
         action = 'export'
         solar = 'export'
         code += 'Sell Now, '
-        reason = update_reason(
-            facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-            discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-            effective_house_power, sunrise_plus_active, sunset_minus_active,
-            'Fcst: Max sell price now; EXPORT if SOC > required', required_min_soc, code, hours_until_sunrise_plus_active,
-            hours_until_sunset_minus_active, local_time
-        )
+        reason_base = 'Fcst: Max sell price now; EXPORT if SOC > required'
 
     # If could have sold, but battery SoC is too low, say so:
     elif sell_price >= max(discounted_sell_forecast) and sell_price >= min_sell_price:
         code += 'Could Sell; lo SoC, '
-        reason = update_reason(
-            facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-            discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-            effective_house_power, sunrise_plus_active, sunset_minus_active,
-            'Fcst: Max sell price now; SoC < required', required_min_soc, code, hours_until_sunrise_plus_active,
-            hours_until_sunset_minus_active, local_time
-        )
+        reason_base = 'Fcst: Max sell price now; SoC < required'
 
     # If the buy price for the current period is the lowest in the forecast,
     # the battery SOC is less than the min SOC, and the buy price is <= max_buy_price, charge only at night
@@ -336,49 +317,35 @@ else:
         action = 'import'
         solar = 'export'
         code += 'Buy Now, min SoC, '
-        reason = update_reason(
-            facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-            discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-            effective_house_power, sunrise_plus_active, sunset_minus_active,
-            'Fcst: Low buy price now; IMPORT if SOC < required and price <= max', required_min_soc, code, hours_until_sunrise_plus_active,
-            hours_until_sunset_minus_active, local_time
-        )
+        reason_base = 'Fcst: Low buy price now; IMPORT if SOC < required and price <= max'
 
     else:
-        # Check if there's any future buy price lower than any future sell price within the forecast
-        buy_sell_opportunity_exists = False
-        for i in range(len(discounted_buy_forecast)):
-            for j in range(i + 1, len(discounted_sell_forecast)):
-                if discounted_buy_forecast[i] < discounted_sell_forecast[j]:
-                    buy_sell_opportunity_exists = True
-                    break
-            if buy_sell_opportunity_exists:
-                break
+        # Best future buy-then-sell spread within the forecast (one O(n) scan)
+        opportunity = best_spread(discounted_buy_forecast, discounted_sell_forecast)
+        buy_sell_opportunity_exists = opportunity["exists"]
 
         if buy_sell_opportunity_exists and not (peak_time <= current_hour < peak_time_end):
             action = 'import'
             solar = 'export'
             code += 'Buy Low, Sell High, '
-            reason = update_reason(
-                facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-                discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-                effective_house_power, sunrise_plus_active, sunset_minus_active,
-                f'Fcst: {sell_price} Buy low, sell high opportunity exists', required_min_soc, code, hours_until_sunrise_plus_active,
-                hours_until_sunset_minus_active, local_time
-            )
+            reason_base = (f'Fcst: {sell_price} Buy low, sell high opportunity exists '
+                           f'({opportunity["spread"]:.1f}c, buy +{opportunity["buy_index"]}h, sell +{opportunity["sell_index"]}h)')
         else:
             # Buy if price low and battery soc low.
             if battery_soc < min_sell_soc and local_time < sunrise and buy_price < max_am_buy_price:
                 action = 'import'
                 solar = 'export'
                 code += 'Buy Low Battery, '
-                reason = update_reason(
-                    facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-                    discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
-                    effective_house_power, sunrise_plus_active, sunset_minus_active,
-                    'Fcst: Buy Low Battery', required_min_soc, code, hours_until_sunrise_plus_active,
-                    hours_until_sunset_minus_active, local_time
-                )
+                reason_base = 'Fcst: Buy Low Battery'
+
+lowest_buy_price = min(discounted_buy_forecast)
+highest_sell_price = max(discounted_sell_forecast)
+reason = update_reason(
+    facility_name, buy_price, sell_price, lowest_buy_price, highest_sell_price,
+    discounted_buy_forecast.index(lowest_buy_price), discounted_sell_forecast.index(highest_sell_price),
+    effective_house_power, sunrise_plus_active, sunset_minus_active, reason_base,
+    required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, reason_time
+)
 
 if 14 < interval_time.hour < 16 and battery_soc < 60 and action != 'import' and buy_price < 30:
     action = 'import'
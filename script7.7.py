@@ -167,7 +167,14 @@ def apply_discount(forecast, hours, discount_rate):
     """
     if not forecast or hours <= 0:
         return []
-    return [forecast[i] * ((1 + discount_rate) ** i) for i in range(min(hours, len(forecast)))]
+    # One multiply per period instead of a power per element
+    base = 1 + discount_rate
+    factor = 1.0
+    discounted = []
+    for i in range(min(hours, len(forecast))):
+        discounted.append(forecast[i] * factor)
+        factor = factor * base
+    return discounted
 
 
 def classify_solar(gti, cfg):
@@ -402,7 +409,12 @@ def smart_charging(soc, export_floor, buy_fc, sell_fc, buy_now, hour, battery_wh
 
     # Phase 1: Optimal timing to reach 100%
     if buy_now <= cfg["MAX_AM_BUY_PRICE"]:
-        sorted_buys = sorted(future_buys)
+        # Inlined rank_query (powston_helpers.py): count cheaper periods
+        # instead of sorting; buy_now is in the top N when fewer than N are
+        cheaper = 0
+        for price in future_buys:
+            if price < buy_now:
+                cheaper = cheaper + 1
         if periods_full >= periods_left:
             # Edge case: Need all remaining periods
             return {
@@ -410,7 +422,7 @@ def smart_charging(soc, export_floor, buy_fc, sell_fc, buy_now, hour, battery_wh
                 "priority": 50,
                 "reason": "Optimal charge @ %.2fc (need all %dp)" % (buy_now, periods_left),
             }
-        elif periods_full > 0 and buy_now <= sorted_buys[min(periods_full - 1, len(sorted_buys) - 1)]:
+        elif periods_full > 0 and cheaper < min(periods_full, len(future_buys)):
             # Normal case: Current price in top N cheapest
             return {
                 "should_charge": True,
@@ -515,22 +527,25 @@ def overnight_opportunities(sell_fc, hour, sunrise, soc, battery_wh, max_dischar
     if not periods:
         return None
 
-    # Sort by price (highest first) to find best opportunities
+    # Current period's rank in one counting pass: the overnight periods
+    # that sell dearer, plus one (ties rank behind it, as in the sort)
+    current_rank = None
+    if periods[0]["index"] == 0:
+        dearer = 0
+        for p in periods:
+            if p["price"] > periods[0]["price"]:
+                dearer = dearer + 1
+        current_rank = dearer + 1
+
+    # Sort by price (highest first), only for the reported best periods
     periods = sorted(periods, key=lambda x: x["price"], reverse=True)
     needed = max(1, int(drain_kwh / max_discharge_kwh + 0.999))
     best = periods[:min(needed, len(periods))]
 
-    # Find current period's rank in sorted list
-    current_rank = None
-    for idx in range(len(periods)):
-        if periods[idx]["index"] == 0:
-            current_rank = idx + 1
-            break
-
     return {
         "has_opportunities": True,
         "best_periods": best,
-        "current_is_good": 0 in [p["index"] for p in best],
+        "current_is_good": current_rank is not None and current_rank <= len(best),
         "current_rank": current_rank,
         "total_periods": len(periods),
         "periods_needed": needed,
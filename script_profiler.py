@@ -0,0 +1,263 @@
+"""
+Profile a decision script over recorded action_params payloads.
+
+Powston runs a script up to once a minute (ai_prompt.txt, rule 9), so a
+script has to stay cheap.  profile_script() runs a script through
+ScriptRunner and reports where each invocation spends its time:
+
+    profile = profile_script('script v8.26', ['tests/action_params2.json'], budget_ms=50)
+    print(profile.format())
+    assert not profile.over_budget
+
+Three passes are made over the payloads:
+
+- an untraced pass (``repeat`` runs per payload) for wall time and the
+  budget check,
+- a tracemalloc pass for peak memory and the bytes each section keeps,
+- a sys.settrace pass for per-line hit counts and traced time.
+
+Lines are grouped into sections: a helper function is one section, and in
+the main code every top-level comment block starts a new one, so the
+"# Priority 99 — ..." blocks, the timeline builders and the reason
+formatters each get their own row.  Traced time is inflated by the tracer
+itself; use it to compare sections, and wall time for the budget.
+
+    python script_profiler.py "script v8.26" tests/action_params2.json --budget-ms 50
+"""
+import ast
+import json
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+from script_runner import ScriptRunner, params_from_payload
+
+# Comment lines that only draw a banner rule (═══, ---, ===)
+BANNER = re.compile(r'^#\s*[═─=\-*]{3,}\s*$')
+# Version tags in front of section comments ("V8.15:", "NEW v7.13")
+VERSION_TAG = re.compile(r'^(?:NEW\s+)?[Vv]\d+(?:\.\d+)*:?\s*')
+LABEL_WIDTH = 48
+
+
+def section_label(comment):
+    """Short section name from a top-level comment line."""
+    text = comment.lstrip('#').strip()
+    text = VERSION_TAG.sub('', text)
+    if len(text) > LABEL_WIDTH:
+        text = text[:LABEL_WIDTH - 3] + '...'
+    return text
+
+
+def section_map(source):
+    """
+    Map each line number of ``source`` to the section it belongs to.
+
+    Lines of a top-level function belong to ``name()``.  Elsewhere the
+    first comment line of each unindented comment block (banner rules
+    skipped) names the section for the lines that follow it.
+    """
+    lines = source.splitlines()
+    sections = {}
+    for node in ast.parse(source).body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for lineno in range(node.lineno, node.end_lineno + 1):
+                sections[lineno] = node.name + '()'
+    current = 'module'
+    in_comment = False
+    for lineno, line in enumerate(lines, 1):
+        if lineno in sections:
+            in_comment = False
+            continue
+        if line.startswith('#') and not BANNER.match(line):
+            if not in_comment and section_label(line):
+                current = section_label(line)
+            in_comment = True
+        elif not BANNER.match(line):
+            in_comment = False
+        sections[lineno] = current
+    return sections
+
+
+def load_payloads(paths):
+    """Read recorded action_params payloads (one JSON object per file)."""
+    payloads = []
+    for path in paths:
+        with open(path, 'r', encoding='UTF-8') as file:
+            payloads.append(json.load(file))
+    return payloads
+
+
+class LineTracer:
+    """
+    sys.settrace hook counting line events and the time until the next
+    event, for frames executing one script only.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.hits = {}
+        self.seconds = {}
+        self.last_line = None
+        self.last_time = None
+
+    def __call__(self, frame, event, arg):
+        if frame.f_code.co_filename != self.filename:
+            return None
+        return self.trace_line
+
+    def trace_line(self, frame, event, arg):
+        now = time.perf_counter()
+        if self.last_line is not None:
+            self.seconds[self.last_line] = self.seconds.get(self.last_line, 0.0) + now - self.last_time
+        if event == 'line':
+            self.hits[frame.f_lineno] = self.hits.get(frame.f_lineno, 0) + 1
+            self.last_line = frame.f_lineno
+        self.last_time = time.perf_counter()
+        return self.trace_line
+
+    def stop(self):
+        """Charge the time since the last event and stop timing."""
+        if self.last_line is not None:
+            now = time.perf_counter()
+            self.seconds[self.last_line] = self.seconds.get(self.last_line, 0.0) + now - self.last_time
+        self.last_line = None
+
+
+class ScriptProfile:
+    """
+    Result of profile_script().
+
+    ``wall_ms`` holds the median untraced time of each payload, ``sections``
+    one dict per section (hits, traced ms, kept KiB), slowest first, and
+    ``hot_lines`` the slowest individual lines.
+    """
+
+    def __init__(self, filename, wall_ms, peak_kib, sections, hot_lines, budget_ms=None):
+        self.filename = filename
+        self.wall_ms = wall_ms
+        self.peak_kib = peak_kib
+        self.sections = sections
+        self.hot_lines = hot_lines
+        self.budget_ms = budget_ms
+
+    @property
+    def worst_ms(self):
+        """Slowest payload's median wall time."""
+        return max(self.wall_ms) if self.wall_ms else 0.0
+
+    @property
+    def over_budget(self):
+        return self.budget_ms is not None and self.worst_ms > self.budget_ms
+
+    def format(self):
+        """Plain-text report."""
+        out = ['%s: %d payload(s), worst %.2f ms, mean %.2f ms, peak %.1f KiB' % (
+            self.filename, len(self.wall_ms), self.worst_ms,
+            statistics.mean(self.wall_ms) if self.wall_ms else 0.0, self.peak_kib)]
+        if self.budget_ms is not None:
+            out.append('budget %.2f ms: %s' % (self.budget_ms, 'EXCEEDED' if self.over_budget else 'ok'))
+        total = sum(section['traced_ms'] for section in self.sections) or 1.0
+        out.append('')
+        out.append('%-*s %5s %8s %10s %6s %9s' % (
+            LABEL_WIDTH, 'section', 'line', 'hits', 'traced ms', '%', 'kept KiB'))
+        for section in self.sections:
+            out.append('%-*s %5d %8d %10.3f %5.1f%% %9.1f' % (
+                LABEL_WIDTH, section['section'], section['first_line'], section['hits'],
+                section['traced_ms'], 100.0 * section['traced_ms'] / total, section['kept_kib']))
+        out.append('')
+        out.append('hot lines:')
+        for line in self.hot_lines:
+            out.append('%5d %8d %10.3f  %s' % (line['line'], line['hits'], line['traced_ms'], line['text']))
+        return '\n'.join(out)
+
+
+def profile_script(filename, payloads, repeat=20, budget_ms=None, top=10, script_globals=None, **defaults):
+    """
+    Profile ``filename`` over ``payloads`` (dicts or paths to JSON files).
+
+    Keyword arguments are passed to the script on every call, as with
+    ScriptRunner (e.g. ``inverters={}`` for payloads recorded without it).
+    """
+    payloads = [load_payloads([payload])[0] if isinstance(payload, str) else payload for payload in payloads]
+    runner = ScriptRunner.from_file(filename, script_globals, **defaults)
+    prepared = [params_from_payload(payload) for payload in payloads]
+
+    def run_all():
+        for params in prepared:
+            params = dict(params)
+            runner.decide(params.pop('interval_time'), **params)
+
+    wall_ms = []
+    for params in prepared:
+        samples = []
+        for _ in range(max(1, repeat)):
+            kwargs = dict(params)
+            interval_time = kwargs.pop('interval_time')
+            start = time.perf_counter()
+            runner.decide(interval_time, **kwargs)
+            samples.append((time.perf_counter() - start) * 1000.0)
+        wall_ms.append(statistics.median(samples))
+
+    tracemalloc.start()
+    try:
+        run_all()
+        peak = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, filename)])
+    finally:
+        tracemalloc.stop()
+
+    tracer = LineTracer(filename)
+    previous = sys.gettrace()
+    sys.settrace(tracer)
+    try:
+        run_all()
+    finally:
+        sys.settrace(previous)
+        tracer.stop()
+
+    sections = section_map(runner.source)
+    source_lines = runner.source.splitlines()
+    rows = {}
+    for lineno, label in sorted(sections.items()):
+        if label not in rows:
+            rows[label] = {'section': label, 'first_line': lineno, 'hits': 0, 'traced_ms': 0.0, 'kept_kib': 0.0}
+    for lineno, hits in tracer.hits.items():
+        rows[sections.get(lineno, 'module')]['hits'] += hits
+    for lineno, seconds in tracer.seconds.items():
+        rows[sections.get(lineno, 'module')]['traced_ms'] += seconds * 1000.0
+    for stat in snapshot.statistics('lineno'):
+        label = sections.get(stat.traceback[0].lineno, 'module')
+        rows[label]['kept_kib'] += stat.size / 1024.0
+    ranked = sorted((row for row in rows.values() if row['hits']), key=lambda row: -row['traced_ms'])
+
+    hot_lines = []
+    for lineno in sorted(tracer.seconds, key=lambda lineno: -tracer.seconds[lineno])[:top]:
+        hot_lines.append({
+            'line': lineno,
+            'section': sections.get(lineno, 'module'),
+            'hits': tracer.hits.get(lineno, 0),
+            'traced_ms': tracer.seconds[lineno] * 1000.0,
+            'text': source_lines[lineno - 1].strip() if lineno <= len(source_lines) else '',
+        })
+    return ScriptProfile(filename, wall_ms, peak / 1024.0, ranked, hot_lines, budget_ms)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Profile a decision script over recorded action_params')
+    parser.add_argument('script')
+    parser.add_argument('payloads', nargs='+', help='action_params JSON files')
+    parser.add_argument('--repeat', type=int, default=20, help='untraced runs per payload')
+    parser.add_argument('--budget-ms', type=float, default=None, help='fail if a payload takes longer')
+    parser.add_argument('--top', type=int, default=10, help='hot lines to list')
+    args = parser.parse_args(argv)
+    profile = profile_script(args.script, args.payloads, args.repeat, args.budget_ms, args.top)
+    print(profile.format())
+    return 1 if profile.over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,337 @@
+"""
+Compile-once runner for Powston decision scripts.
+
+The notebook and sim_script.py used to open, read and compile() the user
+script on every simulated interval.  ScriptRunner compiles a script once,
+caches the code object by content hash and reuses a pre-built globals
+namespace, so InverterSimulator only pays for executing the script body.
+
+    runner = ScriptRunner.from_file('nsw_script.py', battery_capacity=25000)
+    sim = InverterSimulator(meter_data_df, runner.decide, ...)
+"""
+import ast
+import builtins
+import hashlib
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; only the state scripts use np
+    np = None
+
+# Code objects keyed by (sha256 of source, filename)
+_CODE_CACHE = {}
+
+# Payload keys the platform hands to scripts as datetimes, not strings
+DATETIME_KEYS = ('interval_time', 'sunrise', 'sunset', 'cached_time', 'lv_time', 'last_inverter_time')
+
+
+def source_digest(source):
+    """Return the sha256 hex digest used to key compiled scripts."""
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def compile_script(source, filename='<string>'):
+    """
+    Compile a decision script, reusing the cached code object when the
+    same source has been compiled before.
+    """
+    key = (source_digest(source), filename)
+    code = _CODE_CACHE.get(key)
+    if code is None:
+        code = compile(source, filename, 'exec')
+        _CODE_CACHE[key] = code
+    return code
+
+
+def clear_cache():
+    """Forget every cached code object."""
+    _CODE_CACHE.clear()
+
+
+def build_globals(extra=None):
+    """
+    Build the names the platform exposes to scripts.
+
+    ScriptRunner copies these into each interval's namespace and runs the
+    script in that one dict, as a module body runs.  With separate globals
+    and locals, a module-level comprehension or helper could not see the
+    script's own variables (``[... for i in range(n) if hour ...]`` in
+    v7.14.1 and v8.4 raised NameError).
+    """
+    namespace = {
+        '__builtins__': builtins,
+        'datetime': datetime,
+        'timedelta': timedelta,
+    }
+    if np is not None:
+        namespace['np'] = np
+    if extra:
+        namespace.update(extra)
+    return namespace
+
+
+def script_functions(source, filename='<string>', script_globals=None):
+    """
+    Define only the top-level functions of a script and return them by name.
+
+    The main body is not run, so a helper can be called on its own (tests,
+    benchmarks) without building a full set of script inputs.
+    """
+    tree = ast.parse(source, filename)
+    tree.body = [node for node in tree.body if isinstance(node, ast.FunctionDef)]
+    namespace = build_globals(script_globals)
+    exec(compile(tree, filename, 'exec'), namespace)  # pylint: disable=exec-used
+    return {node.name: namespace[node.name] for node in tree.body}
+
+
+def params_from_payload(payload):
+    """
+    Convert a recorded action_params payload (see tests/action_params1.json)
+    into script variables, parsing the ISO timestamps into datetimes.
+    """
+    params = dict(payload)
+    for key in DATETIME_KEYS:
+        value = params.get(key)
+        if isinstance(value, str):
+            try:
+                params[key] = datetime.fromisoformat(value)
+            except ValueError:
+                pass
+    return params
+
+
+def site_sun_table(defaults):
+    """
+    A sun_times.SunTable for the site described by ``defaults``: an astral
+    ``location`` (LocationInfo) or ``latitude`` and ``longitude`` with an
+    optional ``timezone``.  None when neither is given.
+    """
+    location = defaults.get('location')
+    if location is not None:
+        latitude = location.latitude
+        longitude = location.longitude
+        timezone = location.timezone
+    elif defaults.get('latitude') is not None and defaults.get('longitude') is not None:
+        latitude = defaults['latitude']
+        longitude = defaults['longitude']
+        timezone = defaults.get('timezone') or 'Australia/Brisbane'
+    else:
+        return None
+    from sun_times import SunTable  # astral is only needed for sites with coordinates
+    return SunTable(latitude, longitude, timezone)
+
+
+def latency_percentiles(latencies):
+    """p50 / p95 / p99 / max / mean of ``latencies`` (seconds) in ms."""
+    if not latencies:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0, 'mean_ms': 0.0}
+    ms = sorted(latency * 1000.0 for latency in latencies)
+
+    def percentile(fraction):
+        # Linear interpolation between closest ranks, as numpy.percentile does
+        position = (len(ms) - 1) * fraction
+        lower = int(position)
+        upper = min(lower + 1, len(ms) - 1)
+        return ms[lower] + (ms[upper] - ms[lower]) * (position - lower)
+
+    return {'p50_ms': percentile(0.50), 'p95_ms': percentile(0.95), 'p99_ms': percentile(0.99),
+            'max_ms': ms[-1], 'mean_ms': sum(ms) / len(ms)}
+
+
+def action_churn(actions):
+    """Number of intervals whose action differs from the previous one."""
+    actions = list(actions)
+    return sum(1 for before, after in zip(actions, actions[1:]) if before != after)
+
+
+class Decisions:
+    """
+    Stand-in for the platform's ``decisions`` object.
+
+    reason() records a candidate action; the highest priority wins and the
+    first call wins a tie.  The winning action is returned, as on Powston.
+    """
+
+    def __init__(self, default_action='auto'):
+        self.default_action = default_action
+        self.reset()
+
+    def reset(self):
+        """Forget every recorded decision."""
+        self.action = self.default_action
+        self.reason_text = ''
+        self.priority = None
+        self.details = {}
+
+    def reason(self, action, reason, priority=1, **kwargs):
+        if self.priority is None or priority > self.priority:
+            self.action = action
+            self.reason_text = reason
+            self.priority = priority
+            self.details = kwargs
+        return self.action
+
+
+class IntervalState:
+    """
+    Script namespace reused across the intervals of a simulator loop.
+
+    Building a fresh params dict per interval copies every payload key and
+    rebuilds the nested inverters / mqtt_data / weather_data dicts.  An
+    IntervalState copies ``fixed`` (defaults and payload keys that do not
+    change) once, and load() only resets the namespace and writes the
+    per-interval values.
+
+    ``columns`` maps a variable to a sequence indexed by interval.
+    ``paths`` maps a variable to the places it is written, each a tuple
+    of keys from the namespace (default ``(name,)``), e.g.
+    ``{'temperature_2m': [('weather_data', 'hourly', 'temperature_2m')]}``.
+    The dicts along a path are copied from ``fixed`` once and updated in
+    place afterwards, so scripts must treat them as read-only.
+    """
+
+    __slots__ = ('fixed', 'namespace', 'columns', 'targets')
+
+    def __init__(self, fixed=None, columns=None, paths=None):
+        self.fixed = dict(fixed or {})
+        self.namespace = {}
+        self.targets = {}
+        copied = set()
+        for name, name_paths in (paths or {}).items():
+            self.targets[name] = [self._container(path, copied) for path in name_paths]
+        self.columns = [(name, values, self.target(name)) for name, values in (columns or {}).items()]
+
+    def _container(self, path, copied):
+        """Copy the dicts along ``path`` once; return (dict, key) to write."""
+        container = self.fixed
+        for key in path[:-1]:
+            inner = container.get(key)
+            if id(inner) not in copied:
+                inner = dict(inner) if isinstance(inner, dict) else {}
+                container[key] = inner
+                copied.add(id(inner))
+            container = inner
+        if container is self.fixed:
+            container = self.namespace
+        return container, path[-1]
+
+    def target(self, name):
+        """Where ``name`` is written: a list of (dict, key)."""
+        targets = self.targets.get(name)
+        if targets is None:
+            targets = self.targets[name] = [(self.namespace, name)]
+        return targets
+
+    def load(self, i, **values):
+        """Reset the namespace for interval ``i`` and return it."""
+        namespace = self.namespace
+        namespace.clear()
+        namespace.update(self.fixed)
+        for _, column, targets in self.columns:
+            value = column[i]
+            for container, key in targets:
+                container[key] = value
+        for name, value in values.items():
+            for container, key in self.target(name):
+                container[key] = value
+        return namespace
+
+
+class ScriptRunner:
+    """
+    Execute a decision script many times without recompiling it.
+
+    Keyword arguments given to the constructor are passed to the script on
+    every call (battery_capacity, charge_rate, location, ...); keyword
+    arguments given to decide() override them for that interval.  With a
+    ``location`` or ``latitude``/``longitude`` (see site_sun_table),
+    decide() supplies each day's ``sunrise`` and ``sunset`` unless the
+    call passes them.
+    """
+
+    def __init__(self, source, filename='<string>', script_globals=None, **defaults):
+        self.source = source
+        self.filename = filename
+        self.digest = source_digest(source)
+        self.code = compile_script(source, filename)
+        self.globals = build_globals(script_globals)
+        self.decisions = Decisions()
+        self.defaults = {'action': 'auto', 'reason': 'default: auto'}
+        self.defaults.update(defaults)
+        self.sun_table = site_sun_table(self.defaults)
+        self.last_params = None
+
+    @classmethod
+    def from_file(cls, filename, script_globals=None, **defaults):
+        """Read and compile ``filename`` once."""
+        with open(filename, 'r', encoding='UTF-8') as file:
+            source = file.read()
+        return cls(source, filename, script_globals, **defaults)
+
+    def reload(self):
+        """Re-read the script from disk; recompiles only if it changed."""
+        with open(self.filename, 'r', encoding='UTF-8') as file:
+            source = file.read()
+        if source_digest(source) != self.digest:
+            self.source = source
+            self.digest = source_digest(source)
+            self.code = compile_script(source, self.filename)
+        return self
+
+    def run(self, params):
+        """
+        Execute the script with ``params`` as its namespace and return them.
+
+        ``params`` is used as-is, so callers that reuse one mapping across
+        intervals avoid rebuilding it.
+        """
+        self.decisions.reset()
+        params.update(self.globals)
+        params['decisions'] = self.decisions
+        exec(self.code, params)  # pylint: disable=exec-used
+        self.last_params = params
+        return params
+
+    def decide(self, interval_time, **kwargs):
+        """
+        Run the script for one interval and return ``(action, reason)``.
+
+        The signature matches the callback InverterSimulator expects.
+        Scripts that use decisions.reason() report the winning decision;
+        older scripts report their ``action`` and ``reason`` variables.
+        """
+        params = dict(self.defaults)
+        if self.sun_table is not None and interval_time is not None:
+            times = self.sun_table.lookup(interval_time)
+            params['sunrise'] = times['sunrise']
+            params['sunset'] = times['sunset']
+        params.update(kwargs)
+        params['interval_time'] = interval_time
+        self.run(params)
+        return self.result(params)
+
+    def decide_state(self, state, i, **values):
+        """
+        Run the script for interval ``i`` of an IntervalState and return
+        ``(action, reason)``; ``values`` are written for this interval only.
+
+        The runner's constructor defaults are not applied; put them in the
+        state's ``fixed`` values.
+        """
+        params = state.load(i, **values)
+        self.run(params)
+        return self.result(params)
+
+    def result(self, params):
+        """``(action, reason)`` of the last run with ``params``."""
+        if self.decisions.priority is not None:
+            return self.decisions.action, self.decisions.reason_text
+        return params.get('action', 'auto'), params.get('reason', '')
+
+    def decide_payload(self, payload):
+        """Run the script against a recorded action_params payload."""
+        params = params_from_payload(payload)
+        return self.decide(params.pop('interval_time'), **params)
+
+    __call__ = decide
@@ -129,11 +129,16 @@ def apply_uncertainty_discount(buy_list, sell_list, hours, buy_disc, sell_disc):
     discounted_sell = []
     limit = min(hours, max(len(buy_list), len(sell_list)))
     
+    buy_factor = 1.0
+    sell_factor = 1.0
     for i in range(limit):
         if i < len(buy_list):
-            discounted_buy.append(buy_list[i] * ((1 + buy_disc) ** i))
+            discounted_buy.append(buy_list[i] * buy_factor)
         if i < len(sell_list):
-            discounted_sell.append(sell_list[i] * ((1 - sell_disc) ** i))
+            discounted_sell.append(sell_list[i] * sell_factor)
+        # One multiply per period instead of a power per element
+        buy_factor = buy_factor * (1 + buy_disc)
+        sell_factor = sell_factor * (1 - sell_disc)
     
     # Ensure we always return valid lists
     if not discounted_buy:
@@ -144,6 +149,43 @@ def apply_uncertainty_discount(buy_list, sell_list, hours, buy_disc, sell_disc):
     return {"buy": discounted_buy, "sell": discounted_sell}
 
 
+def rank_query(prices, value, n, highest):
+    """
+    Rank value among prices in one counting pass (no sort, no tuples).
+
+    highest=True ranks sell prices (dearest first), False ranks buy
+    prices (cheapest first).  in_best_n is True when value would be
+    among the best n of prices, i.e. value is at least as good as the
+    n-th best price.  best_price / best_index are the best price and
+    its first index.
+    """
+    better = 0
+    best_price = None
+    best_index = -1
+    for i in range(len(prices)):
+        price = prices[i]
+        if highest:
+            if price > value:
+                better = better + 1
+            if best_index < 0 or price > best_price:
+                best_price = price
+                best_index = i
+        else:
+            if price < value:
+                better = better + 1
+            if best_index < 0 or price < best_price:
+                best_price = price
+                best_index = i
+    limit = min(n, len(prices))
+    return {
+        "rank": better + 1,
+        "in_best_n": better < limit,
+        "better": better,
+        "best_price": best_price,
+        "best_index": best_index,
+    }
+
+
 def classify_time_period(current_hour, sunrise_hour, peak_start, peak_end):
     """Classify current time as Peak, Day, or Night."""
 
@@ -793,8 +835,8 @@ if current_hour < PEAK_START:
         if buy_now <= MAX_AM_BUY_PRICE:
             # Price is acceptable - but is timing optimal?
             
-            # Sort future prices to find cheapest N periods
-            future_buys_sorted = sorted(future_buys)
+            # Rank buy_now among future prices (one pass, no sort)
+            buy_rank = rank_query(future_buys, buy_now, periods_needed_for_full, False)
             
             # Edge case: Need all remaining periods to reach 100%
             if periods_needed_for_full >= periods_until_peak:
@@ -804,12 +846,8 @@ if current_hour < PEAK_START:
             
             # Normal case: Select N cheapest periods
             elif periods_needed_for_full > 0:
-                # Find the Nth cheapest price (threshold)
-                threshold_index = min(periods_needed_for_full - 1, len(future_buys_sorted) - 1)
-                price_threshold = future_buys_sorted[threshold_index]
-                
                 # Charge if current price is in the cheapest N periods
-                if buy_now <= price_threshold:
+                if buy_rank["in_best_n"]:
                     should_charge_now = True
                     charge_priority = 50
                     charge_reason = f"Optimal charge @ {buy_now:.2f}c (top {periods_needed_for_full} cheapest)"
@@ -822,7 +860,6 @@ if current_hour < PEAK_START:
             # Price is expensive AND below floor
             # Evaluate if floor protection is economically justified
             
-            future_buys_sorted = sorted(future_buys)
             min_future_buy = min(future_buys) if future_buys else 9999
             
             # Calculate costs and revenue
@@ -4,21 +4,19 @@ import io
 from inverter_simulator.simulator import InverterSimulator
 from aemo_to_tariff import spot_to_tariff
 import json
-import requests
 from datetime import datetime, timedelta
 import pandas as pd
 from astral import LocationInfo
 from astral.sun import sun
+from script_runner import ScriptRunner
+from mock_powston import client
 
 class TestUserScript(unittest.TestCase):
     
     def __init__(self, *args, **kwargs):
         super(TestUserScript, self).__init__(*args, **kwargs)
-        self.API_KEY = os.getenv("POWSTON_API_KEY")
-        API_KEY = os.getenv("POWSTON_API_KEY")
-        if not self.API_KEY:
-            self.fail("POWSTON_API_KEY environment variable is not set")
-            return
+        # Offline against the recorded fixtures unless POWSTON_API_KEY is set
+        self.session, self.powston_test_server, self.header = client()
     
         filename = "script.py"
         try:
@@ -27,14 +25,9 @@ class TestUserScript(unittest.TestCase):
         except FileNotFoundError:
             self.fail(f"R001 File {filename} not found")
             return
-        self.powston_test_server = os.getenv("POWSTON_TEST_SERVER", 'https://dev.inverterintelligence.com')
-        self.header = {
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json"
-        }
         self.site_id = 1
         
-        response = requests.get(f'{self.powston_test_server}/api/meter_data/{self.site_id}?from_date="2024-11-07"&to_date="2024-11-08"', headers=self.header).json()
+        response = self.session.get(f'{self.powston_test_server}/api/meter_data/{self.site_id}?from_date="2024-11-07"&to_date="2024-11-08"', headers=self.header).json()
 
         self.meter_data_df = pd.read_json(response, orient="records")
         self.meter_data_df.set_index('interval_time', inplace=True)
@@ -50,18 +43,13 @@ class TestUserScript(unittest.TestCase):
                                 charge_rate=charge_rate, max_ppv_power=max_ppv_power)
         auto_bill, ret_df = sim.run_simulation()
         
-        def run_user_code(interval_time, **kwargs):
-            params = {'interval_time': interval_time,
-                      'battery_capacity': battery_capacity,
-                      'charge_rate': charge_rate,
-                      'max_ppv_power': max_ppv_power,
-                      'location': LocationInfo("Brisbane", "Australia", "Australia/Brisbane", -27.4698, 153.0251)}
-            for key, val in kwargs.items():
-                params[key] = val
-            eval(compile(self.content, '<string>', 'exec'), globals(), params)
-            return params['action'], params['reason']
+        runner = ScriptRunner(self.content, 'script.py',
+                              battery_capacity=battery_capacity,
+                              charge_rate=charge_rate,
+                              max_ppv_power=max_ppv_power,
+                              location=LocationInfo("Brisbane", "Australia", "Australia/Brisbane", -27.4698, 153.0251))
         
-        sim = InverterSimulator(self.meter_data_df, run_user_code, battery_capacity=battery_capacity,
+        sim = InverterSimulator(self.meter_data_df, runner.decide, battery_capacity=battery_capacity,
                                 spot_to_tariff=spot_to_tariff, tariff='6900', network='energex',
                                 charge_rate=charge_rate, max_ppv_power=max_ppv_power)
         sim_bill, ret_df = sim.run_simulation()
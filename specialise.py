@@ -0,0 +1,559 @@
+"""
+Specialise a decision script for one site.
+
+A script's CONFIG is fixed once it is uploaded, yet every run looks its
+keys up again (``float(CONFIG["BATTERY_FULL_SOC"])``,
+``CONFIG["MAX_CHARGE_RATE_KW"] * CONFIG["PERIOD_DURATION_HOURS"]``) and
+tests feature flags that can never change (``CONFIG["PLANNER_ENABLED"]``).
+This pass folds those lookups into literals, evaluates the arithmetic,
+comparisons and float()/int()/min()/max() calls that become constant,
+removes the branches a constant test rules out, and drops the helpers
+nothing calls any more.  Docstrings and comments go too, and long lines
+are wrapped to the ai_prompt.txt limit.  The gain is mostly in upload
+size and compile time: for "script v8.26" only one branch depends on
+CONFIG alone, so a run takes about as long as before:
+
+    python specialise.py "script v8.26" --overrides site.json --output "script v8.26 site"
+
+``--overrides`` is a JSON object of CONFIG keys and top-level constants
+(the "overrides" of a fleet.py site).  With ``--payload`` both versions
+are run on the payload, their decisions compared and their run times
+reported.
+
+CONFIG itself is kept, since helpers are handed the whole dict.  The pass
+assumes what every script in this repository does: CONFIG is assigned
+once, as a literal, and never modified.  Scripts that rebind or mutate it
+are rejected with ValueError.
+"""
+import ast
+import builtins
+import io
+import json
+import sys
+import tokenize
+
+from sweep import apply_overrides
+
+# Builtins whose result is a constant when their arguments are
+FOLDABLE_CALLS = ('abs', 'bool', 'float', 'int', 'max', 'min', 'round')
+
+SCALARS = (bool, int, float, str, type(None))
+
+# CONFIG methods that would make its values unsafe to fold
+MUTATORS = ('clear', 'pop', 'popitem', 'setdefault', 'update')
+
+# Folded results larger than this stay as the original expression
+MAX_FOLDED_LENGTH = 200
+
+# ai_prompt.txt line limit the output is wrapped to
+MAX_LINE_LENGTH = 79
+
+# Tokens a wrapped expression breaks before, and the assignment operators it may follow
+BREAK_BEFORE = ('and', 'or', 'if', 'else', 'for', '%', '+', '-', '*', '/')
+ASSIGNMENTS = ('=', '+=', '-=', '*=', '/=', '//=', '%=', '**=')
+
+
+def stored_names(tree):
+    """{name: count} of every binding in ``tree``: assignments, loop targets and arguments."""
+    counts = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            name = node.id
+        elif isinstance(node, ast.arg):
+            name = node.arg
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            name = node.name
+        else:
+            continue
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def find_config(tree):
+    """
+    The value of the module-level ``CONFIG = {...}`` literal, or None.
+
+    Raises ValueError if CONFIG is rebound or modified anywhere.
+    """
+    config = None
+    for stmt in tree.body:
+        if (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1
+                and isinstance(stmt.targets[0], ast.Name) and stmt.targets[0].id == 'CONFIG'):
+            try:
+                config = ast.literal_eval(stmt.value)
+            except ValueError:
+                raise ValueError('Line %d: CONFIG is not a literal dict' % stmt.lineno) from None
+    if config is None:
+        return None
+    if not isinstance(config, dict):
+        raise ValueError('CONFIG is not a dict')
+    if stored_names(tree).get('CONFIG', 0) > 1:
+        raise ValueError('CONFIG is assigned more than once')
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Subscript) and not isinstance(node.ctx, ast.Load) and config_key(node) is not None:
+            raise ValueError('Line %d: CONFIG is modified' % node.lineno)
+        if (isinstance(node, ast.Attribute) and node.attr in MUTATORS and isinstance(node.value, ast.Name)
+                and node.value.id == 'CONFIG'):
+            raise ValueError('Line %d: CONFIG.%s() modifies CONFIG' % (node.lineno, node.attr))
+    return config
+
+
+def config_key(node):
+    """The constant keys of ``CONFIG[k1][k2]...`` as a list, or None."""
+    keys = []
+    while isinstance(node, ast.Subscript):
+        if not isinstance(node.slice, ast.Constant):
+            return None
+        keys.insert(0, node.slice.value)
+        node = node.value
+    if isinstance(node, ast.Name) and node.id == 'CONFIG' and keys:
+        return keys
+    return None
+
+
+def is_constant(node):
+    return isinstance(node, ast.Constant)
+
+
+def constant(value, like):
+    """A Constant node for ``value`` at the position of ``like``, or None if too large to inline."""
+    if not isinstance(value, SCALARS):
+        return None
+    if isinstance(value, (int, str)) and not isinstance(value, bool) and len(repr(value)) > MAX_FOLDED_LENGTH:
+        return None
+    return ast.copy_location(ast.Constant(value), like)
+
+
+def evaluate(node):
+    """Evaluate an expression whose leaves are all constants; None if it raises."""
+    try:
+        value = eval(compile(ast.Expression(node), '<specialise>', 'eval'),  # pylint: disable=eval-used
+                     {'__builtins__': {}})
+    except Exception:  # pylint: disable=broad-except
+        return None
+    return constant(value, node)
+
+
+def is_pure(node):
+    """True if evaluating ``node`` only reads names and compares or combines them."""
+    return all(isinstance(child, (ast.Name, ast.Constant, ast.Compare, ast.BoolOp, ast.UnaryOp, ast.expr_context,
+                                  ast.boolop, ast.cmpop, ast.unaryop))
+               for child in ast.walk(node))
+
+
+def is_docstring(stmt):
+    return isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant) and isinstance(stmt.value.value, str)
+
+
+class Folder(ast.NodeTransformer):
+    """
+    Fold CONFIG lookups and constant expressions, and prune constant branches.
+
+    ``constants`` maps module-level names to the literal they were assigned;
+    they are substituted in module-level code only, never inside functions.
+    """
+
+    def __init__(self, config, shadowed):
+        self.config = config
+        self.shadowed = shadowed
+        self.constants = {}
+        self.depth = 0
+        self.folded = 0
+        self.pruned = 0
+
+    def fold(self, node, value):
+        if value is not None:
+            self.folded += 1
+            return value
+        return node
+
+    def visit_FunctionDef(self, node):
+        self.depth += 1
+        self.generic_visit(node)
+        self.depth -= 1
+        if is_docstring(node.body[0]):
+            node.body = node.body[1:] or [ast.Pass()]
+        return node
+
+    def visit_Lambda(self, node):
+        self.depth += 1
+        self.generic_visit(node)
+        self.depth -= 1
+        return node
+
+    def visit_block(self, stmts):
+        """Visit a list of statements, flattening the lists visit_If returns."""
+        block = []
+        for stmt in stmts:
+            result = self.visit(stmt)
+            if isinstance(result, list):
+                block.extend(result)
+            elif result is not None:
+                block.append(result)
+        return block
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and self.depth == 0 and node.id in self.constants:
+            return self.fold(node, constant(self.constants[node.id], node))
+        return node
+
+    def visit_Subscript(self, node):
+        self.generic_visit(node)
+        keys = config_key(node)
+        if self.config is None or keys is None or not isinstance(node.ctx, ast.Load):
+            return node
+        value = self.config
+        for key in keys:
+            if not isinstance(value, (dict, list)):
+                return node
+            try:
+                value = value[key]
+            except (KeyError, IndexError, TypeError):
+                return node
+        return self.fold(node, constant(value, node))
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        func = node.func
+        if not all(is_constant(arg) for arg in node.args) or node.keywords:
+            return node
+        if isinstance(func, ast.Name) and func.id in FOLDABLE_CALLS and func.id not in self.shadowed:
+            try:
+                value = getattr(builtins, func.id)(*[arg.value for arg in node.args])
+            except Exception:  # pylint: disable=broad-except
+                return node
+            return self.fold(node, constant(value, node))
+        if (self.config is not None and isinstance(func, ast.Attribute) and func.attr == 'get'
+                and isinstance(func.value, ast.Name) and func.value.id == 'CONFIG' and 1 <= len(node.args) <= 2):
+            default = node.args[1].value if len(node.args) == 2 else None
+            try:
+                value = self.config.get(node.args[0].value, default)
+            except TypeError:
+                return node
+            return self.fold(node, constant(value, node))
+        return node
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if is_constant(node.left) and is_constant(node.right):
+            return self.fold(node, evaluate(node))
+        return node
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if is_constant(node.operand):
+            return self.fold(node, evaluate(node))
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        # Identity of literals is an implementation detail; leave "is" alone
+        if (is_constant(node.left) and all(is_constant(item) for item in node.comparators)
+                and not any(isinstance(op, (ast.Is, ast.IsNot)) for op in node.ops)):
+            return self.fold(node, evaluate(node))
+        return node
+
+    def visit_BoolOp(self, node):
+        """
+        ``a and True and b`` is ``a and b``, ``a and False and b`` is
+        ``a and False``; likewise for ``or``.  Either keeps the value.
+        """
+        self.generic_visit(node)
+        stops = isinstance(node.op, ast.Or)
+        values = []
+        for index, value in enumerate(node.values):
+            last = index == len(node.values) - 1
+            if is_constant(value) and bool(value.value) != stops and not last:
+                self.folded += 1
+                continue
+            values.append(value)
+            if is_constant(value) and bool(value.value) == stops:
+                self.folded += 1 if not last else 0
+                break
+        if len(values) == 1:
+            return values[0]
+        node.values = values
+        return node
+
+    def truth(self, node):
+        """
+        Fold ``node`` where only its truth matters: a pure ``a and False``
+        is False and a pure ``a or True`` is True.
+        """
+        node = self.visit(node)
+        if isinstance(node, ast.BoolOp) and is_constant(node.values[-1]):
+            stops = isinstance(node.op, ast.Or)
+            if bool(node.values[-1].value) == stops:
+                if all(is_pure(value) for value in node.values[:-1]):
+                    self.folded += 1
+                    return ast.copy_location(ast.Constant(stops), node)
+            elif len(node.values) > 1:
+                self.folded += 1
+                node.values = node.values[:-1]
+                if len(node.values) == 1:
+                    return node.values[0]
+        return node
+
+    def visit_IfExp(self, node):
+        node.test = self.truth(node.test)
+        if is_constant(node.test):
+            self.pruned += 1
+            return self.visit(node.body if node.test.value else node.orelse)
+        node.body = self.visit(node.body)
+        node.orelse = self.visit(node.orelse)
+        return node
+
+    def visit_If(self, node):
+        node.test = self.truth(node.test)
+        if is_constant(node.test):
+            self.pruned += 1
+            kept = node.body if node.test.value else node.orelse
+            return self.visit_block(kept)
+        self.generic_visit(node)
+        return node
+
+    def visit_While(self, node):
+        node.test = self.truth(node.test)
+        if is_constant(node.test) and not node.test.value:
+            self.pruned += 1
+            return self.visit_block(node.orelse)
+        self.generic_visit(node)
+        return node
+
+    def visit_comprehension(self, node):
+        node.iter = self.visit(node.iter)
+        node.ifs = [self.truth(test) for test in node.ifs]
+        return node
+
+    def generic_visit(self, node):
+        super().generic_visit(node)
+        # A block whose every statement was pruned still needs one
+        if isinstance(node, (ast.stmt, ast.ExceptHandler)) and getattr(node, 'body', None) == []:
+            node.body = [ast.Pass()]
+        return node
+
+
+def drop_unused_functions(tree):
+    """Remove top-level functions nothing outside their own body refers to; returns their names."""
+    dropped = []
+    while True:
+        functions = {stmt.name: stmt for stmt in tree.body if isinstance(stmt, ast.FunctionDef)}
+        used = set()
+        for stmt in tree.body:
+            for node in ast.walk(stmt):
+                if isinstance(node, ast.Name) and node.id in functions and functions[node.id] is not stmt:
+                    used.add(node.id)
+        unused = [name for name in functions if name not in used]
+        if not unused:
+            return dropped
+        dropped.extend(unused)
+        tree.body = [stmt for stmt in tree.body if not (isinstance(stmt, ast.FunctionDef) and stmt.name in unused)]
+
+
+def _tokens(text):
+    """(string, start, end) of the tokens of one line of code, or None if it does not tokenize."""
+    try:
+        return [(token.string, token.start[1], token.end[1])
+                for token in tokenize.generate_tokens(io.StringIO(text).readline)
+                if token.type not in (tokenize.NEWLINE, tokenize.NL, tokenize.ENDMARKER)]
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return None
+
+
+def _depths(tokens):
+    """Bracket depth at each token; an opening bracket is at the depth outside it."""
+    depths = []
+    depth = 0
+    for string, _, _ in tokens:
+        if string in (')', ']', '}'):
+            depth -= 1
+        depths.append(depth)
+        if string in ('(', '[', '{'):
+            depth += 1
+    return depths
+
+
+def _bare_expression(tokens, text):
+    """
+    (start, end) of the expression of an if/elif/while/return or
+    assignment line when it can break (BREAK_BEFORE) outside any bracket,
+    so it can be parenthesised; None otherwise.
+    """
+    depths = _depths(tokens)
+    if tokens[0][0] in ('if', 'elif', 'while') and tokens[-1][0] == ':':
+        first, last = 1, len(tokens) - 1
+    elif tokens[0][0] == 'return' and len(tokens) > 1:
+        first, last = 1, len(tokens)
+    else:
+        equals = [index for index, token in enumerate(tokens) if depths[index] == 0 and token[0] in ASSIGNMENTS]
+        if not equals:
+            return None
+        first, last = equals[0] + 1, len(tokens)
+    if not any(depths[index] == 0 and tokens[index][0] in BREAK_BEFORE for index in range(first, last)):
+        return None
+    end = tokens[last][1] if last < len(tokens) else len(text)
+    return tokens[first][1], len(text[:end].rstrip())
+
+
+def _wrap_line(line, width, statement=True):
+    """
+    Split one line of ast.unparse output that is longer than ``width``
+    inside its widest bracket: one item per line for list and dict
+    literals, as many as fit for calls and parenthesised expressions.
+    """
+    body = line.lstrip(' ')
+    pad = line[:len(line) - len(body)]
+    tokens = _tokens(body) if len(line) > width else None
+    if not tokens:
+        return [line]
+    bare = _bare_expression(tokens, body) if statement else None
+    if bare:
+        body = '%s(%s)%s' % (body[:bare[0]], body[bare[0]:bare[1]], body[bare[1]:])
+        tokens = _tokens(body)
+    depths = _depths(tokens)
+    pairs = []
+    for index, token in enumerate(tokens):
+        if token[0] in ('(', '[', '{') and depths[index] == 0:
+            opened = index
+        elif token[0] in (')', ']', '}') and depths[index] == 0:
+            pairs.append((token[1] - tokens[opened][1], opened, index))
+    if not pairs:
+        return [line]
+    _, opened, closed = max(pairs)
+    breaks = [tokens[opened][2]]
+    for index in range(opened + 1, closed):
+        if depths[index] == 1 and tokens[index][0] == ',':
+            breaks.append(tokens[index][2])
+        elif depths[index] == 1 and tokens[index][0] in BREAK_BEFORE:
+            breaks.append(tokens[index][1])
+    breaks.append(tokens[closed][1])
+    items = [body[start:end].strip() for start, end in zip(breaks, breaks[1:])]
+    items = [item for item in items if item]
+    indent = pad + ' ' * (8 if statement and tokens[-1][0] == ':' else 4)
+    lines = []
+    for item in items:
+        if lines and tokens[opened][0] == '(' and len('%s%s %s' % (indent, lines[-1], item)) <= width:
+            lines[-1] = '%s %s' % (lines[-1], item)
+        else:
+            lines.append(item)
+    wrapped = [pad + body[:tokens[opened][2]]]
+    for item in lines:
+        wrapped.extend(_wrap_line(indent + item, width, statement=False))
+    wrapped.append(pad + body[tokens[closed][1]:])
+    return wrapped
+
+
+def wrap_lines(source, width=MAX_LINE_LENGTH):
+    """
+    ``source`` (as ast.unparse writes it, one statement per line) with
+    its lines longer than ``width`` split inside brackets.  Source the
+    wrapping would change is returned as it was.
+    """
+    wrapped = []
+    for line in source.splitlines():
+        wrapped.extend(_wrap_line(line, width))
+    result = '\n'.join(wrapped) + '\n'
+    try:
+        same = ast.dump(ast.parse(result)) == ast.dump(ast.parse(source))
+    except SyntaxError:
+        same = False
+    return result if same else source
+
+
+def specialise(source, overrides=None, report=None):
+    """
+    Return ``source`` specialised for its CONFIG, after applying
+    ``overrides`` ({CONFIG key or constant: value}, see sweep.apply_overrides).
+
+    ``report``, if given, is a dict filled with the number of expressions
+    folded, branches pruned and the helpers dropped.
+    """
+    if overrides:
+        source = apply_overrides(source, overrides)
+    tree = ast.parse(source)
+    config = find_config(tree)
+    stores = stored_names(tree)
+    folder = Folder(config, {name for name in FOLDABLE_CALLS if name in stores})
+    body = []
+    for stmt in tree.body:
+        if is_docstring(stmt):
+            continue
+        block = folder.visit_block([stmt])
+        body.extend(block)
+        for item in block:
+            # A name bound once, at the top level, to a literal is a constant from here on
+            if (isinstance(item, ast.Assign) and len(item.targets) == 1 and isinstance(item.targets[0], ast.Name)
+                    and is_constant(item.value) and stores.get(item.targets[0].id) == 1):
+                folder.constants[item.targets[0].id] = item.value.value
+    tree.body = body
+    dropped = drop_unused_functions(tree)
+    if report is not None:
+        report.update({'folded': folder.folded, 'pruned': folder.pruned, 'dropped': dropped})
+    return wrap_lines(ast.unparse(ast.fix_missing_locations(tree)) + '\n')
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    from script_runner import ScriptRunner
+
+    parser = argparse.ArgumentParser(description="Fold a site's CONFIG into a decision script")
+    parser.add_argument('script')
+    parser.add_argument('--overrides', help='JSON file of CONFIG keys and constants for the site')
+    parser.add_argument('--output', help='write the specialised script here (default: stdout)')
+    parser.add_argument('--payload', help='action_params JSON file to compare and time both versions on')
+    parser.add_argument('--repeat', type=int, default=50, help='timed runs per version with --payload')
+    args = parser.parse_args(argv)
+    with open(args.script, 'r', encoding='UTF-8') as file:
+        source = file.read()
+    overrides = None
+    if args.overrides:
+        with open(args.overrides, 'r', encoding='UTF-8') as file:
+            overrides = json.load(file)
+    report = {}
+    try:
+        output = specialise(source, overrides, report)
+    except (KeyError, ValueError) as exc:
+        print('%s: %s' % (args.script, exc), file=sys.stderr)
+        return 1
+    print('%s: %d -> %d bytes, %d expressions folded, %d branches pruned, %d helpers dropped%s'
+          % (args.script, len(source.encode('UTF-8')), len(output.encode('UTF-8')), report['folded'],
+             report['pruned'], len(report['dropped']),
+             ' (%s)' % ', '.join(report['dropped']) if report['dropped'] else ''), file=sys.stderr)
+    status = 0
+    if args.payload:
+        with open(args.payload, 'r', encoding='UTF-8') as file:
+            payload = json.load(file)
+        original = apply_overrides(source, overrides) if overrides else source
+        results = []
+        for label, text in (('original', original), ('specialised', output)):
+            started = time.perf_counter()
+            runner = ScriptRunner(text, args.script)
+            compiled = time.perf_counter() - started
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                decision = runner.decide_payload(payload)
+            ran = (time.perf_counter() - started) / args.repeat
+            results.append(decision)
+            print('%s: %s compile %.1f ms, run %.3f ms' % (args.script, label, compiled * 1000, ran * 1000),
+                  file=sys.stderr)
+        if results[0] != results[1]:
+            print('%s: decisions differ: %r != %r' % (args.script, results[0], results[1]), file=sys.stderr)
+            status = 1
+    output = '# Generated by specialise.py from %s; edit that file, not this one\n%s' % (args.script, output)
+    from bundle import problems
+
+    for problem in problems(output, MAX_LINE_LENGTH):
+        print('%s: %s' % (args.script, problem), file=sys.stderr)
+        status = 1
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as file:
+            file.write(output)
+    else:
+        sys.stdout.write(output)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Sunrise and sunset per site and date.
+
+Scripts receive ``sunrise`` and ``sunset`` from the platform.  A backtest
+has to supply them itself, and every 5-minute interval of a day shares
+the same pair, so they are computed once per (latitude, longitude, date):
+
+    table = SunTable(-27.4698, 153.0251, 'Australia/Brisbane', '2024-11-01', '2024-11-30')
+    table.lookup(date(2024, 11, 7))['sunrise_hour']
+    meter_data_df = add_sun_times(meter_data_df, -27.4698, 153.0251)
+
+sun_times() is LRU-cached for live use, where one site asks for the same
+day every interval.
+"""
+from datetime import datetime, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+from astral import Observer
+from astral.sun import sunrise, sunset
+
+
+def hour_of_day(moment):
+    """Local clock time of ``moment`` in fractional hours."""
+    return moment.hour + moment.minute / 60.0 + moment.second / 3600.0
+
+
+def _tzinfo(timezone):
+    return ZoneInfo(timezone) if isinstance(timezone, str) else timezone
+
+
+@lru_cache(maxsize=4096)
+def sun_times(latitude, longitude, day, timezone='Australia/Brisbane'):
+    """
+    Sunrise and sunset on ``day`` as a dict of tz-aware datetimes, with
+    ``sunrise_hour`` and ``sunset_hour`` in local fractional hours.
+
+    ``timezone`` is a name or a tzinfo.  Raises ValueError where the sun
+    does not rise or set (polar day or night).
+    """
+    observer = Observer(latitude, longitude)
+    tzinfo = _tzinfo(timezone)
+    rise = sunrise(observer, day, tzinfo)
+    fall = sunset(observer, day, tzinfo)
+    return {'sunrise': rise, 'sunset': fall, 'sunrise_hour': hour_of_day(rise), 'sunset_hour': hour_of_day(fall)}
+
+
+class SunTable:
+    """
+    Sun times of one site for every date from ``start`` to ``end``
+    (inclusive), computed up front; lookup() is a dict access.
+    """
+
+    def __init__(self, latitude, longitude, timezone='Australia/Brisbane', start=None, end=None):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.timezone = timezone
+        self.days = {}
+        if start is not None:
+            self.extend(start, start if end is None else end)
+
+    def extend(self, start, end):
+        """Add the dates from ``start`` to ``end`` that are not in the table yet."""
+        day = pd.Timestamp(start).date()
+        last = pd.Timestamp(end).date()
+        while day <= last:
+            if day not in self.days:
+                self.days[day] = sun_times(self.latitude, self.longitude, day, self.timezone)
+            day += timedelta(days=1)
+        return self
+
+    def lookup(self, day):
+        """
+        Sun times of ``day`` (a date or datetime), computed if outside the
+        table.  A tz-aware datetime counts in the table's timezone.
+        """
+        if isinstance(day, datetime):
+            if day.tzinfo is not None:
+                day = day.astimezone(_tzinfo(self.timezone))
+            day = day.date()
+        times = self.days.get(day)
+        if times is None:
+            times = self.days[day] = sun_times(self.latitude, self.longitude, day, self.timezone)
+        return times
+
+    def for_index(self, index):
+        """
+        A frame of sunrise, sunset and sunrise_hour aligned to the local
+        dates of a tz-aware DatetimeIndex.
+        """
+        days = index.normalize()
+        unique = days.unique()
+        rows = [self.lookup(day.date()) for day in unique]
+        table = pd.DataFrame({
+            'sunrise': [row['sunrise'] for row in rows],
+            'sunset': [row['sunset'] for row in rows],
+            'sunrise_hour': [row['sunrise_hour'] for row in rows],
+        })
+        positions = unique.get_indexer(days)
+        frame = table.iloc[positions]
+        frame.index = index
+        return frame
+
+
+def add_sun_times(meter_data_df, latitude, longitude, timezone=None):
+    """
+    Return ``meter_data_df`` with sunrise, sunset and sunrise_hour columns
+    for the site (replacing existing ones).
+
+    ``timezone`` defaults to the timezone of the index, whose local dates
+    pick the row of each interval.
+    """
+    index = meter_data_df.index
+    if timezone is None:
+        timezone = index.tz
+    if timezone is None:
+        raise ValueError('meter_data_df needs a tz-aware index or an explicit timezone')
+    if index.tz is None:
+        index = index.tz_localize(_tzinfo(timezone))
+    else:
+        index = index.tz_convert(_tzinfo(timezone))
+    if not len(index):
+        return meter_data_df.assign(sunrise=pd.Series(dtype=object), sunset=pd.Series(dtype=object),
+                                    sunrise_hour=pd.Series(dtype=float))
+    table = SunTable(latitude, longitude, timezone, index.min(), index.max())
+    frame = table.for_index(index)
+    frame.index = meter_data_df.index
+    return meter_data_df.assign(sunrise=frame['sunrise'], sunset=frame['sunset'],
+                                sunrise_hour=frame['sunrise_hour'])
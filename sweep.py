@@ -0,0 +1,201 @@
+"""
+Parallel parameter sweep over a decision script's CONFIG keys or
+top-level constants.
+
+Each candidate is the script source with some constants rewritten, run
+through the simulator in a ProcessPoolExecutor worker.  meter_data_df is
+handed to the workers once (inherited on fork, otherwise sent once per
+worker by the pool initializer), never per candidate.
+
+    space = {'BUY_DELTA_THRESHOLD': range(60, 100, 5), 'GOOD_SUN_DAY': [40, 44, 50]}
+    results = run_sweep('nsw_script.py', meter_data_df, grid(space),
+                        simulator_kwargs=dict(battery_capacity=25000, ...))
+    results.to_csv('sweep_results.csv')
+
+The results table is ranked by bill (cents, lowest first) and also reports
+self-consumption of solar for every candidate.
+"""
+import ast
+import itertools
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from script_runner import ScriptRunner
+
+# Set in each worker (or in the parent before forking)
+_WORKER_DF = None
+
+
+def constant_nodes(source):
+    """
+    Find the literal nodes that can be swept in ``source``.
+
+    Returns {name: node} for module-level ``NAME = <number>`` assignments
+    and for the numeric entries of a module-level ``CONFIG = {...}`` dict.
+    """
+    tree = ast.parse(source)
+    assigned = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            assigned[node.id] = assigned.get(node.id, 0) + 1
+    nodes = {}
+    for stmt in tree.body:
+        if not isinstance(stmt, ast.Assign) or len(stmt.targets) != 1:
+            continue
+        target = stmt.targets[0]
+        if not isinstance(target, ast.Name):
+            continue
+        value = stmt.value
+        if target.id == 'CONFIG' and isinstance(value, ast.Dict):
+            for key, item in zip(value.keys, value.values):
+                if isinstance(key, ast.Constant) and is_number(item):
+                    nodes[key.value] = item
+        elif is_number(value):
+            nodes[target.id] = value
+    # A name the script assigns again (action, soc_diff, ...) is state, not a knob
+    return {name: node for name, node in nodes.items() if assigned.get(name, 1) == 1}
+
+
+def is_number(node):
+    """True for a numeric or boolean literal, including a negated one."""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        node = node.operand
+    return isinstance(node, ast.Constant) and isinstance(node.value, (int, float))
+
+
+def apply_overrides(source, overrides):
+    """
+    Return ``source`` with the named constants replaced by ``overrides``.
+
+    Only the literal is rewritten, so comments and layout are preserved.
+    Raises KeyError for a name that is not a sweepable constant.
+    """
+    nodes = constant_nodes(source)
+    lines = source.splitlines(keepends=True)
+    edits = []
+    for name, value in overrides.items():
+        if name not in nodes:
+            raise KeyError('%s is not a top-level constant or CONFIG key' % name)
+        node = nodes[name]
+        edits.append((node.lineno, node.col_offset, node.end_lineno, node.end_col_offset, repr(value)))
+    # Apply from the bottom up so earlier offsets stay valid
+    for lineno, col, end_lineno, end_col, text in sorted(edits, reverse=True):
+        first = lines[lineno - 1]
+        last = lines[end_lineno - 1]
+        lines[lineno - 1:end_lineno] = [first[:col] + text + last[end_col:]]
+    return ''.join(lines)
+
+
+def grid(space):
+    """Every combination of the values in ``space`` ({name: iterable})."""
+    names = list(space)
+    for values in itertools.product(*(list(space[name]) for name in names)):
+        yield dict(zip(names, values))
+
+
+def random_space(space, samples, seed=None):
+    """
+    ``samples`` random candidates from ``space``.
+
+    A (low, high) tuple samples uniformly (integers if both ends are ints);
+    any other iterable is sampled by choice.
+    """
+    rng = random.Random(seed)
+    for _ in range(samples):
+        candidate = {}
+        for name, values in space.items():
+            if isinstance(values, tuple) and len(values) == 2:
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    candidate[name] = rng.randint(low, high)
+                else:
+                    candidate[name] = rng.uniform(low, high)
+            else:
+                candidate[name] = rng.choice(list(values))
+        yield candidate
+
+
+def inverter_simulate(meter_data_df, decide, **simulator_kwargs):
+    """Run InverterSimulator; returns (bill, ret_df)."""
+    from inverter_simulator.simulator import InverterSimulator
+    sim = InverterSimulator(meter_data_df.copy(), decide, **simulator_kwargs)
+    return sim.run_simulation()
+
+
+def self_consumption(ret_df):
+    """Share of solar generation used on site rather than exported."""
+    solar_col = 'solar_power' if 'solar_power' in ret_df.columns else 'ppv'
+    if solar_col not in ret_df.columns or 'Power to grid' not in ret_df.columns:
+        return float('nan')
+    solar = ret_df[solar_col].clip(lower=0).sum()
+    if solar <= 0:
+        return float('nan')
+    exported = ret_df['Power to grid'].clip(lower=0).sum()
+    return float(max(0.0, 1.0 - exported / solar))
+
+
+def _init_worker(meter_data_df):
+    global _WORKER_DF  # pylint: disable=global-statement
+    if meter_data_df is not None:
+        _WORKER_DF = meter_data_df
+
+
+def evaluate(task):
+    """Simulate one candidate; runs inside a worker process."""
+    source, filename, overrides, simulate, simulator_kwargs, runner_kwargs = task
+    runner = ScriptRunner(apply_overrides(source, overrides), filename, **runner_kwargs)
+    bill, ret_df = simulate(_WORKER_DF, runner.decide, **simulator_kwargs)
+    row = dict(overrides)
+    row['bill'] = float(bill)
+    row['self_consumption'] = self_consumption(ret_df)
+    return row
+
+
+def run_sweep(filename, meter_data_df, candidates, simulate=inverter_simulate,
+              simulator_kwargs=None, runner_kwargs=None, max_workers=None, output=None):
+    """
+    Simulate every candidate in ``candidates`` across all cores.
+
+    Returns a DataFrame ranked by bill (lowest first); written to ``output``
+    as CSV when given.  ``simulate`` must be a module-level function taking
+    (meter_data_df, decide, **simulator_kwargs) and returning (bill, ret_df).
+    """
+    global _WORKER_DF  # pylint: disable=global-statement
+    with open(filename, 'r', encoding='UTF-8') as file:
+        source = file.read()
+    simulator_kwargs = simulator_kwargs or {}
+    runner_kwargs = runner_kwargs or {}
+    candidates = list(candidates)
+    # Validate every candidate before starting the pool
+    for overrides in candidates:
+        apply_overrides(source, overrides)
+    tasks = [(source, filename, overrides, simulate, simulator_kwargs, runner_kwargs)
+             for overrides in candidates]
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # Workers inherit the frame copy-on-write; nothing is pickled
+        context = multiprocessing.get_context('fork')
+        _WORKER_DF = meter_data_df
+        initargs = (None,)
+    else:
+        context = multiprocessing.get_context()
+        initargs = (meter_data_df,)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=context,
+                                 initializer=_init_worker, initargs=initargs) as pool:
+            rows = list(pool.map(evaluate, tasks))
+    finally:
+        _WORKER_DF = None
+
+    results = pd.DataFrame(rows)
+    if not results.empty:
+        results = results.sort_values('bill', kind='stable').reset_index(drop=True)
+        results.index.name = 'rank'
+        results.index += 1
+    if output:
+        results.to_csv(output)
+    return results
@@ -0,0 +1,107 @@
+import unittest
+import random
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from backtest import BatchFeatures, V826Strategy, AlwaysAuto, run_backtest
+from script_runner import ScriptRunner
+
+BRISBANE = timezone(timedelta(hours=10))
+
+
+def synthetic_meter_data(days=2, seed=7):
+    """Five-minute meter data with forecasts, weather and solar estimates."""
+    rng = random.Random(seed)
+    start = datetime(2024, 12, 15, tzinfo=BRISBANE)
+    rows = []
+    for i in range(days * 288):
+        interval_time = start + timedelta(minutes=5 * i)
+        hour = interval_time.hour
+        base = 30.0 if 16 <= hour < 21 else 12.0
+        rows.append({
+            'interval_time': interval_time,
+            'buy_price': round(base + rng.uniform(-12, 30), 2),
+            'sell_price': round(base * 0.8 + rng.uniform(-10, 30), 2),
+            'buy_forecast': [round(base + rng.uniform(-12, 40), 2) for _ in range(24)],
+            'sell_forecast': [round(base * 0.8 + rng.uniform(-10, 40), 2) for _ in range(24)],
+            'house_power': rng.uniform(500, 4000),
+            'solar_power': max(0.0, 6000 - abs(hour - 12) * 1000) * rng.uniform(0.5, 1.0),
+            'sunrise': interval_time.replace(hour=4, minute=50),
+            'solar_surplus_deficit': rng.uniform(-20, 20),
+            'solar_estimate_remaining': rng.uniform(0, 60),
+            'pv_forecast_today': rng.choice([0.0, 45.0, 90.0, 130.0]),
+            'pv_forecast_tomorrow': rng.choice([0.0, 45.0, 90.0, 130.0]),
+            'temperature_2m': [rng.uniform(15, 35) for _ in range(48)],
+            'global_tilted_irradiance_instant': [rng.uniform(0, 400) for _ in range(48)],
+        })
+    df = pd.DataFrame(rows)
+    df.set_index('interval_time', inplace=True)
+    return df
+
+
+def script_params(row, interval_time, soc):
+    """The variables script v8.26 would see for one meter_data row."""
+    return {
+        'interval_time': interval_time,
+        'sunrise': row['sunrise'],
+        'buy_price': row['buy_price'],
+        'sell_price': row['sell_price'],
+        'buy_forecast': row['buy_forecast'],
+        'sell_forecast': row['sell_forecast'],
+        'battery_soc': soc,
+        'inverters': {},
+        'mqtt_data': {'solar_estimate': {
+            'solar_estimate_remaining': row['solar_estimate_remaining'],
+            'solar_surplus_deficit': row['solar_surplus_deficit'],
+            'pv_forecast_today': row['pv_forecast_today'],
+            'pv_forecast_tomorrow': row['pv_forecast_tomorrow'],
+        }},
+        'weather_data': {'hourly': {
+            'temperature_2m': row['temperature_2m'],
+            'global_tilted_irradiance_instant': row['global_tilted_irradiance_instant'],
+        }},
+    }
+
+
+class TestBacktest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = synthetic_meter_data()
+        cls.features = BatchFeatures(cls.df, battery_capacity=101200, charge_rate=20000)
+
+    def test_batch_strategy_matches_script(self):
+        runner = ScriptRunner.from_file('script v8.26')
+        strategy = V826Strategy()
+        strategy.prepare(self.features)
+        rng = random.Random(3)
+        for i in range(0, self.features.n, 7):
+            soc = rng.choice([3.0, 20.0, 45.0, 70.0, 99.0])
+            interval_time = self.df.index[i].to_pydatetime()
+            params = script_params(self.df.iloc[i], interval_time, soc)
+            expected = runner.decide(params.pop('interval_time'), **params)[0]
+            self.assertEqual(strategy.decide(i, soc), expected, 'row %d soc %s' % (i, soc))
+            self.assertAlmostEqual(runner.last_params['overnight_from_9pm_kwh'], self.features.overnight_kwh[i])
+            sell_disc = runner.last_params['sell_disc']
+            self.assertAlmostEqual(self.features.sell_max[i], max(sell_disc))
+            self.assertAlmostEqual(self.features.pre_peak_sell[i], max(sell_disc[:4]))
+
+    def test_always_auto_self_consumption(self):
+        bill, ret_df = run_backtest(self.features, AlwaysAuto(), initial_soc=0.0)
+        self.assertEqual(len(ret_df), len(self.df))
+        self.assertAlmostEqual(self.features.interval_hours, 5 / 60.0)
+        self.assertAlmostEqual(bill, ret_df['sim_cost'].sum())
+        self.assertTrue((ret_df['battery_soc'] >= 0).all())
+        self.assertTrue((ret_df['battery_charge'] <= 101200).all())
+        self.assertEqual(set(ret_df['action']), {'auto'})
+
+    def test_strategy_beats_or_differs_from_auto(self):
+        auto_bill = run_backtest(self.features, AlwaysAuto())[0]
+        bill, ret_df = run_backtest(self.features, V826Strategy())
+        self.assertNotEqual(bill, auto_bill)
+        self.assertIn('import', set(ret_df['action']))
+
+
+if __name__ == '__main__':
+    unittest.main()
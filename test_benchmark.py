@@ -0,0 +1,83 @@
+import unittest
+import os
+import tempfile
+
+from astral import LocationInfo
+
+from backtest import BatchFeatures
+from benchmark import ScriptStrategy, benchmark_script, load_history, perfect_forecasts, regressions, run_benchmark
+from sun_times import sun_times
+from test_backtest import synthetic_meter_data
+
+SCRIPTS = ('script.py', 'script v7.14.1', 'script v8.4', 'script v8.26', 'nsw_script.py')
+
+
+class TestBenchmark(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = synthetic_meter_data(days=1)
+
+    def test_helpers(self):
+        df = perfect_forecasts(self.df.drop(columns=['buy_forecast']), periods=4)
+        first = df.iloc[0]
+        self.assertEqual(len(first['buy_forecast']), 4)
+        self.assertAlmostEqual(first['buy_forecast'][0], round(self.df['buy_price'].iloc[:6].mean(), 2))
+        self.assertIs(perfect_forecasts(self.df), self.df)
+
+    def test_run_and_history(self):
+        with tempfile.TemporaryDirectory() as root:
+            history = os.path.join(root, 'history.jsonl')
+            results = run_benchmark(self.df, SCRIPTS, battery_capacity=20000, charge_rate=5000,
+                                    history=history, label='test')
+            self.assertEqual(sorted(results['script']), sorted(SCRIPTS + ('script v8.26 +planner',)))
+            self.assertTrue((results['errors'] == 0).all(), results[['script', 'last_error']])
+            self.assertFalse(results['failed'].any())
+            self.assertTrue((results['p95_ms'] >= results['p50_ms']).all())
+            self.assertEqual(len(set(results['auto_bill'])), 1)
+            self.assertTrue((results['vs_auto'] == results['bill'] - results['auto_bill']).all())
+            self.assertTrue((results['regret'] >= 0).all())
+            records = load_history(history)
+            self.assertEqual(len(records), len(SCRIPTS) + 1)
+            self.assertEqual(records[0]['label'], 'test')
+
+            rows = results.to_dict('records')
+            self.assertEqual(regressions(records, rows, latency_tolerance=10.0), [])
+            worse = dict(rows[0], bill=rows[0]['bill'] + 500, p95_ms=rows[0]['p95_ms'] * 3 + 1)
+            problems = regressions(records, [worse])
+            self.assertEqual(len(problems), 2)
+            self.assertEqual(regressions(records, [dict(worse, data='other')]), [])
+
+    def test_location_sun_times(self):
+        brisbane = LocationInfo('Brisbane', 'Australia', 'Australia/Brisbane', -27.4698, 153.0251)
+        df = synthetic_meter_data(days=2).drop(columns=['sunrise'])
+        features = BatchFeatures(perfect_forecasts(df), battery_capacity=20000, charge_rate=5000)
+        strategy = ScriptStrategy('script v8.26', location=brisbane)
+        strategy.prepare(features)
+        for i in (0, len(df) - 1):
+            times = sun_times(brisbane.latitude, brisbane.longitude, df.index[i].date(), brisbane.timezone)
+            params = strategy.params(i, 50.0)
+            self.assertEqual((params['sunrise'], params['sunset']), (times['sunrise'], times['sunset']))
+        self.assertNotEqual(strategy.params(0, 50.0)['sunrise'].time(),
+                            strategy.params(len(df) - 1, 50.0)['sunrise'].time())
+        strategy.decide(0, 50.0)
+        self.assertEqual(strategy.errors, 0)
+
+    def test_failed_script_has_no_bill(self):
+        with tempfile.TemporaryDirectory() as root:
+            script = os.path.join(root, 'broken.py')
+            with open(script, 'w', encoding='UTF-8') as file:
+                file.write('if interval_time.hour == 12:\n    raise ValueError("noon")\n'
+                           'action = decisions.reason("auto", "default", priority=1)\n')
+            features = BatchFeatures(perfect_forecasts(self.df), battery_capacity=20000, charge_rate=5000)
+            row = benchmark_script(script, features, 100.0)
+        self.assertTrue(row['failed'])
+        self.assertGreater(row['errors'], 0)
+        self.assertIsNone(row['bill'])
+        self.assertIsNone(row['vs_auto'])
+        self.assertIn('noon', row['last_error'])
+        self.assertEqual(regressions([], [row]), ['%s: failed (ValueError: noon)' % script])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from bundle import MARKER, bundle, drift, library_functions, main, problems, refresh
+from script_runner import ScriptRunner
+
+SCRIPT = """from powston_helpers import in_window, apply_discount, classify_solar
+
+CONFIG = {"PEAK_START": 16, "PEAK_END": 21, "DISCOUNT": 0.0}
+
+hour = interval_time.hour
+peak = in_window(hour, CONFIG["PEAK_START"], CONFIG["PEAK_END"])["inside"]
+discounted = apply_discount(sell_forecast, CONFIG["DISCOUNT"], 1, 12)
+best = max(discounted["values"])
+if peak and sell_price >= best:
+    action = decisions.reason("export", "peak %.1f" % best, priority=50)
+action = decisions.reason("auto", "default", priority=1)
+"""
+
+
+class TestBundle(unittest.TestCase):
+
+    def test_bundle_inlines_only_used_helpers(self):
+        bundled = bundle(SCRIPT)
+        self.assertEqual(problems(bundled), [])
+        self.assertIn(library_functions()['in_window'], bundled)
+        self.assertIn(MARKER % 'powston_helpers', bundled)
+        self.assertNotIn('def classify_solar', bundled)
+        self.assertNotIn('import', bundled)
+        runner = ScriptRunner(bundled, 'bundled')
+        at_peak = datetime(2024, 11, 7, 17, 0)
+        self.assertEqual(runner.decide(at_peak, sell_price=40.0, sell_forecast=[30.0] * 24),
+                         ('export', 'peak 30.0'))
+        self.assertEqual(runner.decide(at_peak, sell_price=20.0, sell_forecast=[30.0] * 24)[0], 'auto')
+        self.assertEqual(bundle(bundled), bundled)
+
+    def test_bundle_errors(self):
+        for source in ('import powston_helpers\n',
+                       'from powston_helpers import missing\n',
+                       'from powston_helpers import in_window as window\n',
+                       'from powston_helpers import in_window\n\ndef in_window(h, s, e):\n    return {}\n',
+                       'if True:\n    from powston_helpers import in_window\n'):
+            with self.assertRaises(ValueError):
+                bundle(source)
+        star = bundle('from powston_helpers import *\n\nx = classify_solar(gti, CONFIG)["class"]\n')
+        self.assertIn('def classify_solar', star)
+        self.assertNotIn('def in_window', star)
+
+    def test_drift_and_refresh(self):
+        bundled = bundle(SCRIPT)
+        self.assertEqual(drift(bundled), [])
+        stale = bundled.replace('hour >= start or hour < end', 'hour > start or hour < end')
+        self.assertEqual(drift(stale), ['in_window'])
+        refreshed, names = refresh(stale)
+        self.assertEqual((refreshed, names), (bundled, ['in_window']))
+        with open('script v8.26', 'r', encoding='UTF-8') as file:
+            self.assertEqual(drift(file.read()), [])
+        pasted = 'def in_window(hour, start, end):\n    return start <= hour < end\n'
+        self.assertEqual(drift(pasted), ['in_window'])
+        self.assertEqual(refresh(pasted), (pasted, []))
+
+    def test_problems(self):
+        source = '\n'.join([
+            'def helper(x):',
+            '    action = decisions.reason("auto", "x", priority=5)',
+            '    return {"y": other(x)}',
+            'def other(x):',
+            '    return {"z": x}',
+            'a, b = 1, 2',
+            'c = d = 3',
+            'for k, v in CONFIG.items(): pass',
+            'e = 1; f = "%s {}".format(a)',
+            'g = f"{a}"',
+            'action = decisions.reason("auto", "%s", priority=2)' % ('x' * 60),
+        ]) + '\n'
+        found = problems(source)
+        for line, text in ((2, 'only allowed in main code'), (3, 'calls helper other'),
+                           (6, 'tuple unpacking'), (7, 'one assignment per line'),
+                           (8, 'tuple unpacking'), (9, 'one statement per line'),
+                           (9, '.format()'), (10, 'f-strings'), (11, 'priority=1'),
+                           (11, 'line too long')):
+            self.assertTrue(any(problem.startswith('Line %d:' % line) and text in problem
+                                for problem in found), (line, text, found))
+        self.assertEqual(len([problem for problem in found if 'f-strings' in problem]), 1)
+        self.assertFalse(any('too long' in problem for problem in problems(source, 0)))
+        self.assertEqual(len(problems('x = (\n')), 1)
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as root:
+            script = os.path.join(root, 'script.py')
+            output = os.path.join(root, 'upload')
+            with open(script, 'w', encoding='UTF-8') as file:
+                file.write(SCRIPT)
+            self.assertEqual(main([script, '--output', output]), 0)
+            self.assertEqual(main([output, '--check']), 0)
+            with open(output, 'r', encoding='UTF-8') as file:
+                self.assertEqual(file.read(), bundle(SCRIPT))
+            with open(script, 'w', encoding='UTF-8') as file:
+                file.write('import powston_helpers\n')
+            with contextlib.redirect_stderr(io.StringIO()) as errors:
+                self.assertEqual(main([script, '--check']), 1)
+            self.assertIn('use "from powston_helpers import ..."', errors.getvalue())
+        self.assertEqual(main(['script v8.26', '--check', '--max-line-length', '0']), 0)
+        with contextlib.redirect_stderr(io.StringIO()) as errors:
+            self.assertEqual(main(['script v8.4', '--check', '--max-line-length', '0']), 1)
+        self.assertIn('in_window differs from powston_helpers.py', errors.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import json
+import random
+
+import numpy as np
+
+import powston_helpers
+from discounting import apply_factors, discount_factors, discount_matrix, factor_table
+from script_runner import ScriptRunner, script_functions
+
+CONFIG = {'BUY_UNCERTAINTY_DISCOUNT': 0.03, 'SELL_UNCERTAINTY_DISCOUNT': 0.07}
+
+
+def load_helpers(filename):
+    with open(filename, 'r', encoding='UTF-8') as file:
+        return script_functions(file.read(), filename)
+
+
+class TestDiscounting(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(8)
+        self.buy = [round(rng.uniform(1, 60), 2) for _ in range(48)]
+        self.sell = [round(rng.uniform(1, 60), 2) for _ in range(48)]
+
+    def test_factors(self):
+        factors = discount_factors(0.03, 16, 0.5)
+        self.assertIs(factors, discount_factors(0.03, 16, 0.5))
+        for i, factor in enumerate(factors):
+            self.assertAlmostEqual(factor, 1.03 ** (i * 0.5), places=12)
+        self.assertEqual(apply_factors(self.buy, factors), powston_helpers.apply_discount(self.buy, 0.03, 0.5, 16)['values'])
+        table = factor_table(CONFIG, 8)
+        self.assertAlmostEqual(table['sell'][3], 0.93 ** 3, places=12)
+
+    def test_matrix(self):
+        matrix = np.array([self.buy[:10], self.buy[10:18] + [np.nan, np.nan]])
+        result = discount_matrix(matrix, discount_factors(0.03, 8))
+        self.assertEqual(result.shape, (2, 8))
+        self.assertEqual(list(result[0]), apply_factors(self.buy[:10], discount_factors(0.03, 8)))
+        self.assertTrue(np.isnan(discount_matrix(matrix, discount_factors(0.03, 10))[1, 9]))
+
+    def test_per_period_scripts(self):
+        table = factor_table(CONFIG, 8)
+        for filename in ('script7.7.py', 'script v7.14.1', 'script v8.4'):
+            apply_discount = load_helpers(filename)['apply_discount']
+            buy = apply_discount(self.buy, 8, 0.03)
+            sell = apply_discount(self.sell, 8, -0.07)
+            self.assertEqual(buy, apply_factors(self.buy, table['buy']), filename)
+            self.assertEqual(sell, apply_factors(self.sell, table['sell']), filename)
+            # The inlined loop still matches the original power-per-element formula
+            for i in range(8):
+                self.assertAlmostEqual(buy[i], self.buy[i] * 1.03 ** i, places=9)
+                self.assertAlmostEqual(sell[i], self.sell[i] * 0.93 ** i, places=9)
+        result = load_helpers('script_v6.5.py')['apply_uncertainty_discount'](self.buy, self.sell, 8, 0.03, 0.07)
+        self.assertEqual(result['buy'], apply_factors(self.buy, table['buy']))
+        self.assertEqual(result['sell'], apply_factors(self.sell, table['sell']))
+
+    def test_v826_discounts_each_period(self):
+        apply_discount = load_helpers('script v8.26')['apply_discount']
+        table = factor_table(CONFIG, 16, step=0.5)
+        buy = apply_discount(self.buy, 0.03, 0.5, 16)['values']
+        sell = apply_discount(self.sell, -0.07, 0.5, 16)['values']
+        self.assertEqual(buy, apply_factors(self.buy, table['buy']))
+        self.assertEqual(sell, apply_factors(self.sell, table['sell']))
+        self.assertEqual(buy[0], self.buy[0])
+        self.assertAlmostEqual(sell[15], self.sell[15] * 0.93 ** 7.5, places=9)
+
+    def test_script_py(self):
+        with open('./tests/action_params1.json', 'r', encoding='UTF-8') as file:
+            action_params = json.load(file)
+        runner = ScriptRunner.from_file('script.py')
+        runner.decide_payload(action_params)
+        params = runner.last_params
+        factors = factor_table({'BUY_UNCERTAINTY_DISCOUNT': 0.10, 'SELL_UNCERTAINTY_DISCOUNT': 0.10}, 8)
+        self.assertEqual(params['discounted_buy_forecast'], apply_factors(action_params['buy_forecast'], factors['buy']))
+        self.assertEqual(params['discounted_sell_forecast'],
+                         apply_factors(action_params['sell_forecast'], factors['sell']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+from backtest import BatchFeatures, run_backtest
+from benchmark import ScriptStrategy
+from fleet import MARKET_COLUMNS, run_fleet, simulate_site
+from sun_times import add_sun_times
+from test_backtest import synthetic_meter_data
+
+
+class TestFleet(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        df = synthetic_meter_data(days=1)
+        cls.market = df[[column for column in MARKET_COLUMNS if column in df.columns]]
+        own = df.drop(columns=list(cls.market.columns))
+        cls.sites = {'a': own, 'b': own.assign(house_power=df['house_power'] * 0.5)}
+        cls.full = df
+
+    def write_fleet(self, root):
+        self.market.to_pickle(os.path.join(root, 'market.pkl'))
+        for name, frame in self.sites.items():
+            # Stale prices in a site file are replaced by the market's
+            frame.assign(buy_price=999.0).to_pickle(os.path.join(root, name + '.pkl'))
+        fleet = {
+            'markets': {'QLD1': 'market.pkl'},
+            'sites': [
+                {'name': 'a', 'market': 'QLD1', 'script': 'script v8.26', 'meter_data': 'a.pkl',
+                 'battery_capacity': 20000, 'charge_rate': 5000},
+                {'name': 'b', 'market': 'QLD1', 'script': 'nsw_script.py', 'meter_data': 'b.pkl',
+                 'latitude': -27.4698, 'longitude': 153.0251},
+            ],
+        }
+        path = os.path.join(root, 'fleet.json')
+        with open(path, 'w', encoding='UTF-8') as file:
+            json.dump(fleet, file)
+        return path
+
+    def test_site_matches_single_backtest(self):
+        row, grid = simulate_site({'name': 'a', 'script': 'script v8.26', 'meter_data': self.sites['a'],
+                                   'battery_capacity': 20000, 'charge_rate': 5000}, self.market)
+        features = BatchFeatures(self.full, battery_capacity=20000, charge_rate=5000)
+        bill, ret_df = run_backtest(features, ScriptStrategy('script v8.26'))
+        self.assertAlmostEqual(row['bill'], bill)
+        self.assertTrue((grid == ret_df['grid_power']).all())
+
+    def test_run_fleet(self):
+        with tempfile.TemporaryDirectory() as root:
+            sites, totals, fleet_grid = run_fleet(self.write_fleet(root), max_workers=2)
+        self.assertEqual(list(sites['site']), ['a', 'b'])
+        self.assertEqual(totals['errors'], 0)
+        self.assertAlmostEqual(totals['bill'], sites['bill'].sum())
+        # Each site bills as a single-site backtest of its own frame
+        full_b = add_sun_times(self.full.assign(house_power=self.full['house_power'] * 0.5), -27.4698, 153.0251)
+        for name, script, frame, capacity in (('a', 'script v8.26', self.full, 20000),
+                                              ('b', 'nsw_script.py', full_b, 10000)):
+            features = BatchFeatures(frame, battery_capacity=capacity, charge_rate=5000)
+            bill = run_backtest(features, ScriptStrategy(script))[0]
+            self.assertAlmostEqual(sites.set_index('site').loc[name, 'bill'], bill)
+        self.assertLessEqual(totals['peak_export_kw'], sites['peak_export_kw'].sum() + 1e-9)
+        self.assertEqual(totals['peak_export_time'], fleet_grid.idxmin().isoformat())
+        self.assertIsInstance(fleet_grid, pd.Series)
+
+    def test_unknown_market(self):
+        with self.assertRaises(KeyError):
+            run_fleet({'markets': {}, 'sites': [{'name': 'x', 'market': 'NSW1', 'script': 'script.py'}]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import tempfile
+from datetime import date
+
+from meter_store import MeterStore, clean_meter_data, contiguous_ranges
+from mock_powston import MockSession
+
+
+class TestMeterStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.session = MockSession()
+        self.header = {'Authorization': 'Bearer local'}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def store(self, file_format='feather'):
+        return MeterStore(self.tmp.name, session=self.session, server='http://powston.local',
+                          headers=self.header, file_format=file_format)
+
+    def test_contiguous_ranges(self):
+        days = [date(2024, 11, 1), date(2024, 11, 2), date(2024, 11, 4)]
+        self.assertEqual(contiguous_ranges(days), [(days[0], days[1]), (days[2], days[2])])
+
+    def test_second_load_is_served_from_disk(self):
+        for file_format in ('feather', 'parquet'):
+            store = self.store(file_format)
+            first = store.load(1, '2024-11-07', '2024-11-08')
+            self.assertEqual(store.requests_made, 1)
+            again = self.store(file_format)
+            second = again.load(1, '2024-11-07', '2024-11-08')
+            self.assertEqual(again.requests_made, 0)
+            self.assertTrue(first.equals(second))
+            self.assertEqual(len(second), 576)
+            self.assertEqual(str(second.index.tz), 'Australia/Brisbane')
+
+    def test_only_missing_days_are_fetched(self):
+        store = self.store()
+        store.load(1, '2024-11-08', '2024-11-08')
+        store.load(1, '2024-11-06', '2024-11-08')
+        self.assertEqual(store.requests_made, 2)
+        self.assertEqual(store.cached_days(1), [date(2024, 11, 6), date(2024, 11, 7), date(2024, 11, 8)])
+        store.load(1, '2024-11-06', '2024-11-08')
+        self.assertEqual(store.requests_made, 2)
+
+    def test_clean_matches_direct_download(self):
+        response = self.session.get('http://powston.local/api/meter_data/1', headers=self.header).json()
+        expected = clean_meter_data(response)
+        self.assertTrue(expected.equals(self.store().load(1, date(2024, 11, 7), date(2024, 11, 8))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import io
+import json
+
+import pandas as pd
+
+from mock_powston import MockSession, check_source, serve
+
+
+class TestMockPowston(unittest.TestCase):
+
+    def setUp(self):
+        self.session = MockSession()
+        self.header = {'Authorization': 'Bearer local', 'Content-Type': 'application/json'}
+
+    def test_meter_data_is_filtered_by_date(self):
+        url = 'http://powston.local/api/meter_data/1?from_date="2024-11-08"&to_date="2024-11-08"'
+        response = self.session.get(url, headers=self.header)
+        meter_data_df = pd.read_json(io.StringIO(response.json()), orient='records')
+        self.assertEqual(len(meter_data_df), 288)
+        self.assertTrue((meter_data_df['interval_time'].dt.day == 8).all())
+
+    def test_site_and_errors(self):
+        site = self.session.get('http://powston.local/api/site/1', headers=self.header).json()
+        self.assertEqual(site['timezone'], 'Australia/Brisbane')
+        self.assertEqual(self.session.get('http://powston.local/api/site/99', headers=self.header).status_code, 404)
+        self.assertEqual(self.session.get('http://powston.local/api/site/1').status_code, 401)
+
+    def test_check_code_problems(self):
+        self.assertEqual(check_source("action = 'auto'\n"), [])
+        self.assertIn('Imports', check_source('import os\n')[0])
+        self.assertIn('SyntaxError', check_source('if True\n')[0])
+        self.assertIn('"_secret"', check_source('_secret = 1\n')[0])
+        response = self.session.post('http://powston.local/api/check_code',
+                                     json={'code': 'open("x")', 'inverter_action_id': 1}, headers=self.header)
+        self.assertFalse(response.json()['status'])
+
+    def test_http_server(self):
+        server, url = serve()
+        try:
+            import requests  # pylint: disable=import-outside-toplevel
+            with open('./tests/action_params1.json', 'r', encoding='UTF-8') as file:
+                action_params = json.load(file)
+            with open('script.py', 'r', encoding='UTF-8') as file:
+                body = {'code': file.read(), 'action_params': action_params, 'inverter_action_id': 1}
+            response = requests.post(url + '/api/sim_code', json=body, headers=self.header, timeout=10)
+            self.assertEqual(response.json()['action'], 'import')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import json
+import math
+
+from normalise import float_list, normalise_payload
+
+
+class TestNormalise(unittest.TestCase):
+
+    def setUp(self):
+        with open('./tests/action_params2.json', 'r', encoding='UTF-8') as file:
+            self.payload = json.load(file)
+
+    def test_clean_payload_is_not_copied(self):
+        payload, repairs = normalise_payload(self.payload)
+        self.assertIs(payload, self.payload)
+        self.assertEqual(repairs, [])
+
+    def test_float_list(self):
+        clean = [1.0, 2.5]
+        self.assertIs(float_list(clean)[0], clean)
+        self.assertEqual(float_list([1, 2]), ([1.0, 2.0], False))
+        self.assertEqual(float_list([None, '3.5', {'value': 4}, math.nan, 'x', 7], default=9.0),
+                         ([9.0, 3.5, 4.0, 4.0, 4.0, 7.0], True))
+        self.assertEqual(float_list('bad'), ([], True))
+        self.assertEqual(float_list(None), ([], False))
+
+    def test_repairs(self):
+        broken = dict(self.payload, buy_forecast=[20.0, None, 25.0], buy_price='31.5', rrp=None,
+                      weather_data={'hourly': dict(self.payload['weather_data']['hourly'],
+                                                   temperature_2m=[20, 'n/a', 22])})
+        broken['mqtt_data'] = dict(broken['mqtt_data'], solar_estimate={'pv_forecast_today': {'value': 12}})
+        payload, repairs = normalise_payload(broken)
+        self.assertEqual(repairs, ['buy_forecast', 'buy_price', 'weather_data.hourly.temperature_2m',
+                                   'mqtt_data.solar_estimate.pv_forecast_today'])
+        self.assertEqual(payload['buy_forecast'], [20.0, 20.0, 25.0])
+        self.assertEqual(payload['buy_price'], 31.5)
+        self.assertIsNone(payload['rrp'])
+        self.assertEqual(payload['weather_data']['hourly']['temperature_2m'], [20.0, 20.0, 22.0])
+        self.assertIs(payload['weather_data']['hourly']['global_tilted_irradiance_instant'],
+                      self.payload['weather_data']['hourly']['global_tilted_irradiance_instant'])
+        self.assertEqual(payload['mqtt_data']['solar_estimate']['pv_forecast_today'], 12.0)
+        self.assertEqual(broken['buy_forecast'], [20.0, None, 25.0])
+        self.assertEqual(normalise_payload(payload), (payload, []))
+
+    def test_unreadable_scalars_are_not_set(self):
+        broken = dict(self.payload, buy_price='n/a', battery_soc=math.nan, sell_price={'value': None})
+        payload, repairs = normalise_payload(broken)
+        self.assertEqual(repairs, ['buy_price', 'sell_price', 'battery_soc'])
+        for name in ('buy_price', 'sell_price', 'battery_soc'):
+            self.assertIsNone(payload[name])
+
+
+if __name__ == '__main__':
+    unittest.main()
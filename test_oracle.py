@@ -0,0 +1,55 @@
+import unittest
+import random
+
+from backtest import AlwaysAuto, BatchFeatures, V826Strategy, battery_step, run_backtest
+from oracle import ACTIONS, OracleStrategy, daily_regret, step_costs
+from test_backtest import synthetic_meter_data
+
+
+class RandomStrategy:
+    def prepare(self, features):
+        self.rng = random.Random(5)
+
+    def decide(self, i, soc):
+        return self.rng.choice(ACTIONS)
+
+
+class TestOracle(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.features = BatchFeatures(synthetic_meter_data(days=2), battery_capacity=20000, charge_rate=5000)
+        cls.oracle = OracleStrategy()
+        cls.oracle_bill, cls.oracle_df = run_backtest(cls.features, cls.oracle)
+
+    def test_step_costs_match_battery_step(self):
+        rng = random.Random(1)
+        hours = 5 / 60.0
+        for _ in range(500):
+            charge = rng.uniform(0, 20000)
+            house = rng.uniform(0, 5000)
+            solar = rng.choice([0.0, rng.uniform(0, 8000)])
+            next_charge, cost = step_costs([charge], house, solar, 25.0, 6.0, 20000, 5000, hours)
+            for k, action in enumerate(ACTIONS):
+                battery_w, grid_w = battery_step(action, charge, house, solar, 20000, 5000, hours)
+                grid_kwh = grid_w * hours / 1000.0
+                self.assertAlmostEqual(next_charge[k, 0], min(20000, max(0.0, charge + battery_w * hours)))
+                self.assertAlmostEqual(cost[k, 0], grid_kwh * (25.0 if grid_kwh > 0 else 6.0))
+
+    def test_oracle_beats_strategies(self):
+        for strategy in (AlwaysAuto(), V826Strategy(), RandomStrategy()):
+            bill = run_backtest(self.features, strategy)[0]
+            self.assertLessEqual(self.oracle_bill, bill, type(strategy).__name__)
+        # Acting on the exact charge can only beat the grid estimate by a little
+        self.assertAlmostEqual(self.oracle.expected_bill(50.0), self.oracle_bill, delta=abs(self.oracle_bill) * 0.01)
+
+    def test_daily_regret(self):
+        bill, ret_df = run_backtest(self.features, V826Strategy())
+        report = daily_regret(ret_df, self.oracle_df)
+        self.assertEqual(len(report), 2)
+        self.assertAlmostEqual(report['bill'].sum(), bill)
+        self.assertAlmostEqual(report['regret'].sum(), bill - self.oracle_bill)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,237 @@
+import unittest
+import ast
+import itertools
+import math
+import random
+
+import powston_helpers
+from mock_powston import check_source
+from script_runner import script_functions
+
+
+def load_helpers(filename):
+    with open(filename, 'r', encoding='UTF-8') as file:
+        return script_functions(file.read(), filename)
+
+
+def helper_source(filename, name):
+    """ast dump of one top-level function, for comparing pasted copies."""
+    with open(filename, 'r', encoding='UTF-8') as file:
+        tree = ast.parse(file.read())
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == name:
+            return ast.dump(node)
+    return None
+
+
+class TestPowstonHelpers(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(11)
+
+    def forecast(self, size):
+        return [self.rng.choice([round(self.rng.uniform(-5, 60), 1), 10.0, 20.0]) for _ in range(size)]
+
+    def test_helpers_follow_sandbox_rules(self):
+        with open(powston_helpers.__file__, 'r', encoding='UTF-8') as file:
+            source = file.read()
+        self.assertEqual(check_source(source), [])
+        tree = ast.parse(source)
+        names = {node.name for node in tree.body if isinstance(node, ast.FunctionDef)}
+        for node in ast.walk(tree):
+            self.assertNotIsInstance(node, (ast.JoinedStr, ast.Lambda, ast.Tuple))
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+                self.assertNotIn(node.func.id, names, 'helpers must not call each other')
+        self.assertTrue(all(len(line) <= 79 for line in source.splitlines()))
+
+    def test_rank_query_matches_sort(self):
+        for _ in range(500):
+            prices = self.forecast(self.rng.randint(1, 48))
+            value = self.rng.choice(prices + [15.0])
+            n = self.rng.randint(1, 60)
+            for highest in (True, False):
+                ranked = sorted(prices, reverse=highest)
+                threshold = ranked[min(n, len(prices)) - 1]
+                result = powston_helpers.rank_query(prices, value, n, highest)
+                self.assertEqual(result['in_best_n'], value >= threshold if highest else value <= threshold)
+                self.assertEqual(result['rank'], sum(1 for p in prices if (p > value if highest else p < value)) + 1)
+                self.assertEqual(result['best_price'], ranked[0])
+                self.assertEqual(result['best_index'], prices.index(ranked[0]))
+
+    def test_pasted_copies_match(self):
+        canonical = helper_source(powston_helpers.__file__, 'rank_query')
+        self.assertEqual(helper_source('script_v6.5.py', 'rank_query'), canonical)
+        canonical = helper_source(powston_helpers.__file__, 'best_spread')
+        self.assertEqual(helper_source('script.py', 'best_spread'), canonical)
+        canonical = helper_source(powston_helpers.__file__, 'plan_dispatch')
+        self.assertEqual(helper_source('script v8.26', 'plan_dispatch'), canonical)
+
+    def test_load_table_matches_ac_ladder(self):
+        config = {'PURE_BASE_LOAD_KWH_PER_HOUR': 4.5, 'AC_BEDROOM_ZONES_KW': 3.0, 'AC_HOUSE_ZONES_KW': 2.0,
+                  'AC_SETPOINTS': {'day': {'bedrooms': 25, 'house': 25}, 'night': {'bedrooms': 21, 'house': 27}}}
+        table = powston_helpers.build_load_table(config)
+
+        def ladder(delta, kw, steps):
+            if delta <= 0:
+                return 0.0
+            return kw * (steps[0] if delta <= 2 else steps[1] if delta <= 4 else steps[2])
+
+        helpers = load_helpers('script v8.26')
+        for _ in range(500):
+            hour = self.rng.randint(0, 23)
+            temp = self.rng.choice([self.rng.uniform(0, 45), float(self.rng.randint(15, 35))])
+            setpoint = config['AC_SETPOINTS']['night' if hour >= 21 or hour < 9 else 'day']
+            expected = (4.5 + ladder(temp - setpoint['bedrooms'], 3.0, (0.3, 0.7, 1.0))
+                        + ladder(temp - setpoint['house'], 2.0, (0.2, 0.5, 0.8)))
+            bucket = min(max(math.ceil(temp), table['low']), table['high'])
+            self.assertAlmostEqual(table['kwh'][hour][bucket - table['low']], expected)
+            # The script works out the same hours itself (temps start at midnight
+            # today, so 9 PM is index 21); earlier hours at 0 C are base load only
+            offset = (hour - 21) % 24
+            temps = [0.0] * (21 + offset) + [temp]
+            self.assertAlmostEqual(helpers['calculate_overnight_from_9pm'](21.0 + offset, temps, config)
+                                   - 4.5 * offset, expected)
+
+    def test_best_spread_matches_pairwise_search(self):
+        for _ in range(500):
+            buy = self.forecast(self.rng.randint(0, 10))
+            sell = self.forecast(self.rng.randint(0, 10))
+            pairs = [(sell[j] - buy[i], i, j) for i in range(len(buy)) for j in range(i + 1, len(sell))]
+            result = powston_helpers.best_spread(buy, sell)
+            self.assertEqual(result['exists'], any(gain > 0 for gain, _, _ in pairs))
+            if pairs:
+                spread = max(pair[0] for pair in pairs)
+                first = min((i, j) for gain, i, j in pairs if gain == spread)
+                self.assertEqual((result['spread'], result['buy_index'], result['sell_index']), (spread,) + first)
+            else:
+                self.assertIsNone(result['spread'])
+
+    def test_prefix_extrema_match_slices(self):
+        for size in (0, 1, 5, 16, 48):
+            values = self.forecast(size)
+            prefix = powston_helpers.prefix_extrema(values)
+            for hi in range(1, size + 1):
+                self.assertEqual(prefix['min'][hi - 1], min(values[:hi]))
+                self.assertEqual(prefix['max'][hi - 1], max(values[:hi]))
+
+    def test_plan_dispatch_matches_enumeration(self):
+        # 1 kWh grid levels and 1 kWh per period moves, so the DP is exact
+        config = {'BATTERY_CAPACITY_KWH': 10.0, 'MAX_CHARGE_RATE_KW': 2.0, 'MAX_DISCHARGE_RATE_KW': 2.0,
+                  'PLANNER_SOC_STEP': 10.0, 'PLANNER_FLOOR_PENALTY': 50.0}
+
+        def bill(buy, sell, net, soc, floor, actions):
+            stored = soc / 10.0
+            cost = 0.0
+            for p, action in enumerate(actions):
+                if action == 'import':
+                    flow = min(1.0, 10.0 - stored)
+                elif action == 'export':
+                    flow = -min(1.0, stored)
+                else:
+                    flow = min(max(-net[p], -1.0, -stored), 1.0, 10.0 - stored)
+                grid = flow + net[p]
+                cost += grid * (buy[p] if grid > 0 else sell[p])
+                stored += flow
+                cost += max(0.0, floor / 10.0 - stored) * 50.0
+            return cost - stored * max(min(sell), 0.0)
+
+        for _ in range(150):
+            n = self.rng.randint(1, 5)
+            buy = [float(self.rng.randint(-5, 60)) for _ in range(n)]
+            sell = [float(self.rng.randint(-5, 60)) for _ in range(n)]
+            net = [float(self.rng.randint(-2, 2)) for _ in range(n)]
+            soc = float(self.rng.randrange(0, 101, 10))
+            floor = self.rng.choice([0.0, 20.0, 30.0])
+            result = powston_helpers.plan_dispatch(buy, sell, net, soc, floor, config)
+            best = min(bill(buy, sell, net, soc, floor, actions)
+                       for actions in itertools.product(('auto', 'import', 'export'), repeat=n))
+            self.assertAlmostEqual(result['cost'], best)
+            self.assertAlmostEqual(bill(buy, sell, net, soc, floor, result['plan']), best)
+            self.assertEqual(result['action'], result['plan'][0])
+
+    def test_v826_schedules(self):
+        helpers = load_helpers('script v8.26')
+        config = {'MAX_DISCHARGE_RATE_KW': 10, 'BATTERY_CAPACITY_KWH': 40, 'PURE_BASE_LOAD_KWH_PER_HOUR': 0.8}
+        for _ in range(300):
+            sell = self.forecast(self.rng.randint(1, 48))
+            result = helpers['calculate_export_schedule'](sell, 25.0, config)
+            needed = min(int(25.0 / 5.0 + 1), len(sell))
+            ranked = sorted(range(len(sell)), key=lambda i: sell[i], reverse=True)
+            self.assertEqual(result['should_export'], 0 in ranked[:needed])
+            if result['should_export']:
+                self.assertEqual(result['rank'], ranked.index(0) + 1)
+            else:
+                self.assertEqual(result['best_period_in'], ranked[0])
+            buy = self.forecast(self.rng.randint(1, 48))
+            result = helpers['calculate_import_schedule'](10.0, 5.0, 60.0, buy, config)
+            self.assertEqual(result['should_import'], buy[0] == min(buy))
+
+    def test_v84_best_n(self):
+        helpers = load_helpers('script v8.4')
+        cfg = {'PEAK_END': 20, 'PEAK_START': 16}
+        for _ in range(300):
+            sell = self.forecast(10)
+            sell_now = self.rng.choice(sell)
+            result = helpers['peak_export_best_n'](80.0, sell, sell_now, 16.0, 20.0, 40000, 5.0, cfg)
+            threshold = sorted(sell, reverse=True)[min(5, len(sell)) - 1]
+            self.assertEqual(result['should_export'], sell_now >= threshold)
+            if not result['should_export']:
+                self.assertEqual(result['best_n_threshold'], threshold)
+                self.assertEqual(result['next_export_price'], max(sell))
+
+    def test_overnight_rank_matches_sort(self):
+        cfg = {'TARGET_MORNING_SOC_MIN': 10, 'TARGET_MORNING_SOC_MAX': 20, 'PEAK_START': 16, 'PEAK_END': 20}
+        for filename in ('script v8.4', 'script v7.14.1', 'script7.7.py'):
+            overnight_opportunities = load_helpers(filename)['overnight_opportunities']
+            for _ in range(300):
+                # From 9 PM to a 6 AM sunrise every period is overnight
+                sell = self.forecast(self.rng.randint(1, 18))
+                result = overnight_opportunities(sell, 21.0, 6.0, self.rng.uniform(0, 100), 40000, 5.0, cfg)
+                ranked = sorted(range(len(sell)), key=lambda i: sell[i], reverse=True)
+                limit = min(result['periods_needed'], len(sell))
+                self.assertEqual(result['current_rank'], ranked.index(0) + 1)
+                self.assertEqual(result['current_is_good'], 0 in ranked[:limit])
+                self.assertEqual([p['index'] for p in result['best_periods']], ranked[:limit])
+
+    def test_shared_helpers_match_script_copies(self):
+        v84 = load_helpers('script v8.4')
+        v826 = load_helpers('script v8.26')
+        cfg = {'GTI_SUNNY_THRESHOLD': 6000, 'GTI_NORMAL_THRESHOLD': 3500, 'PEAK_START': 16, 'PEAK_END': 20}
+        for _ in range(300):
+            hour = self.rng.randint(0, 47) * 0.5
+            start = self.rng.randint(0, 23)
+            end = self.rng.randint(0, 23)
+            inside = powston_helpers.in_window(hour, start, end)['inside']
+            self.assertEqual(inside, v84['in_window'](hour, start, end))
+            self.assertEqual(inside, v826['in_window'](hour, start, end)['inside'])
+
+            inverters = {'inverter_params_%d' % k: {'battery_soc': self.rng.choice([50.0, 72, 'x', None])}
+                         for k in range(self.rng.randint(0, 2))}
+            ids = [0, 1, 5]
+            soc = self.rng.choice([40.0, 61, None])
+            mqtt = self.rng.choice([None, {}, {'solar_estimate': {'combined_pv_battery_state_of_charge': 64.0}}])
+            result = powston_helpers.combined_soc(soc, inverters, ids, mqtt, 2.5)
+            self.assertEqual(result['soc'], v826['get_combined_soc'](soc, inverters, ids, mqtt))
+            if result['source'] != 'mqtt':
+                self.assertEqual(result['soc'], v84['get_combined_soc'](soc, inverters, ids))
+
+            forecast = self.forecast(self.rng.randint(0, 20))
+            rate = self.rng.choice([0.03, -0.02])
+            hours = self.rng.randint(0, 24)
+            self.assertEqual(powston_helpers.apply_discount(forecast, rate, 1, hours)['values'],
+                             v84['apply_discount'](forecast, hours, rate))
+            self.assertEqual(powston_helpers.apply_discount(forecast, rate, 0.5, len(forecast)),
+                             v826['apply_discount'](forecast, rate, 0.5, len(forecast)))
+
+            gti = self.rng.choice([2000, 3500, 5999, 6000, 8000])
+            self.assertEqual(powston_helpers.classify_solar(gti, cfg)['class'], v84['classify_solar'](gti, cfg))
+
+            sell = self.forecast(len(forecast))
+            for peak_start, peak_end in ((16, 20), (22, 2)):
+                cfg_peak = dict(cfg, PEAK_START=peak_start, PEAK_END=peak_end)
+                self.assertEqual(powston_helpers.evening_premium(forecast, sell, hour, peak_start, peak_end)['premium'],
+                                 v84['compute_evening_premium'](forecast, sell, hour, cfg_peak))
+
+
+if __name__ == '__main__':
+    unittest.main()
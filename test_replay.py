@@ -0,0 +1,121 @@
+import unittest
+import contextlib
+import io
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from replay import main, paced, read_payloads, replay, summarise
+from script_runner import ScriptRunner
+from sweep import apply_overrides
+
+PAYLOAD = './tests/action_params2.json'
+# v8.26 decisions recorded across priorities; each record's config holds its CONFIG overrides
+V826_DECISIONS = './tests/v826_decisions.jsonl'
+
+
+def payload_log(count=6):
+    with open(PAYLOAD, 'r', encoding='UTF-8') as file:
+        base = json.load(file)
+    start = datetime.fromisoformat(base['interval_time'])
+    payloads = []
+    for k in range(count):
+        payload = dict(base, interval_time=(start + timedelta(minutes=5 * k)).isoformat())
+        payload['buy_price'] = base['buy_price'] + 10 * k
+        payloads.append(payload)
+    return payloads
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestReplay(unittest.TestCase):
+
+    def test_read_payloads(self):
+        payloads = payload_log(3)
+        with tempfile.TemporaryDirectory() as root:
+            log = os.path.join(root, 'b.jsonl')
+            with open(log, 'w', encoding='UTF-8') as file:
+                for payload in payloads[1:]:
+                    file.write(json.dumps(payload) + '\n\n')
+            with open(os.path.join(root, 'a.json'), 'w', encoding='UTF-8') as file:
+                json.dump(payloads[0], file)
+            self.assertEqual(list(read_payloads(root)), payloads)
+            self.assertEqual(list(read_payloads(log)), payloads[1:])
+        self.assertEqual(len(list(read_payloads(PAYLOAD))), 1)
+
+    def test_paced(self):
+        payloads = payload_log(4)
+        clock = FakeClock()
+        self.assertEqual(list(paced(payloads, 60.0, clock.sleep, clock)), payloads)
+        self.assertEqual(clock.sleeps, [5.0, 5.0, 5.0])
+        clock = FakeClock()
+        list(paced(payloads, None, clock.sleep, clock))
+        self.assertEqual(clock.sleeps, [])
+
+    def test_replay_matches_runner(self):
+        payloads = payload_log(4)
+        payloads.insert(2, dict(payloads[1], buy_price=None))
+        with tempfile.TemporaryDirectory() as root:
+            output = os.path.join(root, 'decisions.jsonl')
+            records = list(replay('script v8.26', payloads, output=output))
+            with open(output, 'r', encoding='UTF-8') as file:
+                written = [json.loads(line) for line in file]
+        self.assertEqual(written, records)
+        runner = ScriptRunner.from_file('script v8.26')
+        for payload, record in zip(payloads, records):
+            if record['error'] is None:
+                self.assertEqual((record['action'], record['reason']), runner.decide_payload(payload))
+                self.assertEqual(record['priority'], runner.decisions.priority)
+            self.assertEqual(record['interval_time'], payload['interval_time'])
+        summary = summarise(records)
+        self.assertEqual(summary['payloads'], 5)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['repaired'], 0)
+        raw = list(replay('script v8.26', [dict(payloads[0], buy_price='41.5')]))[0]
+        self.assertEqual(raw['repairs'], [])
+        repaired = list(replay('script v8.26', [dict(payloads[0], buy_price='41.5')], normalise=True))[0]
+        self.assertEqual(repaired['repairs'], ['buy_price'])
+        self.assertIsNone(repaired['error'])
+        self.assertEqual(sum(summary['actions'].values()), 4)
+        self.assertGreater(summary['p95_ms'], 0.0)
+
+    def test_v826_matches_recorded_decisions(self):
+        with open(PAYLOAD, 'r', encoding='UTF-8') as file:
+            base = json.load(file)
+        with open('script v8.26', 'r', encoding='UTF-8') as file:
+            source = file.read()
+        recorded = list(read_payloads(V826_DECISIONS))
+        priorities = set()
+        configs = dict.fromkeys(json.dumps(record['config'], sort_keys=True) for record in recorded)
+        for config in map(json.loads, configs):
+            expected = [record for record in recorded if record['config'] == config]
+            runner = ScriptRunner(apply_overrides(source, config), 'script v8.26')
+            records = replay(runner, [dict(base, **record['inputs']) for record in expected])
+            for record, want in zip(records, expected):
+                self.assertIsNone(record['error'])
+                self.assertEqual((record['action'], record['reason'], record['priority']),
+                                 (want['action'], want['reason'], want['priority']))
+                priorities.add(record['priority'])
+        self.assertGreater(len(priorities), 15)
+        self.assertIn(90, priorities)
+
+    def test_main(self):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertEqual(main(['script v8.26', PAYLOAD, '--quiet']), 0)
+        self.assertIn('1 payloads, 0 errors', output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import ast
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from bundle import problems
+from rule_compiler import (MAX_TESTS, Chain, Leaf, build_tree, compile_rules, count_comparisons, evaluate_chain,
+                           load_rules, main, parse_condition, parse_rules, sample_envs, tree_stats)
+
+RULES_FILE = './tests/script_rules.py'
+
+HOURS = {
+    'morning': {'priority': 20, 'when': ['hour < 10'], 'action': 'import'},
+    'midday': {'priority': 10, 'when': ['hour < 12', 'sell_price > 20'], 'action': 'export'},
+    'late': {'priority': 5, 'when': ['12 <= hour', 'not daytime'], 'action': 'auto', 'set': {'solar': 'curtail'}},
+}
+
+
+def paths(tree, seen=()):
+    if tree is None or isinstance(tree, Leaf):
+        yield list(seen)
+        return
+    if isinstance(tree, Chain):
+        # Every test a decision can reach: hoisted ones once, the rest per step
+        hoisted = [predicate.text for predicate in tree.hoisted]
+        yield list(seen) + hoisted + [predicate.text for _, conditions in tree.steps
+                                      for predicate, _ in conditions if predicate.text not in hoisted]
+        return
+    yield from paths(tree.when_true, seen + (tree.predicate.text,))
+    yield from paths(tree.when_false, seen + (tree.predicate.text,))
+
+
+class TestRuleCompiler(unittest.TestCase):
+
+    def test_parse_condition(self):
+        pairs = parse_condition('14 < hour < 16')
+        self.assertEqual([(predicate.text, expected) for predicate, expected in pairs],
+                         [('hour <= 14', False), ('hour < 16', True)])
+        (first, expected), = parse_condition("'export' == action")
+        (second, _), = parse_condition('action != "export"')
+        self.assertEqual(first.text, second.text)
+        self.assertTrue(expected)
+        (predicate, expected), = parse_condition('not daytime')
+        self.assertEqual((predicate.text, expected), ('daytime', False))
+        (predicate, expected), = parse_condition('battery_soc >= full_battery')
+        self.assertEqual((predicate.text, expected), ('battery_soc < full_battery', False))
+
+    def test_implied_tests_are_skipped(self):
+        code = compile_rules(HOURS)
+        self.assertEqual(code.count('hour'), 2)
+        for hour, daytime, action in ((9, True, 'import'), (11, True, None), (13, False, 'auto')):
+            env = {'hour': hour, 'sell_price': 10, 'daytime': daytime}
+            exec(code, env)  # pylint: disable=exec-used
+            self.assertEqual(env.get('action'), action)
+        tree = build_tree(parse_rules(HOURS))
+        self.assertEqual(max(len(path) for path in paths(tree)), 3)
+
+    def test_tree_matches_chain(self):
+        rules = load_rules(RULES_FILE)
+        parsed = parse_rules(rules)
+        code = compile(compile_rules(rules), 'compiled', 'exec')
+        for env in sample_envs(rules, 2000, seed=1):
+            rule = evaluate_chain(parsed, dict(env))[0]
+            exec(code, env)  # pylint: disable=exec-used
+            self.assertEqual((env['action'], env['reason'], env['solar']),
+                             (rule.action, rule.reason, rule.assign['solar']))
+        for budget in (MAX_TESTS, 0, None):
+            for path in paths(build_tree(parsed, budget=budget)):
+                self.assertEqual(len(path), len(set(path)), (budget, path))
+        counts = count_comparisons(rules, sample_envs(rules, 2000, seed=2))
+        self.assertLess(counts['tree_mean'], counts['chain_mean'] * 0.85)
+        self.assertLessEqual(counts['tree_max'], counts['chain_max'])
+
+    def test_budget_and_line_length(self):
+        rules = load_rules(RULES_FILE)
+        parsed = parse_rules(rules)
+        ladder = tree_stats(build_tree(parsed, budget=0))
+        self.assertLessEqual(ladder['tests'], sum(len(rule.conditions) for rule in parsed))
+        full = tree_stats(build_tree(parsed))
+        for budget in (60, 150):
+            self.assertLessEqual(tree_stats(build_tree(parsed, budget=budget))['tests'], budget)
+        self.assertGreater(full['tests'], 300)
+        code = compile_rules(rules)
+        self.assertLess(len(code.splitlines()), 150)
+        self.assertEqual(problems(code), [])
+        self.assertEqual(problems(compile_rules(rules, max_tests=None)), [])
+        envs = sample_envs(rules, 2000, seed=3)
+        unlimited = count_comparisons(rules, envs, max_tests=None)
+        budgeted = count_comparisons(rules, envs)
+        self.assertLess(unlimited['tree_mean'], budgeted['tree_mean'])
+        self.assertLess(budgeted['tree_mean'], budgeted['chain_mean'])
+
+    def test_guarded_tests_are_not_hoisted(self):
+        rules = {
+            'spike': {'priority': 3, 'when': ['sell_forecast', 'max(sell_forecast) > 100', 'battery_soc > 50'],
+                      'action': 'export'},
+            'hold': {'priority': 2, 'when': ['sell_forecast', 'max(sell_forecast) > 100'], 'action': 'auto'},
+            'cheap': {'priority': 1, 'when': ['buy_price < 5', 'battery_soc < 90'], 'action': 'import'},
+            'shared': {'priority': 0, 'when': ['buy_price < 5'], 'action': 'charge'},
+        }
+        parsed = parse_rules(rules)
+        for path in paths(build_tree(parsed, budget=0)):
+            self.assertEqual(len(path), len(set(path)))
+        code = compile_rules(rules, max_tests=0)
+        self.assertIn('rule_test_', code)
+        self.assertNotIn('= max(', code)
+        for forecast, soc, price, action in (([], 60, 3, 'import'), ([120], 60, 3, 'export'),
+                                             ([120], 40, 9, 'auto'), ([], 95, 3, 'charge')):
+            env = {'sell_forecast': forecast, 'battery_soc': soc, 'buy_price': price}
+            exec(code, env)  # pylint: disable=exec-used
+            self.assertEqual(env['action'], action)
+
+    def test_sandbox_rules(self):
+        tree = ast.parse(compile_rules(load_rules(RULES_FILE)))
+        for node in ast.walk(tree):
+            self.assertNotIsInstance(node, (ast.JoinedStr, ast.Lambda, ast.Tuple))
+        for rules in ({'a': {'priority': 1, 'when': ['hour in (1, 2)'], 'action': 'auto'}},
+                      {'a': {'priority': 1, 'when': [], 'action': 'auto', 'set': {'window': (1, 2)}}},
+                      {'a': {'when': [], 'action': 'auto'}},
+                      {'a': {'priority': 1, 'action': 'auto', 'then': 'export'}},
+                      {'a': {'priority': 1, 'when': ['hour <'], 'action': 'auto'}}):
+            with self.assertRaises(ValueError):
+                compile_rules(rules)
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as root:
+            output = os.path.join(root, 'compiled.py')
+            with contextlib.redirect_stderr(io.StringIO()) as report:
+                self.assertEqual(main([RULES_FILE, '--output', output, '--samples', '200', '--indent', '1']), 0)
+            with open(output, 'r', encoding='UTF-8') as file:
+                code = file.read()
+        self.assertTrue(code.startswith('    # Compiled from'))
+        self.assertIn('200 decisions: if/elif chain', report.getvalue())
+        compile('if True:\n' + code, 'compiled', 'exec')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,6 @@
 import unittest
-import os
 import json
-import requests
+from mock_powston import client
 
 class InverterDict(dict):
     """
@@ -60,11 +59,8 @@ class TestUserScript(unittest.TestCase):
     
     def __init__(self, *args, **kwargs):
         super(TestUserScript, self).__init__(*args, **kwargs)
-        self.API_KEY = os.getenv("POWSTON_API_KEY")
-        API_KEY = os.getenv("POWSTON_API_KEY")
-        if not self.API_KEY:
-            self.fail("POWSTON_API_KEY environment variable is not set")
-            return
+        # Offline against the recorded fixtures unless POWSTON_API_KEY is set
+        self.session, self.powston_test_server, self.header = client()
     
         filename = "script.py"
         try:
@@ -73,11 +69,6 @@ class TestUserScript(unittest.TestCase):
         except FileNotFoundError:
             self.fail(f"R001 File {filename} not found")
             return
-        self.powston_test_server = os.getenv("POWSTON_TEST_SERVER", 'https://dev.inverterintelligence.com')
-        self.header = {
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json"
-        }
     
     def test_sim_script(self):
         powston_api_sim_code_endpoint = f'{self.powston_test_server}/api/sim_code'
@@ -94,7 +85,7 @@ class TestUserScript(unittest.TestCase):
             "inverters": InverterDict({'battery_power': 0, 'house_power': 0, 'solar_power': 0})
         }
         
-        sim_code_response = requests.post(powston_api_sim_code_endpoint, json=body, headers=self.header).json()
+        sim_code_response = self.session.post(powston_api_sim_code_endpoint, json=body, headers=self.header).json()
         
         self.assertEqual(sim_code_response['action'], 'import', "Expected charge action")
         self.assertIn('sell high opportunity exists', sim_code_response['reason'], "Expected sell high opportunity exists")
@@ -109,14 +100,14 @@ class TestUserScript(unittest.TestCase):
         
         
         try:
-            check_code_response = requests.post(powston_api_test_code_endpoint, json=body, headers=self.header)
+            check_code_response = self.session.post(powston_api_test_code_endpoint, json=body, headers=self.header)
             check_code_response.raise_for_status()
             
             response_json = check_code_response.json()
             self.assertEqual(check_code_response.status_code, 200, "Expected status code 200")
             self.assertIn('Success', response_json['problems'], "Expected 'Success' in problems")
             self.assertTrue(response_json['status'], "Expected status to be True")
-        except requests.RequestException as e:
+        except IOError as e:
             self.fail(f"Request failed: {str(e)}")
         except KeyError as e:
             self.fail(f"Unexpected response format: {str(e)}")
@@ -0,0 +1,44 @@
+import contextlib
+import io
+import unittest
+
+from script_profiler import main, profile_script, section_map
+
+PAYLOAD = './tests/action_params2.json'
+
+
+class TestScriptProfiler(unittest.TestCase):
+
+    def test_section_map(self):
+        with open('script v8.26', 'r', encoding='UTF-8') as file:
+            source = file.read()
+        sections = section_map(source)
+        lines = source.splitlines()
+        self.assertEqual(len(sections), len(lines))
+        priority_99 = lines.index('# V8.15: Priority 99 — Always sell threshold (MOVED FROM 80)') + 1
+        self.assertEqual(sections[priority_99 + 1], 'Priority 99 — Always sell threshold (MOVED FR...')
+        overnight = lines.index('def calculate_overnight_from_9pm(solar_start_hour, temp_forecast, config):') + 1
+        self.assertEqual(sections[overnight + 5], 'calculate_overnight_from_9pm()')
+
+    def test_profile_v826(self):
+        profile = profile_script('script v8.26', [PAYLOAD], repeat=3, budget_ms=10000, top=5)
+        self.assertEqual(len(profile.wall_ms), 1)
+        self.assertFalse(profile.over_budget)
+        self.assertGreater(profile.peak_kib, 0)
+        names = [section['section'] for section in profile.sections]
+        self.assertIn('calculate_overnight_from_9pm()', names)
+        self.assertTrue(any(name.startswith('Priority 1 ') for name in names))
+        self.assertEqual(len(profile.hot_lines), 5)
+        self.assertIn('budget', profile.format())
+
+    def test_budget_fails(self):
+        profile = profile_script('script v8.4', [PAYLOAD], repeat=1, budget_ms=0.0)
+        self.assertTrue(profile.over_budget)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertEqual(main(['script.py', './tests/action_params1.json', '--repeat', '1', '--budget-ms', '0']),
+                             1)
+        self.assertIn('budget', output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import unittest
+import json
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from astral import LocationInfo
+
+import script_runner
+from script_runner import IntervalState, ScriptRunner, action_churn, compile_script, latency_percentiles
+from sun_times import sun_times
+
+ASSIGNMENT_SCRIPT = """
+action = 'auto'
+reason = 'hold'
+if buy_price < 10:
+    action = 'import'
+    reason = 'cheap %.1f' % buy_price
+"""
+
+DECISIONS_SCRIPT = """
+def helper(value):
+    return {"double": value * 2}
+
+result = helper(sell_price)
+if sell_price > 30:
+    action = decisions.reason("export", "spike", priority=99)
+if sell_price > 20:
+    action = decisions.reason("auto", "high", priority=50)
+action = decisions.reason("auto", "default %d" % result["double"], priority=1)
+"""
+
+
+class TestScriptRunner(unittest.TestCase):
+
+    def setUp(self):
+        script_runner.clear_cache()
+        self.interval_time = datetime(2024, 11, 7, 13, 0)
+
+    def test_compile_is_cached_by_content(self):
+        first = compile_script(ASSIGNMENT_SCRIPT, 'a.py')
+        second = compile_script(ASSIGNMENT_SCRIPT, 'a.py')
+        self.assertIs(first, second)
+        self.assertIsNot(first, compile_script(ASSIGNMENT_SCRIPT + '\n', 'a.py'))
+
+    def test_assignment_script(self):
+        runner = ScriptRunner(ASSIGNMENT_SCRIPT)
+        self.assertEqual(runner.decide(self.interval_time, buy_price=5.0), ('import', 'cheap 5.0'))
+        self.assertEqual(runner.decide(self.interval_time, buy_price=50.0), ('auto', 'hold'))
+
+    def test_decisions_highest_priority_wins(self):
+        runner = ScriptRunner(DECISIONS_SCRIPT)
+        self.assertEqual(runner.decide(self.interval_time, sell_price=40.0), ('export', 'spike'))
+        self.assertEqual(runner.decide(self.interval_time, sell_price=25.0), ('auto', 'high'))
+        self.assertEqual(runner.decide(self.interval_time, sell_price=5.0), ('auto', 'default 10'))
+
+    def test_globals_are_reused(self):
+        runner = ScriptRunner(ASSIGNMENT_SCRIPT)
+        namespace = runner.globals
+        runner.decide(self.interval_time, buy_price=5.0)
+        runner.decide(self.interval_time, buy_price=6.0)
+        self.assertIs(runner.globals, namespace)
+        self.assertNotIn('action', namespace)
+
+    def test_defaults_and_overrides(self):
+        runner = ScriptRunner("action = 'auto'\nreason = str(battery_capacity)\n", battery_capacity=25000)
+        self.assertEqual(runner.decide(self.interval_time)[1], '25000')
+        self.assertEqual(runner.decide(self.interval_time, battery_capacity=1)[1], '1')
+
+    def test_run_statistics(self):
+        self.assertEqual(action_churn(['auto', 'auto', 'import', 'auto', 'auto']), 2)
+        self.assertEqual(latency_percentiles([0.001] * 10)['p95_ms'], 1.0)
+        self.assertEqual(latency_percentiles([])['max_ms'], 0.0)
+        latencies = [0.0004, 0.0012, 0.0001, 0.0030, 0.0007, 0.0009, 0.0007]
+        stats = latency_percentiles(latencies)
+        for key, fraction in (('p50_ms', 50), ('p95_ms', 95), ('p99_ms', 99)):
+            self.assertAlmostEqual(stats[key], np.percentile(np.asarray(latencies) * 1000.0, fraction))
+        self.assertAlmostEqual(stats['mean_ms'], 1.0)
+        self.assertEqual(stats['max_ms'], 3.0)
+
+    def test_site_sun_times(self):
+        script = "action = 'auto'\nreason = sunrise.isoformat() + ' ' + sunset.isoformat()\n"
+        brisbane = LocationInfo('Brisbane', 'Australia', 'Australia/Brisbane', -27.4698, 153.0251)
+        for runner in (ScriptRunner(script, location=brisbane),
+                       ScriptRunner(script, latitude=-27.4698, longitude=153.0251)):
+            for day in (date(2024, 6, 21), date(2024, 12, 21)):
+                times = sun_times(-27.4698, 153.0251, day, 'Australia/Brisbane')
+                interval_time = datetime(day.year, day.month, day.day, 12, 0, tzinfo=ZoneInfo('Australia/Brisbane'))
+                self.assertEqual(runner.decide(interval_time)[1],
+                                 times['sunrise'].isoformat() + ' ' + times['sunset'].isoformat())
+            given = datetime(2024, 12, 21, 5, 0)
+            self.assertEqual(runner.decide(self.interval_time, sunrise=given, sunset=given)[1],
+                             given.isoformat() + ' ' + given.isoformat())
+        self.assertIsNone(ScriptRunner(script).sun_table)
+
+    def test_interval_state(self):
+        base = {'inverters': {'a': {'battery_soc': 0}, 'b': {'battery_soc': 0}}, 'weather_data': {'hourly': {}}}
+        state = IntervalState(base, {'buy_price': [5.0, 50.0], 'temperature_2m': [20.0, 30.0]}, {
+            'battery_soc': [('battery_soc',), ('inverters', 'a', 'battery_soc'), ('inverters', 'b', 'battery_soc')],
+            'temperature_2m': [('weather_data', 'hourly', 'temperature_2m')]})
+        runner = ScriptRunner(ASSIGNMENT_SCRIPT + "leftover = 1\n")
+        self.assertEqual(runner.decide_state(state, 0, interval_time=self.interval_time, battery_soc=40),
+                         ('import', 'cheap 5.0'))
+        namespace = state.load(1, battery_soc=60)
+        self.assertIs(state.load(1, battery_soc=60), namespace)
+        self.assertNotIn('leftover', namespace)
+        self.assertEqual(namespace['buy_price'], 50.0)
+        self.assertEqual(namespace['weather_data'], {'hourly': {'temperature_2m': 30.0}})
+        self.assertEqual([inverter['battery_soc'] for inverter in namespace['inverters'].values()], [60, 60])
+        self.assertNotIn('temperature_2m', namespace)
+        self.assertEqual(base['inverters']['a']['battery_soc'], 0)
+
+    def test_payload(self):
+        with open("./tests/action_params1.json", "r", encoding="UTF-8") as file:
+            action_params = json.load(file)
+        runner = ScriptRunner.from_file('script.py')
+        action, reason = runner.decide_payload(action_params)
+        self.assertEqual(action, 'import')
+        self.assertIn('sell high opportunity exists', reason)
+
+    def test_v826_skips_outranked_reasons(self):
+        with open('./tests/action_params2.json', 'r', encoding='UTF-8') as file:
+            payload = json.load(file)
+        runner = ScriptRunner.from_file('script v8.26')
+        winners = set()
+        for soc, sell_price in ((50.0, 5.0), (50.0, 40.0), (100.0, 10.0), (1.0, 10.0)):
+            for hour in (2, 10, 17, 22):
+                payload = dict(payload, battery_soc=soc, buy_price=20.0, sell_price=sell_price,
+                               interval_time=payload['interval_time'][:11] + '%02d:00:00+10:00' % hour)
+                action, reason = runner.decide_payload(payload)
+                self.assertEqual(runner.last_params['reason_priority'], runner.decisions.priority)
+                self.assertEqual(action, runner.decisions.action)
+                winners.add(runner.decisions.priority)
+                if runner.decisions.priority == 1:
+                    line1, line2 = reason.split('\n')
+                    self.assertEqual(line1.count('|'), 1)
+                    self.assertTrue(line2.startswith('P1: '))
+        self.assertIn(1, winners)
+        self.assertIn(99, winners)
+
+    def test_module_comprehensions_see_script_variables(self):
+        # v7.14.1 and v8.4 filter the forecast on ``hour`` in a module-level
+        # comprehension (Priority 99), which needs one namespace per run
+        with open('./tests/action_params2.json', 'r', encoding='UTF-8') as file:
+            base = json.load(file)
+        for filename in ('script v7.14.1', 'script v8.4'):
+            runner = ScriptRunner.from_file(filename)
+            for sell_price in (10.0, 50.0, 150.0):
+                for hour in (2, 10, 17, 22):
+                    payload = dict(base, sell_price=sell_price, battery_soc=50.0, gti_today=3000.0,
+                                   gti_sum_tomorrow=4000.0, optimal_charging=10000.0, optimal_discharging=10000.0,
+                                   inverters={name: {'battery_soc': 50.0} for name in base['inverters']},
+                                   interval_time=base['interval_time'][:11] + '%02d:00:00+10:00' % hour)
+                    runner.decide_payload(payload)
+                    self.assertIsNotNone(runner.decisions.priority)
+                    if sell_price == 50.0:
+                        self.assertIn('overnight_buys', runner.last_params, filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
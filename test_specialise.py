@@ -0,0 +1,154 @@
+import ast
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from bundle import problems
+from replay import read_payloads, replay
+from script_runner import ScriptRunner
+from specialise import main, specialise, wrap_lines
+
+PAYLOAD = './tests/action_params2.json'
+V826_DECISIONS = './tests/v826_decisions.jsonl'
+
+SCRIPT = '''"""Site script."""
+CONFIG = {
+    "FULL_SOC": 98,  # percent
+    "RATE_KW": 5.0,
+    "PERIOD_HOURS": 0.5,
+    "SPIKES": True,
+    "SETPOINTS": {"day": 25},
+}
+
+
+def spike_reason(price):
+    """Only the spike branch needs this."""
+    return {"text": "spike %.1f" % price}
+
+
+FULL = float(CONFIG["FULL_SOC"])
+step_kwh = CONFIG["RATE_KW"] * CONFIG["PERIOD_HOURS"]
+if CONFIG["SPIKES"] and sell_price > 100:
+    action = decisions.reason("export", spike_reason(sell_price)["text"], priority=90)
+if battery_soc < FULL and buy_price < CONFIG.get("CHEAP", 5) and step_kwh > 1:
+    action = decisions.reason("import", "cheap", priority=50)
+if CONFIG["SETPOINTS"]["day"] > 30:
+    action = decisions.reason("auto", "hot", priority=40)
+action = decisions.reason("auto", "hold", priority=1)
+'''
+
+
+class TestSpecialise(unittest.TestCase):
+
+    def test_folds_config_and_prunes(self):
+        report = {}
+        folded = specialise(SCRIPT, report=report)
+        self.assertIn('FULL = 98.0', folded)
+        self.assertIn('battery_soc < 98.0 and buy_price < 5', folded)
+        self.assertIn('sell_price > 100', folded)
+        self.assertNotIn('hot', folded)
+        self.assertNotIn('"""', folded)
+        self.assertEqual(report['pruned'], 1)
+        plain = specialise(SCRIPT, {'SPIKES': False}, report)
+        self.assertNotIn('spike_reason', plain)
+        self.assertEqual(report['dropped'], ['spike_reason'])
+        interval = datetime(2024, 11, 7, 13, 0)
+        for source, spikes in ((SCRIPT, True), (folded, True), (plain, False)):
+            runner = ScriptRunner(source)
+            self.assertEqual(runner.decide(interval, sell_price=150.0, buy_price=3.0, battery_soc=50.0),
+                             ('export', 'spike 150.0') if spikes else ('import', 'cheap'))
+            self.assertEqual(runner.decide(interval, sell_price=10.0, buy_price=3.0, battery_soc=99.0),
+                             ('auto', 'hold'))
+
+    def test_keeps_what_it_cannot_fold(self):
+        source = ('CONFIG = {"A": 1}\n'
+                  'def f(CONFIG):\n'
+                  '    return {"a": CONFIG["A"]}\n')
+        with self.assertRaises(ValueError):
+            specialise(source)
+        with self.assertRaises(ValueError):
+            specialise('CONFIG = {"A": 1}\nCONFIG["A"] = 2\n')
+        with self.assertRaises(ValueError):
+            specialise('CONFIG = {"A": 1}\nCONFIG.update(A=2)\n')
+        with self.assertRaises(KeyError):
+            specialise(SCRIPT, {'MISSING': 1})
+        folded = specialise('CONFIG = {"A": [1, 2], "B": 0}\n'
+                            'x = CONFIG["A"]\n'
+                            'y = 1 / CONFIG["B"] if hour else 0\n'
+                            'float = int\n'
+                            'z = float(CONFIG["B"])\n')
+        tree = ast.parse(folded)
+        self.assertIn('x = CONFIG[\'A\']', folded)
+        self.assertIn('1 / 0', folded)
+        self.assertIn('z = float(0)', folded)
+        self.assertEqual(len(tree.body), 5)
+
+    def test_v826_matches_recorded_decisions(self):
+        with open(PAYLOAD, 'r', encoding='UTF-8') as file:
+            base = json.load(file)
+        with open('script v8.26', 'r', encoding='UTF-8') as file:
+            source = file.read()
+        recorded = list(read_payloads(V826_DECISIONS))
+        configs = dict.fromkeys(json.dumps(record['config'], sort_keys=True) for record in recorded)
+        for config in map(json.loads, configs):
+            expected = [record for record in recorded if record['config'] == config]
+            report = {}
+            specialised = specialise(source, config, report)
+            self.assertLess(len(specialised), len(source) * 0.65)
+            self.assertEqual(problems(specialised), [])
+            self.assertEqual('plan_dispatch' in report['dropped'], not config.get('PLANNER_ENABLED'))
+            runner = ScriptRunner(specialised, 'script v8.26')
+            records = replay(runner, [dict(base, **record['inputs']) for record in expected])
+            for record, want in zip(records, expected):
+                self.assertIsNone(record['error'])
+                self.assertEqual((record['action'], record['reason'], record['priority']),
+                                 (want['action'], want['reason'], want['priority']))
+
+    def test_wraps_long_lines(self):
+        source = ('CONFIG = {%s}\n'
+                  'if a_long_condition_name > 10 and another_long_condition_name < 20 and third_name:\n'
+                  '    reason = "a long format string %%.1f and %%.1f" %% (a_long_condition_name, another_long_condition_name)\n'
+                  '    action = decisions.reason("export", reason, priority=90, sell=a_long_condition_name)\n'
+                  % ', '.join('"KEY_%d": %d' % (index, index) for index in range(10)))
+        wrapped = wrap_lines(source)
+        self.assertEqual(ast.dump(ast.parse(wrapped)), ast.dump(ast.parse(source)))
+        self.assertTrue(all(len(line) <= 79 for line in wrapped.splitlines()), wrapped)
+        self.assertIn("\n    \"KEY_0\": 0,\n    \"KEY_1\": 1,\n", wrapped)
+        self.assertIn('\n        and third_name\n):\n', wrapped)
+        self.assertEqual(wrap_lines(source, 200), source)
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as root:
+            overrides = os.path.join(root, 'site.json')
+            output = os.path.join(root, 'specialised')
+            with open(overrides, 'w', encoding='UTF-8') as file:
+                json.dump({'PLANNER_ENABLED': True}, file)
+            with contextlib.redirect_stdout(io.StringIO()) as out, \
+                    contextlib.redirect_stderr(io.StringIO()) as errors:
+                self.assertEqual(main(['script v8.26', '--overrides', overrides, '--output', output,
+                                       '--payload', PAYLOAD, '--repeat', '2']), 0)
+            self.assertEqual(out.getvalue(), '')
+            report = errors.getvalue()
+            self.assertRegex(report, r'script v8\.26: \d+ -> \d+ bytes, \d+ expressions folded, \d+ branches pruned')
+            self.assertIn('script v8.26: original compile', report)
+            self.assertIn('script v8.26: specialised compile', report)
+            self.assertNotIn('decisions differ', report)
+            with open(output, 'r', encoding='UTF-8') as file:
+                code = file.read()
+            self.assertTrue(code.startswith('# Generated by specialise.py from script v8.26'))
+            self.assertIn("'PLANNER_ENABLED': True", code)
+            with open(overrides, 'w', encoding='UTF-8') as file:
+                json.dump({'NOT_A_KEY': 1}, file)
+            with contextlib.redirect_stdout(io.StringIO()) as out, \
+                    contextlib.redirect_stderr(io.StringIO()) as errors:
+                self.assertEqual(main(['script v8.26', '--overrides', overrides, '--output', output]), 1)
+            self.assertEqual(out.getvalue(), '')
+            self.assertIn('NOT_A_KEY is not a top-level constant or CONFIG key', errors.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
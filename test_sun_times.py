@@ -0,0 +1,49 @@
+import unittest
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+from astral import LocationInfo
+from astral.sun import sun
+
+from backtest import BatchFeatures
+from sun_times import SunTable, add_sun_times, sun_times
+from test_backtest import synthetic_meter_data
+
+BRISBANE = LocationInfo('Brisbane', 'Australia', 'Australia/Brisbane', -27.4698, 153.0251)
+
+
+class TestSunTimes(unittest.TestCase):
+
+    def test_matches_astral(self):
+        day = date(2024, 11, 7)
+        expected = sun(BRISBANE.observer, day, tzinfo=ZoneInfo(BRISBANE.timezone))
+        times = sun_times(BRISBANE.latitude, BRISBANE.longitude, day, BRISBANE.timezone)
+        self.assertEqual(times['sunrise'], expected['sunrise'])
+        self.assertEqual(times['sunset'], expected['sunset'])
+        self.assertAlmostEqual(times['sunrise_hour'], 4.9, delta=0.2)
+        self.assertIs(sun_times(BRISBANE.latitude, BRISBANE.longitude, day, BRISBANE.timezone), times)
+
+    def test_table(self):
+        table = SunTable(BRISBANE.latitude, BRISBANE.longitude, BRISBANE.timezone, '2024-11-01', '2024-11-30')
+        self.assertEqual(len(table.days), 30)
+        self.assertIs(table.lookup(datetime(2024, 11, 7, 13, 0)), table.lookup(date(2024, 11, 7)))
+        self.assertEqual(table.lookup(date(2024, 12, 1))['sunrise'].date(), date(2024, 12, 1))
+        self.assertEqual(len(table.days), 31)
+
+    def test_add_sun_times(self):
+        df = synthetic_meter_data(days=2)
+        out = add_sun_times(df, BRISBANE.latitude, BRISBANE.longitude)
+        self.assertEqual(len(out), len(df))
+        for stamp in (out.index[0], out.index[-1]):
+            row = out.loc[stamp]
+            times = sun_times(BRISBANE.latitude, BRISBANE.longitude, stamp.date(), out.index.tz)
+            self.assertEqual(row['sunrise'], times['sunrise'])
+            self.assertEqual(row['sunset'], times['sunset'])
+        features = BatchFeatures(out, battery_capacity=10000)
+        self.assertTrue((features.sunrise_hour == out['sunrise_hour'].to_numpy()).all())
+        with self.assertRaises(ValueError):
+            add_sun_times(df.tz_localize(None), BRISBANE.latitude, BRISBANE.longitude)
+
+
+if __name__ == '__main__':
+    unittest.main()
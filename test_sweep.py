@@ -0,0 +1,84 @@
+import unittest
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from script_runner import ScriptRunner
+from sweep import apply_overrides, constant_nodes, grid, random_space, run_sweep
+
+
+def price_simulate(meter_data_df, decide, battery_kwh=10.0):
+    """Tiny simulator: import costs the buy price, export earns the sell price."""
+    bill = 0.0
+    for interval_time, row in meter_data_df.iterrows():
+        action = decide(interval_time, buy_price=row['buy_price'], sell_price=row['sell_price'])[0]
+        if action == 'import':
+            bill += row['buy_price']
+        elif action == 'export':
+            bill -= row['sell_price']
+    ret_df = pd.DataFrame({'solar_power': [1.0], 'Power to grid': [0.25]})
+    return bill * battery_kwh, ret_df
+
+
+SCRIPT = """THRESHOLD = 10  # buy below this
+CONFIG = {
+    "SELL_ABOVE": 30.0,
+    "NAMES": [1, 2],
+}
+action = 'auto'
+if buy_price < THRESHOLD:
+    action = 'import'
+elif sell_price > CONFIG["SELL_ABOVE"]:
+    action = 'export'
+"""
+
+
+class TestSweep(unittest.TestCase):
+
+    def test_constant_nodes(self):
+        self.assertEqual(set(constant_nodes(SCRIPT)), {'THRESHOLD', 'SELL_ABOVE'})
+        with open('nsw_script.py', 'r', encoding='UTF-8') as file:
+            names = constant_nodes(file.read())
+        self.assertIn('BUY_DELTA_THRESHOLD', names)
+        self.assertIn('ALWAYS_IMPORT_SOC', names)
+
+    def test_apply_overrides_keeps_layout(self):
+        source = apply_overrides(SCRIPT, {'THRESHOLD': 12.5, 'SELL_ABOVE': 40})
+        self.assertIn('THRESHOLD = 12.5  # buy below this\n', source)
+        self.assertIn('"SELL_ABOVE": 40,\n', source)
+        runner = ScriptRunner(source)
+        self.assertEqual(runner.decide(datetime(2024, 1, 1), buy_price=11, sell_price=35)[0], 'import')
+        with self.assertRaises(KeyError):
+            apply_overrides(SCRIPT, {'NAMES': 3})
+
+    def test_spaces(self):
+        self.assertEqual(len(list(grid({'a': [1, 2], 'b': range(3)}))), 6)
+        samples = list(random_space({'a': (1, 5), 'b': (0.0, 1.0), 'c': ['x', 'y']}, 20, seed=1))
+        self.assertEqual(len(samples), 20)
+        self.assertTrue(all(1 <= s['a'] <= 5 and isinstance(s['a'], int) for s in samples))
+        self.assertEqual(samples, list(random_space({'a': (1, 5), 'b': (0.0, 1.0), 'c': ['x', 'y']}, 20, seed=1)))
+
+    def test_run_sweep_ranks_by_bill(self):
+        start = datetime(2024, 1, 1)
+        df = pd.DataFrame({
+            'buy_price': [5.0, 15.0, 25.0, 8.0],
+            'sell_price': [20.0, 35.0, 45.0, 10.0],
+        }, index=[start + timedelta(minutes=5 * i) for i in range(4)])
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'script.py')
+            with open(filename, 'w', encoding='UTF-8') as file:
+                file.write(SCRIPT)
+            output = os.path.join(tmp, 'results.csv')
+            results = run_sweep(filename, df, grid({'THRESHOLD': [0, 10, 20], 'SELL_ABOVE': [30.0, 50.0]}),
+                                simulate=price_simulate, max_workers=2, output=output)
+            self.assertTrue(os.path.exists(output))
+        self.assertEqual(len(results), 6)
+        self.assertEqual(list(results['bill']), sorted(results['bill']))
+        self.assertEqual(results.iloc[0].to_dict(), {'THRESHOLD': 0, 'SELL_ABOVE': 30.0,
+                                                     'bill': -800.0, 'self_consumption': 0.75})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# The decision ladder of script.py (Codes C, D and E) as a rule table for
+# rule_compiler.py.  Derived inputs are plain names here: max_sell_forecast
+# and min_buy_forecast are the max/min of the discounted forecasts,
+# in_peak is peak_time <= current_hour < peak_time_end, before_sunrise is
+# local_time < sunrise and buy_sell_opportunity_exists comes from
+# best_spread().
+RULES = {
+    'charge_for_peak': {
+        'priority': 90,
+        'when': ['battery_soc < full_battery', 'start_charging_time <= current_hour < peak_time'],
+        'action': 'import',
+        'reason': 'IMPORT to reach full battery by 4 PM or Opportunistic Buy',
+        'set': {'solar': 'export'},
+    },
+    'opportunistic_buy': {
+        'priority': 90,
+        'when': ['battery_soc < full_battery', 'buy_price <= max_day_opportunistic_buy_price'],
+        'action': 'import',
+        'reason': 'IMPORT to reach full battery by 4 PM or Opportunistic Buy',
+        'set': {'solar': 'export'},
+    },
+    'always_sell': {
+        'priority': 80,
+        'when': ['sell_price >= always_sell_price', 'battery_soc > min_sell_soc'],
+        'action': 'export',
+        'reason': 'Sell price exceeds the always sell price',
+        'set': {'solar': 'export'},
+    },
+    'negative_fit_import': {
+        'priority': 70,
+        'when': ['buy_price <= 0.0', 'battery_soc < full_battery'],
+        'action': 'import',
+        'reason': 'Negative FiT: If buy price is <= 0, IMPORT electricity and CURTAIL solar',
+        'set': {'solar': 'curtail'},
+    },
+    'negative_fit_auto': {
+        'priority': 60,
+        'when': ['sell_price < 0.0', 'buy_price < -sell_price', 'battery_soc > full_battery'],
+        'action': 'auto',
+        'reason': 'Negative FiT: If EXPORT is more expensive than buy, action CHARGE and CURTAIL solar',
+        'set': {'solar': 'curtail'},
+    },
+    'negative_sell': {
+        'priority': 55,
+        'when': ['sell_price < 0.0', 'battery_soc > full_battery'],
+        'action': 'auto',
+        'reason': 'Negative FiT: If sell price < 0, action CHARGE and CURTAIL solar',
+        'set': {'solar': 'curtail'},
+    },
+    'daytime_high_soc': {
+        'priority': 50,
+        'when': ['daytime', 'sell_price >= min_day_sell_price', 'battery_soc >= required_min_soc'],
+        'action': 'export',
+        'reason': 'PV > 0 and high SoC: EXPORT excess',
+        'set': {'solar': 'export'},
+    },
+    'daytime_low_soc': {
+        'priority': 45,
+        'when': ['daytime'],
+        'action': 'auto',
+        'reason': 'PV > 0 and low SoC or low Sell Price',
+        'set': {'solar': 'export'},
+    },
+    'sell_now': {
+        'priority': 40,
+        'when': ['buy_price < max_buy_price', 'battery_soc > required_min_soc',
+                 'sell_price >= max_sell_forecast', 'sell_price >= min_sell_price'],
+        'action': 'export',
+        'reason': 'Fcst: Max sell price now; EXPORT if SOC > required',
+        'set': {'solar': 'export'},
+    },
+    'could_sell': {
+        'priority': 35,
+        'when': ['sell_price >= max_sell_forecast', 'sell_price >= min_sell_price'],
+        'action': 'auto',
+        'reason': 'Fcst: Max sell price now; SoC < required',
+        'set': {'solar': 'export'},
+    },
+    'buy_now': {
+        'priority': 30,
+        'when': ['not daytime', 'buy_price == min_buy_forecast', 'battery_soc < required_min_soc',
+                 'buy_price <= max_buy_price', 'not in_peak'],
+        'action': 'import',
+        'reason': 'Fcst: Low buy price now; IMPORT if SOC < required and price <= max',
+        'set': {'solar': 'export'},
+    },
+    'buy_low_sell_high': {
+        'priority': 20,
+        'when': ['buy_sell_opportunity_exists and not in_peak'],
+        'action': 'import',
+        'reason': 'Fcst: Buy low, sell high opportunity exists',
+        'set': {'solar': 'export'},
+    },
+    'buy_low_battery': {
+        'priority': 10,
+        'when': ['battery_soc < min_sell_soc', 'before_sunrise', 'buy_price < max_am_buy_price'],
+        'action': 'import',
+        'reason': 'Fcst: Buy Low Battery',
+        'set': {'solar': 'export'},
+    },
+    'night_default': {
+        'priority': 0,
+        'when': [],
+        'action': 'auto',
+        'reason': 'Night Default: No other rule applies',
+        'set': {'solar': 'export'},
+    },
+}